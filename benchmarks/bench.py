@@ -0,0 +1,489 @@
+"""
+Offline benchmark suite — no network and no API key needed.
+
+Gemini and the HTTP layer are replaced by the deterministic fakes in fakes.py and every
+database lives in a temp directory. Database, tool and headless-agent benchmarks call
+library_core directly; startup, page and Chat-turn benchmarks run library.py under AppTest.
+
+    python benchmarks/bench.py                                  # default scales
+    python benchmarks/bench.py --scales 1000 1000000            # db ops up to 1M books
+    python benchmarks/bench.py --json bench.json                # save results
+    python benchmarks/bench.py --baseline bench.json            # exit 1 on >25% regressions
+
+Startup results are also checked against COLD_START_BUDGET_MS / RERUN_BUDGET_MS in library.py.
+"""
+
+import argparse
+import ast
+import datetime
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPO = os.path.dirname(HERE)
+APP = os.path.join(REPO, "library.py")
+sys.path[:0] = [REPO, HERE]
+
+GENRES = ["Fiction", "Classics", "Science Fiction", "Mystery", "History", "Poetry", "Philosophy", ""]
+AUTHORS = ["Jane Austen", "Charles Dickens", "Fyodor Dostoevsky", "Leo Tolstoy", "Mary Shelley",
+           "Herman Melville", "Virginia Woolf", "George Eliot", "Ursula K. Le Guin", "Isaac Asimov"]
+STATUSES = ["unread", "reading", "finished"]
+
+
+def book_rows(start, stop):
+    """Deterministic synthetic books with ids in [start, stop)."""
+    rng = random.Random(start)
+    for i in range(start, stop):
+        status = rng.choice(STATUSES)
+        day = f"20{rng.randint(15, 25)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+        yield (f"Book {i} {rng.choice(['of', 'and', 'in'])} {rng.choice(['Shadows', 'Light', 'Time', 'Sea'])}",
+               rng.choice(AUTHORS), rng.choice(GENRES), "", rng.randint(1800, 2024),
+               f"978{i:010d}", "", f"/works/OL{i}W", i if i % 7 == 0 else None, day, status,
+               rng.randint(0, 5), rng.randint(0, 300), 300,
+               day if status != "unread" else None, day if status == "finished" else None)
+
+
+def seed_books(conn, n):
+    have = conn.execute("SELECT COUNT(*) FROM books").fetchone()[0]
+    if have < n:
+        conn.executemany("""
+            INSERT INTO books (title, author, genre, notes, year, isbn, cover_url, open_library_key,
+            gutenberg_id, added_at, status, rating, current_page, total_pages, started_at, finished_at)
+            VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+        """, book_rows(have, n))
+        conn.commit()
+
+
+def app_constant(name):
+    """Read a module-level constant's default from library.py without executing the app."""
+    with open(APP, encoding="utf-8") as f:
+        for node in ast.parse(f.read()).body:
+            if isinstance(node, ast.Assign) and getattr(node.targets[0], "id", None) == name:
+                value = node.value
+                if isinstance(value, ast.Call):  # float(os.environ.get(ENV, default))
+                    value = value.args[0].args[-1]
+                return ast.literal_eval(value)
+    raise KeyError(name)
+
+
+def summarize(samples_ms):
+    return {"median_ms": round(statistics.median(samples_ms), 3),
+            "p95_ms": round(sorted(samples_ms)[max(0, int(len(samples_ms) * 0.95) - 1)], 3),
+            "ops_per_s": round(1000 / max(statistics.median(samples_ms), 1e-6), 1)}
+
+
+# ─── Core benchmarks (library_core directly, no Streamlit) ───────────────────
+def fresh_core():
+    """Forget the imported core so the next import starts with empty process-wide caches."""
+    for name in [m for m in sys.modules if m == "library_core" or m.startswith("library_core.")]:
+        del sys.modules[name]
+
+
+def bench_db(n, repeat):
+    from library_core import TOOL_MAP, db
+
+    conn = db.get_db()
+    seed_books(conn, n)
+    conn.close()
+    rng = random.Random(n)
+    out = {}
+
+    def measure(name, fn):
+        samples = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            fn()
+            samples.append((time.perf_counter() - t0) * 1000)
+        out[f"{name}@{n}"] = summarize(samples)
+
+    added = []
+    measure("db_load_library", db.db_load_library)
+    measure("db_get_book", lambda: db.db_get_book(rng.randint(1, n)))
+    measure("check_library_changes", db.check_library_changes)  # per-rerun cost when nothing changed
+    measure("db_add_book", lambda: added.append(db.db_add_book("Bench Book", "Bench Author", "Fiction")))
+    measure("db_update_progress", lambda: db.db_update_progress(rng.randint(1, n), current_page=42))
+    # A reader auto-saving 50 page turns: one write each vs. coalesced into one flush.
+    measure("progress_x50:direct", lambda: [db.db_update_progress(1, current_page=p) for p in range(50)])
+    measure("progress_x50:buffered", lambda: ([db.db_record_progress(1, current_page=p) for p in range(50)],
+                                              db.flush_progress()))
+    measure("db_remove_book", lambda: db.db_remove_book(added.pop()))
+    for name in ("list_personal_library", "get_recommendations", "update_reading_progress"):
+        args = {"list_personal_library": {"search_query": "dickens"},
+                "get_recommendations": {"mood": "cozy"},
+                "update_reading_progress": {"book_id": 1, "current_page": 7}}[name]
+        measure(f"tool:{name}", lambda name=name, args=args: TOOL_MAP[name](**args))
+    measure("tool:add_to_personal_library", lambda: added.append(
+        TOOL_MAP["add_to_personal_library"]("Bench Book", "Bench Author")["book_id"]))
+    for book_id in added:
+        db.db_remove_book(book_id)
+    return out
+
+
+def transpose(text, rng):
+    i = rng.randrange(1, max(2, len(text) - 2))
+    return text[:i] + text[i + 1:i + 2] + text[i] + text[i + 2:]
+
+
+def fuzzy_books(n, dups, seed=1):
+    """`n` books with Zipf-distributed made-up title words plus `dups` copies with two letters
+    swapped in the title; returns (books, [(original id, copy id)])."""
+    rng = random.Random(seed)
+    letters, weights = "etaoinshrdlcumwfgypbvkjxqz", [13, 9, 8, 8, 7, 7, 6, 6, 6, 4, 4, 3, 3, 2, 2, 2, 2, 2,
+                                                     2, 2, 1, 1, 0.2, 0.2, 0.1, 0.1]
+    word = lambda: "".join(rng.choices(letters, weights, k=rng.randint(3, 10)))  # noqa: E731
+    vocab = [word() for _ in range(20_000)]
+    zipf = [1 / (i + 50) for i in range(len(vocab))]
+    first, last = [word().capitalize() for _ in range(500)], [word().capitalize() for _ in range(20_000)]
+    books = [{"id": i, "title": " ".join(rng.choices(vocab, zipf, k=rng.randint(1, 5))).title(),
+              "author": f"{rng.choice(first)} {rng.choice(last)}"} for i in range(n)]
+    pairs = []
+    for j in range(dups):
+        b = books[rng.randrange(n)]
+        books.append({**b, "id": n + j, "title": transpose(b["title"], rng)})
+        pairs.append((b["id"], n + j))
+    return books, pairs
+
+
+def bench_fuzzy(n, repeat):
+    """Trigram index over `n` books: build, one-book sync, typo'd title/author searches and the
+    duplicate report. Also returns how many of the typo'd books each one finds."""
+    from library_core.fuzzy import TrigramIndex
+    books, pairs = fuzzy_books(n, max(10, n // 500))
+    rng = random.Random(n)
+    queries = [(transpose(b[rng.choice(["title", "author"])], rng), b["id"]) for b in rng.sample(books, 50)]
+    index, added, found, report = TrigramIndex(), [], [], []
+    out = {}
+
+    def measure(name, fn, times):
+        samples = []
+        for i in range(times):
+            t0 = time.perf_counter()
+            fn(i)
+            samples.append((time.perf_counter() - t0) * 1000)
+        out[f"fuzzy:{name}@{n}"] = summarize(samples)
+
+    def add_one(i):
+        added.append({"id": -1 - i, "title": f"Bench Book {i}", "author": "Bench Author"})
+        index.sync(books + added)
+
+    def search(i):
+        query, book_id = queries[i % len(queries)]
+        found.append(book_id in {b for _, b in index.search(query, limit=10)})
+
+    measure("build", lambda i: TrigramIndex().sync(books), max(1, repeat // 10))
+    index.sync(books)
+    measure("sync_one_added", add_one, repeat)
+    measure("search", search, len(queries))
+    measure("duplicates", lambda i: report.append(index.duplicates()), max(1, repeat // 10))
+    reported = {frozenset(d["book_ids"]) for d in report[-1]}
+    return out, {"search": sum(found) / len(found),
+                 "duplicates": sum(frozenset(p) in reported for p in pairs) / len(pairs)}
+
+
+def bench_autocomplete(n, repeat):
+    """Prefix index over the titles and authors of `n` books: build, one-book add, and 1–8
+    character prefixes of random titles and authors."""
+    from library_core.autocomplete import PrefixIndex
+    books, _ = fuzzy_books(n, 0)
+    rng = random.Random(n)
+    prefixes = [rng.choice(books)[rng.choice(["title", "author"])][:rng.randint(1, 8)].lower() for _ in range(200)]
+    items = [item for b in books for item in ((b["title"], "title", None, 0), (b["author"], "author", None, 0))]
+    index = PrefixIndex()
+    out = {}
+
+    def measure(name, fn, times):
+        samples = []
+        for i in range(times):
+            t0 = time.perf_counter()
+            fn(i)
+            samples.append((time.perf_counter() - t0) * 1000)
+        out[f"autocomplete:{name}@{n}"] = summarize(samples)
+
+    measure("build", lambda i: PrefixIndex().add_many(items), max(1, repeat // 10))
+    index.add_many(items)
+    measure("add_one", lambda i: index.add(f"Bench Book {i}", "title"), repeat)
+    measure("complete", lambda i: index.complete(prefixes[i % len(prefixes)]), len(prefixes))
+    return out
+
+
+def bench_analytics(years, repeat, tmp):
+    """Stats-page analytics over `years` of daily reading history (~5 books on the go)."""
+    os.environ["LIBRARY_DB"] = os.path.join(tmp, f"analytics_{years}y.db")
+    from library_core import analytics, db
+
+    conn = db.get_db()
+    seed_books(conn, 1000)
+    rng = random.Random(years)
+    end = datetime.date.today()
+    rows = [((end - datetime.timedelta(days=d)).isoformat(), rng.randint(1, 1000), rng.randint(5, 60))
+            for d in range(years * 365) if rng.random() < 0.8 for _ in range(5)]
+    conn.executemany("INSERT OR IGNORE INTO reading_daily (day, book_id, pages) VALUES (?,?,?)", rows)
+    conn.commit()
+    conn.close()
+
+    out = {}
+    for name, fn in (("pages_per_day", analytics.pages_per_day), ("reading_streaks", analytics.reading_streaks),
+                     ("book_velocity", analytics.book_velocity),
+                     ("reading_rollup:month", lambda: analytics.reading_rollup("month")),
+                     ("reading_analytics:uncached", lambda: analytics._analytics_snapshot.__wrapped__(
+                         db.db_path(), 0, datetime.date.today().isoformat())),
+                     ("reading_analytics:cached", analytics.reading_analytics)):
+        samples = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            fn()
+            samples.append((time.perf_counter() - t0) * 1000)
+        out[f"{name}@{years}y"] = summarize(samples)
+    return out
+
+
+def bench_tools(repeat):
+    from library_core import TOOL_MAP
+
+    calls = {
+        "search_open_library": {"query": "pride and prejudice"},
+        "get_book_details": {"open_library_key": "/works/OL66554W"},
+        "search_gutenberg": {"query": "austen"},
+        "search_books": {"query": "pride and prejudice"},
+        "fetch_gutenberg_content": {"gutenberg_id": 1342, "offset": 4000},
+        "search_book_passages": {"gutenberg_id": 1342, "question": "Did Darcy marry Elizabeth?"},
+    }
+    out = {}
+    for name, args in calls.items():
+        samples = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            result = TOOL_MAP[name](**args)
+            samples.append((time.perf_counter() - t0) * 1000)
+            assert result.get("success"), (name, result)
+        out[f"tool:{name}"] = summarize(samples)
+    return out
+
+
+def bench_headless_agent(turns):
+    """One agent turn through library_core alone — the cost of a CLI/HTTP API chat request."""
+    from library_core import ChatSession, run_agent
+    session = ChatSession()
+    prompts = ["Find free classics by Austen", "Show my library", "Recommend me a book",
+               "Tell me about Pride and Prejudice"]
+    samples = []
+    for i in range(turns):
+        t0 = time.perf_counter()
+        events = list(run_agent(prompts[i % len(prompts)], session, "fake-key-for-offline-benchmarks"))
+        samples.append((time.perf_counter() - t0) * 1000)
+        errors = [content for etype, content in events if etype == "error"]
+        if errors:
+            raise RuntimeError(errors[0])
+    return {"agent:headless_turn": summarize(samples)}
+
+
+def bench_detail_prefetch(turns, http, http_latency_ms=80.0, gemini_latency_ms=150.0):
+    """"Show details" turns (a search, then get_book_details on its top hit) with speculative
+    detail prefetch off and on, under simulated network and model latency."""
+    from fakes import FakeGenaiClient
+    from library_core import ChatSession, clear_shared_caches, get_metrics, run_agent
+    saved = http.latency_ms, FakeGenaiClient.latency_ms
+    http.latency_ms, FakeGenaiClient.latency_ms = http_latency_ms, gemini_latency_ms
+    out, served = {}, 0
+    try:
+        for top_k in (0, 3):
+            samples = []
+            for i in range(turns):
+                clear_shared_caches()  # every turn fetches its details over the "network"
+                t0 = time.perf_counter()
+                events = list(run_agent(f"Show details for book {i}", ChatSession(),
+                                        "fake-key-for-offline-benchmarks", prefetch_details=top_k))
+                samples.append((time.perf_counter() - t0) * 1000)
+                assert any("get_book_details" in c for e, c in events if e == "tool_call"), events
+            out[f"agent:details_turn_prefetch_{top_k}"] = summarize(samples)
+        served = dict((c["cache"], c["hits"]) for c in get_metrics().cache_snapshot()).get("speculative_prefetch", 0)
+    finally:
+        http.latency_ms, FakeGenaiClient.latency_ms = saved
+    return out, served
+
+
+# ─── Full-app benchmarks ─────────────────────────────────────────────────────
+def timed_run(at):
+    """Run the app once; prefer the script's own timing (which includes runs st.rerun() cut short)
+    over AppTest's polling-inflated wall time."""
+    at.session_state["last_rerun_ms"] = None
+    t0 = time.perf_counter()
+    at.run()
+    wall = (time.perf_counter() - t0) * 1000
+    if at.exception:
+        raise RuntimeError(at.exception[0].value)
+    return at.session_state["last_rerun_ms"] or wall
+
+
+def bench_startup(repeat, tmp):
+    """Cold start = first script run with empty process caches; rerun = Chat page rerun."""
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+    os.environ["LIBRARY_DB"] = os.path.join(tmp, "startup.db")
+    cold, warm = [], []
+    for _ in range(3):
+        st.cache_resource.clear()
+        st.cache_data.clear()
+        fresh_core()
+        at = AppTest.from_file(APP, default_timeout=120)
+        cold.append(timed_run(at))
+    for _ in range(repeat):
+        warm.append(timed_run(at))
+    return {"startup:cold_start": summarize(cold), "startup:rerun_chat": summarize(warm)}
+
+
+def check_budgets(results):
+    budgets = {"startup:cold_start": app_constant("COLD_START_BUDGET_MS"),
+               "startup:rerun_chat": app_constant("RERUN_BUDGET_MS")}
+    return [f"{name}: {results[name]['median_ms']} ms > {budget} ms budget"
+            for name, budget in budgets.items()
+            if name in results and results[name]["median_ms"] > budget]
+
+
+def bench_agent(turns):
+    """Wall time per Chat turn (two script runs plus AppTest's polling overhead)."""
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(APP, default_timeout=120).run()
+    at.session_state["anthropic_api_key"] = "fake-key-for-offline-benchmarks"
+    prompts = ["Find free classics by Austen", "Show my library", "Recommend me a book",
+               "Tell me about Pride and Prejudice"]
+    samples = []
+    for i in range(turns):
+        at.text_input(key="chat_input").input(prompts[i % len(prompts)])
+        send = next(b for b in at.button if b.label == "Send →")
+        t0 = time.perf_counter()
+        send.click().run()
+        samples.append((time.perf_counter() - t0) * 1000)
+        if at.exception:
+            raise RuntimeError(at.exception[0].value)
+    return {"agent:turn": summarize(samples)}
+
+
+def bench_prompt_payload(turns, tmp):
+    """Average characters sent per model request, with and without Gemini context caching."""
+    from fakes import FakeGenaiClient
+    out = {}
+    db = os.environ["LIBRARY_DB"]
+    for label, supported in (("uncached", False), ("cached", True)):
+        # An empty library, so large tool results do not drown out the prompt prefix.
+        os.environ["LIBRARY_DB"] = os.path.join(tmp, f"payload_{label}.db")
+        fresh_core()
+        FakeGenaiClient.supports_caching = supported
+        FakeGenaiClient.request_chars.clear()
+        bench_headless_agent(turns)
+        out[label] = sum(FakeGenaiClient.request_chars) / max(1, len(FakeGenaiClient.request_chars))
+    FakeGenaiClient.supports_caching = True
+    os.environ["LIBRARY_DB"] = db
+    return out
+
+
+def bench_pages(sizes, repeat, tmp):
+    from streamlit.testing.v1 import AppTest
+    out = {}
+    for n in sizes:
+        os.environ["LIBRARY_DB"] = os.path.join(tmp, f"pages_{n}.db")
+        at = AppTest.from_file(APP, default_timeout=600)
+        out[f"page:cold_start@{n}"] = summarize([timed_run(at)])
+        conn = sqlite3.connect(os.environ["LIBRARY_DB"])
+        seed_books(conn, n)
+        conn.close()
+        for page in ("📖 My Library", "📊 Stats"):
+            at.sidebar.radio[0].set_value(page).run()
+            samples = [timed_run(at) for _ in range(repeat)]
+            out[f"page:{page.split(' ', 1)[1]}@{n}"] = summarize(samples)
+    return out
+
+
+def compare(results, baseline_path, threshold):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    regressions = []
+    for name, cur in results.items():
+        old = baseline.get(name)
+        if old and cur["median_ms"] > old["median_ms"] * threshold and cur["median_ms"] - old["median_ms"] > 1:
+            regressions.append(f"{name}: {old['median_ms']} ms → {cur['median_ms']} ms")
+    return regressions
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--scales", type=int, nargs="+", default=[1_000, 10_000, 100_000],
+                    help="library sizes for db_* and library tool benchmarks")
+    ap.add_argument("--page-sizes", type=int, nargs="+", default=[50, 200],
+                    help="library sizes for My Library / Stats render benchmarks")
+    ap.add_argument("--history-years", type=int, default=5, help="reading history for analytics benchmarks")
+    ap.add_argument("--repeat", type=int, default=20)
+    ap.add_argument("--turns", type=int, default=8, help="agent turns to run through the Chat page")
+    ap.add_argument("--http-latency-ms", type=float, default=0.0, help="simulated network latency per request")
+    ap.add_argument("--gemini-latency-ms", type=float, default=0.0, help="simulated model latency per call")
+    ap.add_argument("--only", choices=["startup", "db", "tools", "agent", "pages"], nargs="+")
+    ap.add_argument("--json", help="write results to this file")
+    ap.add_argument("--baseline", help="compare against a previous --json result")
+    ap.add_argument("--threshold", type=float, default=1.25, help="regression ratio for --baseline")
+    args = ap.parse_args(argv)
+
+    tmp = tempfile.mkdtemp(prefix="library-bench-")
+    os.environ["LIBRARY_DB"] = os.path.join(tmp, "library.db")
+    os.environ.setdefault("LIBRARY_GEMINI_RPM", "1000000")  # the fake model has no quota to respect
+    os.environ.setdefault("LIBRARY_JOB_WORKERS", "0")  # timings cover the app, not a worker pool
+    from fakes import install_fakes
+    http = install_fakes(args.http_latency_ms, args.gemini_latency_ms)
+
+    only = set(args.only or ["startup", "db", "tools", "agent", "pages"])
+    results, fuzzy_recall = {}, {}
+    if "startup" in only:
+        results.update(bench_startup(args.repeat, tmp))
+        os.environ["LIBRARY_DB"] = os.path.join(tmp, "library.db")
+    if "db" in only:
+        for n in sorted(args.scales):
+            results.update(bench_db(n, args.repeat))
+            fuzzy_results, fuzzy_recall[n] = bench_fuzzy(n, args.repeat)
+            results.update(fuzzy_results)
+            results.update(bench_autocomplete(n, args.repeat))
+        results.update(bench_analytics(args.history_years, args.repeat, tmp))
+        os.environ["LIBRARY_DB"] = os.path.join(tmp, "library.db")
+    if "tools" in only:
+        results.update(bench_tools(args.repeat))
+    payload = prefetch_served = None
+    if "agent" in only:
+        results.update(bench_agent(args.turns))
+        results.update(bench_headless_agent(args.turns))
+        payload = bench_prompt_payload(min(args.turns, 4), tmp)
+        detail_results, prefetch_served = bench_detail_prefetch(args.turns, http)
+        results.update(detail_results)
+    if "pages" in only:
+        results.update(bench_pages(args.page_sizes, max(3, args.repeat // 4), tmp))
+
+    width = max(map(len, results))
+    print(f"{'benchmark':<{width}}  {'median ms':>10}  {'p95 ms':>10}  {'ops/s':>10}")
+    for name, r in results.items():
+        print(f"{name:<{width}}  {r['median_ms']:>10.3f}  {r['p95_ms']:>10.3f}  {r['ops_per_s']:>10.1f}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=1)
+    failures = [f"OVER BUDGET {line}" for line in check_budgets(results)]
+    if payload:
+        print(f"model request payload: {payload['cached']:.0f} chars cached vs "
+              f"{payload['uncached']:.0f} uncached ({1 - payload['cached'] / payload['uncached']:.0%} smaller)")
+        if payload["cached"] >= payload["uncached"]:
+            failures.append("PAYLOAD context caching did not shrink model requests")
+    for n, recall in fuzzy_recall.items():
+        print(f"fuzzy recall of typo'd books @{n}: search {recall['search']:.0%}, "
+              f"duplicate report {recall['duplicates']:.0%}")
+    if prefetch_served is not None:
+        print(f"speculative detail prefetch: {prefetch_served} of {args.turns} follow-up lookups served")
+    if args.baseline:
+        failures += [f"REGRESSION {line}" for line in compare(results, args.baseline, args.threshold)]
+    for line in failures:
+        print(line)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+"""
+Deterministic stand-ins for the network: Open Library / Gutendex / gutenberg.org over HTTP,
+and the google-genai client. Install with `install_fakes()` before the app (or library) runs.
+"""
+
+import json
+import os
+import random
+import re
+import time
+from types import SimpleNamespace
+from urllib.parse import urlparse
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+_WORDS = ("the of and to a in that was her his it with as had for not be she he by on which you at "
+          "but have from all were my they this so been their no would or an said one when what there "
+          "elizabeth darcy bennet bingley jane sister mother letter ball estate marriage fortune pride "
+          "prejudice regiment netherfield pemberley wickham lydia collins charlotte lady catherine").split()
+
+
+def _load(name):
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def synthetic_text(gutenberg_id, paragraphs=4000):
+    """A reproducible ~1 MB plain-text "book" with Project Gutenberg header/footer markers."""
+    rng = random.Random(gutenberg_id)
+    body = "\n\n".join(" ".join(rng.choice(_WORDS) for _ in range(rng.randint(20, 60))).capitalize() + "."
+                       for _ in range(paragraphs))
+    return (f"The Project Gutenberg eBook #{gutenberg_id}\n\n"
+            f"*** START OF THE PROJECT GUTENBERG EBOOK {gutenberg_id} ***\n\n{body}\n\n"
+            f"*** END OF THE PROJECT GUTENBERG EBOOK {gutenberg_id} ***\n")
+
+
+class FakeResponse:
+    def __init__(self, url, status_code=200, content=b"", payload=None):
+        self.url = url
+        self.status_code = status_code
+        self._payload = payload
+        self.content = content if payload is None else json.dumps(payload).encode()
+        self.headers = {"Content-Type": "application/json" if payload is not None else "text/plain"}
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return self._payload if self._payload is not None else json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            import requests
+            raise requests.HTTPError(f"{self.status_code} for {self.url}", response=self)
+
+
+class FakeHTTP:
+    """Routes requests.get() calls to recorded fixtures; `latency_ms` models network round trips."""
+
+    def __init__(self, latency_ms=0.0):
+        self.latency_ms = latency_ms
+        self.calls = 0
+        self.ol_search = _load("ol_search.json")
+        self.ol_work = _load("ol_work.json")
+        self.gut_search = _load("gutendex_search.json")
+        self.books = {b["id"]: b for b in self.gut_search["results"]}
+        self.texts = {}
+
+    def _book(self, gid):
+        return self.books.get(gid) or dict(next(iter(self.books.values())), id=gid, formats={
+            "text/plain; charset=us-ascii": f"https://www.gutenberg.org/ebooks/{gid}.txt.utf-8"})
+
+    def get(self, url, params=None, headers=None, timeout=None, **kwargs):
+        self.calls += 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        u = urlparse(url)
+        params = params or {}
+        if u.netloc == "openlibrary.org" and u.path == "/search.json":
+            docs = self.ol_search["docs"]
+            start = int(params.get("offset", 0) or 0)
+            if params.get("page"):
+                start = (int(params["page"]) - 1) * int(params.get("limit", 8))
+            return FakeResponse(url, payload=dict(self.ol_search, start=start,
+                                                  docs=docs[start:start + int(params.get("limit", 8))]))
+        if u.netloc == "openlibrary.org" and u.path.endswith(".json"):
+            return FakeResponse(url, payload=dict(self.ol_work, key=u.path[:-5]))
+        if u.netloc == "gutendex.com":
+            m = re.match(r"^/books/(\d+)/?$", u.path)
+            if m:
+                return FakeResponse(url, payload=self._book(int(m.group(1))))
+            return FakeResponse(url, payload=self.gut_search)
+        m = re.search(r"/(?:ebooks/|pg)(\d+)[^/]*\.txt", u.path)
+        if m:
+            gid = int(m.group(1))
+            if gid not in self.texts:
+                self.texts[gid] = synthetic_text(gid).encode()
+            body = self.texts[gid]
+            rng = re.match(r"bytes=(\d+)-(\d*)", (headers or {}).get("Range", ""))
+            if rng:
+                start, end = int(rng.group(1)), int(rng.group(2) or len(body) - 1)
+                return FakeResponse(url, 206, body[start:end + 1])
+            return FakeResponse(url, content=body)
+        return FakeResponse(url, 404, b"not found")
+
+
+# ─── Gemini ──────────────────────────────────────────────────────────────────
+def _pick_tool(text):
+    t = text.lower()
+    if "library" in t or "reading" in t:
+        return "list_personal_library", {}
+    if "free" in t or "classic" in t or "gutenberg" in t:
+        return "search_gutenberg", {"query": text[:60]}
+    if "recommend" in t or "surprise" in t:
+        return "get_recommendations", {"mood": "adventurous"}
+    return "search_books", {"query": text[:60]}
+
+
+def _detail_followup(contents, fn_parts):
+    """Like the real model, answer "... details ..." prompts by looking up the top search result."""
+    prompt = next((c.parts[0].text for c in reversed(contents)
+                   if c.role == "user" and c.parts and c.parts[0].text), "") or ""
+    if "details" not in prompt.lower():
+        return None
+    for p in fn_parts:
+        if p.function_response.name in ("search_books", "search_open_library"):
+            result = json.loads(p.function_response.response["result"])
+            for book in result.get("works") or result.get("books") or []:
+                if book.get("open_library_key"):
+                    return book["open_library_key"]
+    return None
+
+
+class _FakeModels:
+    def __init__(self, client):
+        self.client = client
+
+    def generate_content(self, model, contents, config=None):
+        from google.genai import types as genai_types
+        c = self.client
+        c.calls += 1
+        c.requests.append({"model": model, "contents": contents, "config": config})
+        cached_chars = 0
+        if config is not None and config.cached_content:
+            # Mirror the API: a cached prefix excludes request-level instructions and tools.
+            if config.system_instruction or config.tools or config.tool_config:
+                raise RuntimeError("400 INVALID_ARGUMENT: CachedContent can not be used with "
+                                   "system_instruction, tools or tool_config")
+            entry = _FakeCaches.store.get(config.cached_content)
+            if entry is None or entry["expires"] < time.time():
+                raise RuntimeError(f"404 NOT_FOUND: CachedContent {config.cached_content} not found")
+            cached_chars = entry["chars"]
+        FakeGenaiClient.request_chars.append(_config_chars(config) + sum(len(str(x)) for x in contents))
+        if c.latency_ms:
+            time.sleep(c.latency_ms / 1000)
+        last = contents[-1]
+        fn_parts = [p for p in last.parts if getattr(p, "function_response", None)]
+        detail_key = _detail_followup(contents, fn_parts)
+        if detail_key:
+            parts = [genai_types.Part(function_call=genai_types.FunctionCall(
+                name="get_book_details", args={"open_library_key": detail_key}))]
+        elif fn_parts:
+            names = ", ".join(p.function_response.name for p in fn_parts)
+            parts = [genai_types.Part(text=f"Here is what I found using {names}. Happy reading!")]
+        else:
+            name, args = _pick_tool(last.parts[0].text or "")
+            parts = [genai_types.Part(function_call=genai_types.FunctionCall(name=name, args=args))]
+        prompt_chars = FakeGenaiClient.request_chars[-1] + cached_chars
+        return SimpleNamespace(
+            candidates=[SimpleNamespace(content=genai_types.Content(role="model", parts=parts))],
+            usage_metadata=SimpleNamespace(prompt_token_count=prompt_chars // 4,
+                                           cached_content_token_count=cached_chars // 4,
+                                           total_token_count=prompt_chars // 4 + 40),
+        )
+
+
+def _config_chars(config):
+    if config is None:
+        return 0
+    return len(str(config.system_instruction or "")) + len(str(config.tools or "")) + len(str(config.tool_config or ""))
+
+
+class _FakeCaches:
+    """client.caches: explicit context caching, shared by every fake client like the real service."""
+    store = {}
+
+    def create(self, model, config=None):
+        if not FakeGenaiClient.supports_caching:
+            raise RuntimeError(f"400 INVALID_ARGUMENT: cached content is not supported for {model}")
+        name = f"cachedContents/fake-{len(self.store) + 1}"
+        ttl = float(str(config.ttl or "3600s").rstrip("s"))
+        self.store[name] = {"model": model, "chars": _config_chars(config), "expires": time.time() + ttl}
+        return SimpleNamespace(name=name, model=model)
+
+
+class FakeGenaiClient:
+    """Scripted genai.Client: one tool call per user turn, then a text answer.
+
+    `request_chars` logs the instruction + tools + contents size of every request sent, across
+    clients; set `supports_caching = False` to model a key or model without context caching.
+    """
+    latency_ms = 0.0
+    supports_caching = True
+    request_chars = []
+
+    def __init__(self, api_key=None, **kwargs):
+        self.api_key = api_key
+        self.calls = 0
+        self.requests = []
+        self.models = _FakeModels(self)
+        self.caches = _FakeCaches()
+
+
+def install_fake_gemini(latency_ms=0.0):
+    """Patch google.genai.Client process-wide (for runs against stub_server.py over real HTTP)."""
+    from google import genai
+    FakeGenaiClient.latency_ms = latency_ms
+    genai.Client = FakeGenaiClient
+
+
+def install_fakes(http_latency_ms=0.0, gemini_latency_ms=0.0):
+    """Patch requests.get and google.genai.Client process-wide; returns the FakeHTTP router."""
+    import requests
+    http = FakeHTTP(http_latency_ms)
+    requests.get = http.get
+    install_fake_gemini(gemini_latency_ms)
+    return http
@@ -0,0 +1,334 @@
+"""
+Multi-session load test: N simulated users drive library.py under AppTest at the same time.
+
+Sessions run on threads in one process, as they do in a Streamlit server, and share its
+process-wide caches and one SQLite database. Each session loops through realistic flows:
+- chat turns with the fake Gemini client;
+- library edits (add a book through the form, then remove it);
+- reader paging, which auto-saves progress;
+- the Stats page;
+- Quick Search;
+- browsing and searching My Library.
+Open Library, Gutendex and gutenberg.org are the local stubs from stub_server.py, so the remote
+tools go over real sockets. Each session count is run in turn and gets a report with:
+- p50/p95/p99 rerun latency (the script's own timing, including runs st.rerun() cut short);
+- interaction throughput and errors;
+- SQLite lock contention: the share of probes that found the write lock taken, "database is
+  locked" errors, and the slowest db helpers.
+
+    python benchmarks/loadtest.py                                    # 1, 4 and 8 sessions, 30 s each
+    python benchmarks/loadtest.py --sessions 1 8 32 --duration 60 --http-latency-ms 50 \\
+        --gemini-latency-ms 400 --json load.json
+
+Exits 1 if any interaction raised.
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.dirname(HERE), HERE]
+
+from bench import APP, seed_books  # noqa: E402
+from stub_server import start_stubs, stub_env  # noqa: E402
+
+PROMPTS = ["Find free classics by Austen", "Show my library", "Recommend me a book",
+           "Tell me about Pride and Prejudice", "What am I reading now?"]
+SEARCHES = ["austen", "dickens", "sherlock holmes", "moby dick", "frankenstein"]
+FLOW_WEIGHTS = {"chat": 2, "library_edit": 2, "reader": 3, "stats": 1, "quick_search": 1, "browse": 1}
+FAKE_KEY = "fake-key-for-offline-load-tests"
+
+
+# ─── Flows ───────────────────────────────────────────────────────────────────
+# Each flow stages widget changes on the session's AppTest and yields a step name; the driver
+# then runs the script once (plus any st.rerun() it triggers) and times it.
+def navigate(at, page):
+    at.radio(key="nav").set_value(page)
+
+
+def find(elements, **attrs):
+    """The first element whose attributes match; KeyError if the page has none."""
+    for e in elements:
+        if all(getattr(e, k) == v for k, v in attrs.items()):
+            return e
+    raise KeyError(attrs)
+
+
+def flow_chat(at, ctx):
+    navigate(at, "💬 Chat")
+    yield "open"
+    at.text_input(key="chat_input").input(ctx.rng.choice(PROMPTS))
+    find(at.button, label="Send →").click()
+    yield "send"
+
+
+def flow_library_edit(at, ctx):
+    navigate(at, "📖 My Library")
+    yield "open"
+    title = f"Load Test {ctx.session}-{ctx.rng.randrange(10 ** 9)}"
+    find(at.text_input, placeholder="Title or author...").input("")  # list every book, the new one too
+    at.text_input(key="add_title").input(title)
+    at.text_input(key="add_author").input("Load Tester")
+    find(at.button, label="Add Book").click()
+    yield "add"
+    with sqlite3.connect(ctx.db) as conn:
+        row = conn.execute("SELECT id FROM books WHERE title=?", (title,)).fetchone()
+    if row:
+        at.button(key=f"del_{row[0]}").click()
+        yield "remove"
+
+
+def flow_reader(at, ctx):
+    navigate(at, "📑 Read a Book")
+    yield "open"
+    choose = find(at.selectbox, label="Choose a book to read")
+    choose.select_index(ctx.rng.randrange(len(choose.options)))
+    yield "choose"
+    for _ in range(ctx.rng.randint(1, 4)):
+        find(at.button, label="➡️ Next section").click()
+        yield "next_section"
+
+
+def flow_stats(at, ctx):
+    navigate(at, "📊 Stats")
+    yield "open"
+
+
+def flow_quick_search(at, ctx):
+    navigate(at, "🔍 Quick Search")
+    yield "open"
+    at.text_input(key="gut_q").input(ctx.rng.choice(SEARCHES))
+    at.button(key="gut_go").click()
+    yield "search"
+
+
+def flow_browse(at, ctx):
+    navigate(at, "📖 My Library")
+    yield "open"
+    find(at.text_input, placeholder="Title or author...").input(ctx.rng.choice(SEARCHES))
+    yield "search"
+
+
+FLOWS = {"chat": flow_chat, "library_edit": flow_library_edit, "reader": flow_reader,
+         "stats": flow_stats, "quick_search": flow_quick_search, "browse": flow_browse}
+
+
+# ─── Driver ──────────────────────────────────────────────────────────────────
+class LockProbe(threading.Thread):
+    """Tries to take SQLite's write lock every `interval` s without waiting; the share of tries
+    that find it taken is how often a writer would have had to queue."""
+
+    def __init__(self, path, interval=0.005):
+        super().__init__(daemon=True, name="lock-probe")
+        self.path, self.interval = path, interval
+        self.busy = self.free = 0
+        self.done = threading.Event()
+
+    def run(self):
+        conn = sqlite3.connect(self.path, timeout=0, isolation_level=None)
+        while not self.done.wait(self.interval):
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute("ROLLBACK")
+                self.free += 1
+            except sqlite3.OperationalError:
+                self.busy += 1
+        conn.close()
+
+    def busy_share(self):
+        return self.busy / max(1, self.busy + self.free)
+
+
+def share_apptest_globals():
+    """AppTest is written for one run at a time: each run installs a mock Runtime singleton and
+    patches config.get_option to report global.appTest, then undoes both. With sessions on
+    several threads one run would undo them under another, so keep both in place for all runs
+    (the mock runtimes differ only in their in-memory managers). Each run also compiles the
+    script afresh, and ast.parse on several threads at once can fail in CPython 3.11, so share
+    one script cache between them as a server's sessions do."""
+    from streamlit import config
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    config.set_option("global.appTest", True)
+    shared, get_bytecode = ScriptCache(), ScriptCache.get_bytecode
+    ScriptCache.get_bytecode = lambda self, path: get_bytecode(shared, path)
+    last = []
+
+    def instance(cls):
+        if cls._instance is not None:
+            last[:] = [cls._instance]
+        if not last:
+            raise RuntimeError("Runtime hasn't been created!")
+        return cls._instance or last[0]
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(lambda cls: cls._instance is not None or bool(last))
+
+
+class SessionRun:
+    """One simulated user: its own AppTest session, looping over weighted flows until `deadline`."""
+
+    def __init__(self, session, db, deadline, think_s, record):
+        self.session, self.db, self.deadline, self.think_s = session, db, deadline, think_s
+        self.rng = random.Random(session)
+        self.record = record
+
+    def step(self, at, flow, step):
+        at.session_state["last_rerun_ms"] = None
+        t0 = time.perf_counter()
+        error = None
+        try:
+            at.run()
+            if at.exception:
+                error = at.exception[0].value
+        except Exception as e:  # AppTest timeouts and the like
+            error = f"{type(e).__name__}: {e}"
+        wall_ms = (time.perf_counter() - t0) * 1000
+        self.record({"session": self.session, "flow": flow, "step": step, "wall_ms": wall_ms,
+                     "rerun_ms": at.session_state["last_rerun_ms"] if "last_rerun_ms" in at.session_state else None,
+                     "error": error})
+        return error is None
+
+    def start(self):
+        from streamlit.testing.v1 import AppTest
+        at = AppTest.from_file(APP, default_timeout=120)
+        if not self.step(at, "session", "start"):
+            return None
+        at.session_state["anthropic_api_key"] = FAKE_KEY
+        return at
+
+    def __call__(self):
+        """After a failed step the session is in an unknown state, so start a new one (as a user
+        reloading the page would) rather than carry on in it."""
+        names, weights = list(FLOW_WEIGHTS), list(FLOW_WEIGHTS.values())
+        at = None
+        while time.monotonic() < self.deadline:
+            at = at or self.start()
+            if at is None:
+                time.sleep(self.think_s)
+                continue
+            flow = self.rng.choices(names, weights)[0]
+            steps = FLOWS[flow](at, self)
+            try:
+                for step in steps:
+                    if not self.step(at, flow, step):
+                        at = None
+                        break
+                    time.sleep(self.think_s * self.rng.uniform(0.5, 1.5))
+                    if time.monotonic() >= self.deadline:
+                        break
+            except KeyError as e:  # the page lacked a widget the flow expected
+                self.record({"session": self.session, "flow": flow, "step": "missing_widget", "wall_ms": 0,
+                             "rerun_ms": None, "error": f"{flow}: no widget {e}"})
+                at = None
+
+
+def percentile(samples, q):
+    return round(sorted(samples)[min(len(samples) - 1, int(q * len(samples)))], 1) if samples else None
+
+
+def run_level(sessions, duration, think_s, db):
+    from library_core import get_metrics
+    get_metrics().reset()
+    records, lock = [], threading.Lock()
+
+    def record(r):
+        with lock:
+            records.append(r)
+
+    probe = LockProbe(db)
+    probe.start()
+    t0 = time.monotonic()
+    threads = [threading.Thread(target=SessionRun(i, db, t0 + duration, think_s, record), name=f"session-{i}")
+               for i in range(sessions)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - t0
+    probe.done.set()
+    probe.join()
+
+    steps = [r for r in records if r["flow"] != "session"]
+    rerun = [r["rerun_ms"] if r["rerun_ms"] is not None else r["wall_ms"] for r in steps if not r["error"]]
+    errors = [r["error"] for r in records if r["error"]]
+    db_series = sorted((s for s in get_metrics().snapshot() if s["kind"] == "db"),
+                       key=lambda s: s["p95_ms"], reverse=True)
+    per_flow = {}
+    for r in steps:
+        per_flow.setdefault(f"{r['flow']}:{r['step']}", []).append(r["rerun_ms"] or r["wall_ms"])
+    return {
+        "sessions": sessions, "interactions": len(steps), "elapsed_s": round(elapsed, 1),
+        "throughput_per_s": round(len(steps) / elapsed, 2),
+        "rerun_p50_ms": percentile(rerun, 0.50), "rerun_p95_ms": percentile(rerun, 0.95),
+        "rerun_p99_ms": percentile(rerun, 0.99),
+        "wall_p95_ms": percentile([r["wall_ms"] for r in steps], 0.95),
+        "session_start_p95_ms": percentile([r["wall_ms"] for r in records if r["flow"] == "session"], 0.95),
+        "errors": len(errors), "error_samples": sorted(set(errors))[:5],
+        "write_lock_busy": round(probe.busy_share(), 4),
+        "locked_errors": sum("locked" in e for e in errors),
+        "slowest_db": [{k: s[k] for k in ("name", "calls", "errors", "p50_ms", "p95_ms", "p99_ms")}
+                       for s in db_series[:5]],
+        "flows": {name: {"count": len(v), "p50_ms": percentile(v, 0.50), "p95_ms": percentile(v, 0.95)}
+                  for name, v in sorted(per_flow.items())},
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sessions", type=int, nargs="+", default=[1, 4, 8], help="concurrent sessions per level")
+    ap.add_argument("--duration", type=float, default=30, help="seconds per level")
+    ap.add_argument("--think-ms", type=float, default=200, help="mean pause between a user's interactions")
+    ap.add_argument("--library-size", type=int, default=100, help="books seeded before the run")
+    ap.add_argument("--http-latency-ms", type=float, default=20.0, help="stub upstream latency per request")
+    ap.add_argument("--gemini-latency-ms", type=float, default=200.0, help="fake model latency per call")
+    ap.add_argument("--json", help="write the per-level reports to this file")
+    args = ap.parse_args(argv)
+
+    tmp = tempfile.mkdtemp(prefix="library-load-")
+    db = os.path.join(tmp, "library.db")
+    stubs = start_stubs(args.http_latency_ms)
+    os.environ.update(stub_env(stubs))
+    os.environ.update({"LIBRARY_DB": db, "LIBRARY_JOB_WORKERS": "0", "LIBRARY_PROFILE_DIR": tmp})
+    os.environ.setdefault("LIBRARY_GEMINI_RPM", "1000000")  # the fake model has no quota to respect
+    from fakes import install_fake_gemini
+    install_fake_gemini(args.gemini_latency_ms)
+    share_apptest_globals()
+    from library_core import get_db
+    conn = get_db()
+    seed_books(conn, args.library_size)  # every 7th has a Gutenberg id, for the reader
+    conn.close()
+
+    reports = []
+    for n in args.sessions:
+        print(f"{n} session{'s' if n != 1 else ''} for {args.duration:g} s...", flush=True)
+        reports.append(run_level(n, args.duration, args.think_ms / 1000, db))
+
+    cols = [("sessions", "sessions"), ("interactions", "steps"), ("throughput_per_s", "steps/s"),
+            ("rerun_p50_ms", "p50 ms"), ("rerun_p95_ms", "p95 ms"), ("rerun_p99_ms", "p99 ms"),
+            ("wall_p95_ms", "wall p95"), ("errors", "errors"), ("locked_errors", "locked")]
+    print("  ".join(f"{label:>9}" for _, label in cols) + "  write-lock busy")
+    for r in reports:
+        print("  ".join(f"{r[k] if r[k] is not None else '-':>9}" for k, _ in cols) + f"  {r['write_lock_busy']:>14.2%}")
+    worst = reports[-1]
+    print(f"\nslowest db helpers @ {worst['sessions']} sessions (p95 ms): " +
+          ", ".join(f"{s['name']} {s['p95_ms']}" for s in worst["slowest_db"]))
+    print(f"per-step p95 ms @ {worst['sessions']} sessions: " +
+          ", ".join(f"{k} {v['p95_ms']}" for k, v in worst["flows"].items()))
+    for r in reports:
+        for e in r["error_samples"]:
+            print(f"ERROR @ {r['sessions']} sessions: {e}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(reports, f, indent=1)
+    return 1 if any(r["errors"] for r in reports) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+"""
+Local HTTP stand-ins for Open Library, Gutendex and gutenberg.org with injectable faults.
+
+Unlike install_fakes(), these run real sockets, so requests' timeouts, the circuit breakers and
+the latency budgets in library_core.remote are exercised end to end. Responses come from the
+FakeHTTP fixtures; each upstream listens on its own port and has its own faults:
+
+    latency_ms   added to every response
+    error_rate   fraction of requests answered with a 503
+    hang_rate    fraction of requests that stall for hang_s before answering
+
+    python benchmarks/stub_server.py                   # prints the LIBRARY_*_URL exports
+    curl -d '{"hang_rate": 1}' http://127.0.0.1:<port>/__faults
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fakes import FakeHTTP  # noqa: E402
+
+FAULTS = {"latency_ms": 0.0, "error_rate": 0.0, "hang_rate": 0.0, "hang_s": 30.0}
+
+
+class StubUpstream:
+    """One upstream host served from FakeHTTP on 127.0.0.1:<port>."""
+
+    def __init__(self, name, real_host, http, port=0, rewrite=None):
+        self.name = name
+        self.real_host = real_host
+        self.http = http
+        self.rewrite = rewrite or {}
+        self.faults = dict(FAULTS)
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def set_faults(self, **faults):
+        unknown = set(faults) - set(FAULTS)
+        if unknown:
+            raise ValueError(f"Unknown faults: {sorted(unknown)}")
+        with self.lock:
+            self.faults.update({k: float(v) for k, v in faults.items()})
+
+    def clear_faults(self):
+        with self.lock:
+            self.faults = dict(FAULTS)
+
+    def _respond(self, path, headers):
+        with self.lock:
+            self.requests += 1
+            faults = dict(self.faults)
+        if faults["latency_ms"]:
+            time.sleep(faults["latency_ms"] / 1000)
+        if random.random() < faults["hang_rate"]:
+            time.sleep(faults["hang_s"])
+        if random.random() < faults["error_rate"]:
+            return 503, "text/plain", b"injected failure"
+        base, _, query = path.partition("?")
+        r = self.http.get(f"https://{self.real_host}{base}", params=dict(parse_qsl(query)),
+                          headers={"Range": headers["Range"]} if headers.get("Range") else None)
+        body = r.content
+        for old, new in self.rewrite.items():
+            body = body.replace(old.encode(), new.encode())
+        return r.status_code, r.headers["Content-Type"], body
+
+    def _handler(self):
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, fmt, *args):
+                pass
+
+            def _send(self, status, content_type, body):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                try:
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the client gave up (timed out) first
+
+            def do_GET(self):
+                if self.path == "/__faults":
+                    return self._send(200, "application/json", json.dumps(upstream.faults).encode())
+                self._send(*upstream._respond(self.path, self.headers))
+
+            def do_POST(self):
+                if self.path != "/__faults":
+                    return self._send(404, "text/plain", b"not found")
+                try:
+                    upstream.set_faults(**json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}"))
+                except (ValueError, TypeError) as e:
+                    return self._send(400, "text/plain", str(e).encode())
+                self._send(200, "application/json", json.dumps(upstream.faults).encode())
+
+        return Handler
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True, name=f"stub-{self.name}").start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def start_stubs(http_latency_ms=0.0):
+    """Start the three upstreams; returns {"openlibrary", "gutendex", "gutenberg"} → StubUpstream.
+
+    Point the app at them with stub_env() before library_core is imported.
+    """
+    http = FakeHTTP(http_latency_ms)
+    text = StubUpstream("gutenberg", "www.gutenberg.org", http).start()
+    return {
+        "openlibrary": StubUpstream("openlibrary", "openlibrary.org", http).start(),
+        "gutendex": StubUpstream("gutendex", "gutendex.com", http,
+                                 rewrite={"https://www.gutenberg.org": text.url}).start(),
+        "gutenberg": text,
+    }
+
+
+def stub_env(stubs):
+    return {"LIBRARY_OPEN_LIBRARY_URL": stubs["openlibrary"].url,
+            "LIBRARY_GUTENDEX_URL": stubs["gutendex"].url}
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--latency-ms", type=float, default=0.0, help="baseline latency for every upstream")
+    args = p.parse_args()
+    stubs = start_stubs(args.latency_ms)
+    for k, v in stub_env(stubs).items():
+        print(f"export {k}={v}")
+    for s in stubs.values():
+        print(f"# {s.name}: {s.url}  (faults: POST {s.url}/__faults)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -2,16 +2,56 @@
 📚 AI-Powered Library — Streamlit Agentic App
 Uses Google Gemini + Open Library API + Project Gutenberg to search, retrieve, and manage books.
 Features: SQLite persistence, reading progress, ratings, full book content from Gutenberg.
+
+This file is the Streamlit UI; the database, tools and agent live in the `library_core` package.
 """
 
+import time
+_RERUN_T0 = time.perf_counter()
+
 import streamlit as st
-import requests
-import json
-import sqlite3
 import os
-from datetime import datetime
-from google import genai
-from google.genai import types as genai_types
+from library_core import (
+    GEMINI_BURST, GEMINI_RPM, METRICS_EXPORT_INTERVAL_S, METRICS_EXPORT_PATH,
+    PRIORITY_INTERACTIVE_JOB, PROFILE_DIR, ProfilerBusyError, RunProfile, breaker_states, cached_remote, check_library_changes,
+    clear_catalog_suggestions, clear_shared_caches, db_delete_conversation,
+    db_get_book, db_get_book_by_gutenberg_id, db_has_book_text, db_list_conversations,
+    db_record_progress, db_remove_book, db_upsert_book, enqueue, enqueue_book_followups,
+    ensure_worker_pool, fetch_gutenberg_content, find_duplicate_books, flush_progress, get_jobs, get_library, get_library_counts,
+    get_metrics, get_prefetcher, get_scheduler, job_counts,
+    load_earlier_messages, open_conversation, reading_analytics, reset_breakers, run_agent, search_book_passages,
+    search_gutenberg, search_library, search_open_library, suggest, workers_available,
+)
+# DB, tools, agent and caches live in the Streamlit-free library_core package; this file is the UI.
+
+# Developer profiler (sidebar toggle): cProfile + tracemalloc around the rest of the rerun. A run
+# cut short by st.rerun() never reaches the report, so its profile is dropped by the next one.
+if st.session_state.get("_run_profile"):
+    st.session_state.pop("_run_profile").abandon()
+_profile, _profile_skipped = None, None
+if st.session_state.get("dev_profile"):
+    try:
+        _profile = RunProfile().start()
+    except ProfilerBusyError as e:  # one profiler per process: another session got there first
+        _profile_skipped = str(e)
+st.session_state._run_profile = _profile
+
+def record_rerun_time(page, cut_short=False):
+    """Time this script run. A run cut short by st.rerun() carries its time into the next one, so
+    last_rerun_ms covers all the script work an interaction caused (e.g. a whole agent turn)."""
+    ms = (time.perf_counter() - _RERUN_T0) * 1000
+    if not _profile:  # profiled reruns are slower; keep them out of the rerun latency series
+        get_metrics().observe("rerun", "cold_start" if get_metrics().mark_warm() else page, ms)
+    total = ms + st.session_state.pop("_rerun_carry_ms", 0.0)
+    if cut_short:
+        st.session_state._rerun_carry_ms = total
+    else:
+        st.session_state.last_rerun_ms = total
+
+def rerun():
+    """st.rerun() for the main script (not fragments, which don't restart the clock)."""
+    record_rerun_time(st.session_state.get("page", ""), cut_short=True)
+    st.rerun()
 
 # ─── Page Config ────────────────────────────────────────────────────────────
 st.set_page_config(
@@ -191,538 +231,126 @@ section[data-testid="stSidebar"] h2 { color: var(--gold) !important; font-family
 </style>
 """, unsafe_allow_html=True)
 
-# ─── SQLite Database ─────────────────────────────────────────────────────────
-DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "library.db")
-
-def get_db():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def init_db():
-    conn = get_db()
-    conn.executescript("""
-        CREATE TABLE IF NOT EXISTS books (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            author TEXT NOT NULL,
-            genre TEXT DEFAULT '',
-            notes TEXT DEFAULT '',
-            year INTEGER,
-            isbn TEXT DEFAULT '',
-            cover_url TEXT DEFAULT '',
-            open_library_key TEXT DEFAULT '',
-            gutenberg_id INTEGER,
-            source TEXT DEFAULT 'Personal',
-            added_at TEXT NOT NULL,
-            status TEXT DEFAULT 'unread',
-            rating INTEGER DEFAULT 0,
-            review TEXT DEFAULT '',
-            current_page INTEGER DEFAULT 0,
-            total_pages INTEGER DEFAULT 0,
-            started_at TEXT,
-            finished_at TEXT
-        );
-    """)
-    conn.commit()
-    conn.close()
-
-init_db()
-
-def db_load_library():
-    conn = get_db()
-    rows = conn.execute("SELECT * FROM books ORDER BY added_at DESC").fetchall()
-    conn.close()
-    return [dict(r) for r in rows]
-
-def db_add_book(title, author, genre="", notes="", year=None, isbn="", cover_url="",
-                open_library_key="", gutenberg_id=None, total_pages=0):
-    conn = get_db()
-    conn.execute("""
-        INSERT INTO books (title, author, genre, notes, year, isbn, cover_url,
-        open_library_key, gutenberg_id, source, added_at, total_pages)
-        VALUES (?,?,?,?,?,?,?,?,?,'Personal',?,?)
-    """, (title, author, genre, notes, year, isbn, cover_url,
-          open_library_key, gutenberg_id,
-          datetime.now().strftime("%Y-%m-%d"), total_pages or 0))
-    conn.commit()
-    book_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
-    conn.close()
-    return book_id
-
-def db_update_progress(book_id, current_page=None, total_pages=None,
-                        status=None, rating=None, review=None):
-    updates, values = [], []
-    if current_page is not None:
-        updates.append("current_page=?"); values.append(current_page)
-    if total_pages is not None:
-        updates.append("total_pages=?"); values.append(total_pages)
-    if status is not None:
-        updates.append("status=?"); values.append(status)
-        if status == "reading":
-            updates.append("started_at=?"); values.append(datetime.now().strftime("%Y-%m-%d"))
-        elif status == "finished":
-            updates.append("finished_at=?"); values.append(datetime.now().strftime("%Y-%m-%d"))
-    if rating is not None:
-        updates.append("rating=?"); values.append(max(0, min(5, int(rating))))
-    if review is not None:
-        updates.append("review=?"); values.append(review)
-    if not updates:
-        return False
-    values.append(book_id)
-    conn = get_db()
-    conn.execute(f"UPDATE books SET {', '.join(updates)} WHERE id=?", values)
-    conn.commit()
-    conn.close()
-    return True
-
-def db_remove_book(book_id):
-    conn = get_db()
-    c = conn.execute("DELETE FROM books WHERE id=?", (book_id,))
-    conn.commit()
-    conn.close()
-    return c.rowcount > 0
-
-def db_get_book(book_id):
-    conn = get_db()
-    row = conn.execute("SELECT * FROM books WHERE id=?", (book_id,)).fetchone()
-    conn.close()
-    return dict(row) if row else None
-
-def sync_library():
-    st.session_state.personal_library = db_load_library()
-
-# ─── Anthropic Client ────────────────────────────────────────────────────────
-# NOTE: Do NOT cache — key changes at runtime.
-def get_client():
-    api_key = st.session_state.get("anthropic_api_key", "").strip()
-    if api_key:
-        return genai.Client(api_key=api_key)
-    return None
-
-
-def _build_gemini_tools():
-    """Convert tool definitions into new google-genai SDK FunctionDeclaration format."""
-    TYPE_MAP = {
-        "string": genai_types.Type.STRING,
-        "integer": genai_types.Type.INTEGER,
-        "number": genai_types.Type.NUMBER,
-        "boolean": genai_types.Type.BOOLEAN,
-        "array": genai_types.Type.ARRAY,
-        "object": genai_types.Type.OBJECT,
-    }
-
-    def build_schema(pval):
-        ptype = TYPE_MAP.get(str(pval.get("type", "string")).lower(), genai_types.Type.STRING)
-        kwargs = {"type": ptype}
-        if "description" in pval:
-            kwargs["description"] = pval["description"]
-        if "enum" in pval:
-            kwargs["enum"] = [str(e) for e in pval["enum"] if e]
-        return genai_types.Schema(**kwargs)
-
-    declarations = []
-    for t in TOOLS:
-        schema = t["input_schema"]
-        props = {}
-        for pname, pval in schema.get("properties", {}).items():
-            props[pname] = build_schema(pval)
-        required = schema.get("required", [])
-        param_schema = genai_types.Schema(
-            type=genai_types.Type.OBJECT,
-            properties=props,
-            required=required,
-        )
-        declarations.append(genai_types.FunctionDeclaration(
-            name=t["name"],
-            description=t["description"],
-            parameters=param_schema,
-        ))
-    return [genai_types.Tool(function_declarations=declarations)]
+# ─── Rerun Budgets ───────────────────────────────────────────────────────────
+# Time budgets for a script run, checked on the Metrics page and by benchmarks/bench.py.
+COLD_START_BUDGET_MS = float(os.environ.get("LIBRARY_COLD_START_BUDGET_MS", 1000))
+RERUN_BUDGET_MS = float(os.environ.get("LIBRARY_RERUN_BUDGET_MS", 250))
 
 # ─── Session State ───────────────────────────────────────────────────────────
 def init_state():
     defaults = {
         "messages": [],
-        "personal_library": [],
+        "conversation_id": None,
+        "has_earlier": False,
+        "chat_restored": False,
+        "search_sessions": {},
+        "search_active": {},
         "anthropic_api_key": "",
         "page": "Chat",
         "reading_book_id": None,
         "reading_content": "",
         "reading_offset": 0,
+        "job_ids": [],
+        "jobs_done": [],
     }
     for k, v in defaults.items():
         if k not in st.session_state:
             st.session_state[k] = v
 
 init_state()
-sync_library()
-
-# ─── Tool Functions ───────────────────────────────────────────────────────────
-
-def search_open_library(query: str, limit: int = 8) -> dict:
-    try:
-        params = {"q": query, "limit": limit,
-                  "fields": "key,title,author_name,first_publish_year,number_of_pages_median,subject,isbn,cover_i,publisher"}
-        r = requests.get("https://openlibrary.org/search.json", params=params, timeout=10)
-        r.raise_for_status()
-        data = r.json()
-        books = []
-        for doc in data.get("docs", []):
-            books.append({
-                "title": doc.get("title", "Unknown"),
-                "authors": doc.get("author_name", ["Unknown"]),
-                "year": doc.get("first_publish_year"),
-                "pages": doc.get("number_of_pages_median"),
-                "subjects": doc.get("subject", [])[:5],
-                "isbn": (doc.get("isbn") or [None])[0],
-                "cover_id": doc.get("cover_i"),
-                "publisher": (doc.get("publisher") or [None])[0],
-                "open_library_key": doc.get("key"),
-                "source": "Open Library",
-            })
-        return {"success": True, "total": data.get("numFound", 0), "books": books}
-    except Exception as e:
-        return {"success": False, "error": str(e), "books": []}
-
-
-def get_book_details(open_library_key: str) -> dict:
-    try:
-        r = requests.get(f"https://openlibrary.org{open_library_key}.json", timeout=10)
-        r.raise_for_status()
-        data = r.json()
-        description = data.get("description")
-        if isinstance(description, dict):
-            description = description.get("value", "")
-        return {
-            "success": True,
-            "title": data.get("title"),
-            "description": description or "No description available.",
-            "subjects": data.get("subjects", [])[:10],
-        }
-    except Exception as e:
-        return {"success": False, "error": str(e)}
-
-
-def search_gutenberg(query: str, limit: int = 8) -> dict:
-    try:
-        r = requests.get("https://gutendex.com/books/",
-                         params={"search": query, "mime_type": "text/plain"}, timeout=12)
-        r.raise_for_status()
-        data = r.json()
-        books = []
-        for item in data.get("results", [])[:limit]:
-            fmts = item.get("formats", {})
-            txt_url = (fmts.get("text/plain; charset=utf-8") or
-                       fmts.get("text/plain; charset=us-ascii") or
-                       fmts.get("text/plain"))
-            books.append({
-                "gutenberg_id": item["id"],
-                "title": item.get("title", "Unknown"),
-                "authors": [a.get("name", "Unknown") for a in item.get("authors", [])],
-                "subjects": item.get("subjects", [])[:5],
-                "download_count": item.get("download_count", 0),
-                "txt_url": txt_url,
-                "cover_url": fmts.get("image/jpeg", ""),
-            })
-        return {"success": True, "total": data.get("count", 0), "books": books}
-    except Exception as e:
-        return {"success": False, "error": str(e), "books": []}
-
-
-def fetch_gutenberg_content(gutenberg_id: int, offset: int = 0, chunk_size: int = 3000) -> dict:
-    try:
-        r = requests.get(f"https://gutendex.com/books/{gutenberg_id}/", timeout=10)
-        r.raise_for_status()
-        data = r.json()
-        fmts = data.get("formats", {})
-        txt_url = (fmts.get("text/plain; charset=utf-8") or
-                   fmts.get("text/plain; charset=us-ascii") or
-                   fmts.get("text/plain"))
-        if not txt_url:
-            return {"success": False, "error": "No plain text version available."}
-        byte_end = offset + chunk_size * 4
-        r2 = requests.get(txt_url, headers={"Range": f"bytes={offset}-{byte_end}"}, timeout=15)
-        content = r2.content.decode("utf-8", errors="replace")
-        if len(content) > chunk_size:
-            content = content[:chunk_size].rsplit(" ", 1)[0]
-        return {
-            "success": True,
-            "gutenberg_id": gutenberg_id,
-            "title": data.get("title"),
-            "authors": [a.get("name") for a in data.get("authors", [])],
-            "content": content,
-            "offset": offset,
-            "next_offset": offset + chunk_size * 4,
-        }
-    except Exception as e:
-        return {"success": False, "error": str(e)}
-
-
-def add_to_personal_library(title: str, author: str, genre: str = "", notes: str = "",
-                             year: int = None, isbn: str = "", gutenberg_id: int = None,
-                             open_library_key: str = "", total_pages: int = 0) -> dict:
-    book_id = db_add_book(title, author, genre, notes, year, isbn, "",
-                          open_library_key, gutenberg_id, total_pages)
-    sync_library()
-    return {
-        "success": True,
-        "message": f"'{title}' by {author} added (ID #{book_id})." +
-                   (" 📖 Free eBook available via Gutenberg!" if gutenberg_id else ""),
-        "book_id": book_id,
-    }
-
-
-def list_personal_library(genre_filter: str = "", search_query: str = "",
-                           status_filter: str = "") -> dict:
-    books = db_load_library()
-    if genre_filter:
-        books = [b for b in books if genre_filter.lower() in b.get("genre", "").lower()]
-    if search_query:
-        sq = search_query.lower()
-        books = [b for b in books if sq in b["title"].lower() or sq in b["author"].lower()]
-    if status_filter:
-        books = [b for b in books if b.get("status") == status_filter]
-    return {"success": True, "count": len(books), "books": books}
-
-
-def remove_from_library(book_id: int) -> dict:
-    ok = db_remove_book(book_id)
-    sync_library()
-    return {"success": ok, "message": f"Book #{book_id} {'removed' if ok else 'not found'}."}
-
-
-def update_reading_progress(book_id: int, current_page: int = None, total_pages: int = None,
-                             status: str = None, rating: int = None, review: str = None) -> dict:
-    ok = db_update_progress(book_id, current_page, total_pages, status, rating, review)
-    sync_library()
-    if ok:
-        parts = []
-        if current_page is not None: parts.append(f"page→{current_page}")
-        if status: parts.append(f"status→{status}")
-        if rating is not None: parts.append(f"rating→{'★'*rating}")
-        if review: parts.append("review saved")
-        return {"success": True, "message": f"Book #{book_id} updated: {', '.join(parts) or 'saved'}."}
-    return {"success": False, "message": f"Book #{book_id} not found."}
-
-
-def get_recommendations(genre: str = "", mood: str = "", based_on: str = "") -> dict:
-    personal = db_load_library()
-    return {
-        "success": True,
-        "personal_library_count": len(personal),
-        "personal_titles": [b["title"] for b in personal[:10]],
-        "personal_genres": list(set(b.get("genre","") for b in personal if b.get("genre"))),
-        "recently_finished": [b["title"] for b in personal if b.get("status")=="finished"][:5],
-        "currently_reading": [b["title"] for b in personal if b.get("status")=="reading"][:3],
-        "request": {"genre": genre, "mood": mood, "based_on": based_on},
-    }
-
-
-TOOLS = [
-    {
-        "name": "search_open_library",
-        "description": "Search millions of books from Open Library (internet). Use for any book by title, author, subject, or keyword.",
-        "input_schema": {"type": "object",
-                         "properties": {"query": {"type": "string"}, "limit": {"type": "integer", "default": 8}},
-                         "required": ["query"]},
-    },
-    {
-        "name": "get_book_details",
-        "description": "Get detailed description and subjects for a book via its Open Library key.",
-        "input_schema": {"type": "object",
-                         "properties": {"open_library_key": {"type": "string"}},
-                         "required": ["open_library_key"]},
-    },
-    {
-        "name": "search_gutenberg",
-        "description": "Search Project Gutenberg for FREE books that can be fully read. Best for classics.",
-        "input_schema": {"type": "object",
-                         "properties": {"query": {"type": "string"}, "limit": {"type": "integer", "default": 6}},
-                         "required": ["query"]},
-    },
-    {
-        "name": "fetch_gutenberg_content",
-        "description": "Fetch readable text from a Gutenberg book. Returns a chunk of the actual book content.",
-        "input_schema": {"type": "object",
-                         "properties": {"gutenberg_id": {"type": "integer"}, "offset": {"type": "integer", "default": 0}},
-                         "required": ["gutenberg_id"]},
-    },
-    {
-        "name": "add_to_personal_library",
-        "description": "Add a book to the user's personal library. Include gutenberg_id when available.",
-        "input_schema": {"type": "object",
-                         "properties": {
-                             "title": {"type": "string"}, "author": {"type": "string"},
-                             "genre": {"type": "string"}, "notes": {"type": "string"},
-                             "year": {"type": "integer"}, "isbn": {"type": "string"},
-                             "gutenberg_id": {"type": "integer"}, "open_library_key": {"type": "string"},
-                             "total_pages": {"type": "integer"},
-                         },
-                         "required": ["title", "author"]},
-    },
-    {
-        "name": "list_personal_library",
-        "description": "List books in the user's personal library with optional filters.",
-        "input_schema": {"type": "object",
-                         "properties": {
-                             "genre_filter": {"type": "string"},
-                             "search_query": {"type": "string"},
-                             "status_filter": {"type": "string", "enum": ["unread","reading","finished",""]},
-                         }},
-    },
-    {
-        "name": "remove_from_library",
-        "description": "Remove a book from the personal library by ID.",
-        "input_schema": {"type": "object",
-                         "properties": {"book_id": {"type": "integer"}},
-                         "required": ["book_id"]},
-    },
-    {
-        "name": "update_reading_progress",
-        "description": "Update reading status (unread/reading/finished), current page, total pages, star rating (1-5), or review for a book.",
-        "input_schema": {"type": "object",
-                         "properties": {
-                             "book_id": {"type": "integer"},
-                             "current_page": {"type": "integer"},
-                             "total_pages": {"type": "integer"},
-                             "status": {"type": "string", "enum": ["unread","reading","finished"]},
-                             "rating": {"type": "integer", "description": "1-5 stars"},
-                             "review": {"type": "string"},
-                         },
-                         "required": ["book_id"]},
-    },
-    {
-        "name": "get_recommendations",
-        "description": "Get personalized recommendation context based on library and preferences.",
-        "input_schema": {"type": "object",
-                         "properties": {
-                             "genre": {"type": "string"},
-                             "mood": {"type": "string"},
-                             "based_on": {"type": "string"},
-                         }},
-    },
-]
-
-TOOL_MAP = {
-    "search_open_library": search_open_library,
-    "get_book_details": get_book_details,
-    "search_gutenberg": search_gutenberg,
-    "fetch_gutenberg_content": fetch_gutenberg_content,
-    "add_to_personal_library": add_to_personal_library,
-    "list_personal_library": list_personal_library,
-    "remove_from_library": remove_from_library,
-    "update_reading_progress": update_reading_progress,
-    "get_recommendations": get_recommendations,
-}
-
-# ─── Agentic Loop ────────────────────────────────────────────────────────────
-def run_agent(user_message: str):
-    client = get_client()
-    if not client:
-        yield ("error", "⚠️ Please enter your Gemini API key in the sidebar.")
-        return
-
-    system_prompt = """You are a knowledgeable and passionate library assistant AI. You help users discover, manage, and READ books.
-
-You have access to:
-1. Open Library API — search millions of real books from the internet
-2. Project Gutenberg — search and fetch full text of thousands of FREE classic books
-3. Personal Library — the user's own collection with persistent reading progress and ratings
-
-Guidelines:
-- Search Open Library AND Gutenberg (for classics) when asked about books
-- If a Gutenberg book is found, always mention they can read it for free
-- When adding books found on Gutenberg, always include the gutenberg_id
-- Use update_reading_progress to log status, pages, ratings and reviews
-- When someone wants to read, use fetch_gutenberg_content
-- Be warm, literary, and enthusiastic. Recommend related books proactively.
-"""
-
-    # Build message history for the new SDK format
-    history = []
-    for m in st.session_state.messages:
-        role = "user" if m["role"] == "user" else "model"
-        history.append(genai_types.Content(role=role, parts=[genai_types.Part(text=m["content"])]))
-
-    st.session_state.messages.append({"role": "user", "content": user_message})
-
-    gemini_tools = _build_gemini_tools()
-    config = genai_types.GenerateContentConfig(
-        system_instruction=system_prompt,
-        tools=gemini_tools,
-    )
-
-    try:
-        # Start with full history + new user message
-        contents = history + [genai_types.Content(role="user", parts=[genai_types.Part(text=user_message)])]
-
-        while True:
-            response = client.models.generate_content(
-                model="gemini-2.0-flash",
-                contents=contents,
-                config=config,
-            )
-
-            candidate = response.candidates[0]
-            fn_calls = []
-            text_parts = []
-
-            for part in candidate.content.parts:
-                if part.function_call:
-                    fn_calls.append(part.function_call)
-                elif part.text:
-                    text_parts.append(part.text)
-
-            if text_parts:
-                yield ("text", "\n".join(text_parts))
-
-            # No tool calls — done
-            if not fn_calls:
-                if text_parts:
-                    st.session_state.messages.append({"role": "assistant", "content": "\n".join(text_parts)})
-                break
-
-            # Append model response to contents
-            contents.append(candidate.content)
-
-            # Execute tools and build function response parts
-            fn_response_parts = []
-            for fc in fn_calls:
-                fn_name = fc.name
-                fn_args = dict(fc.args) if fc.args else {}
-                yield ("tool_call", f"🔧 {fn_name}({str(fn_args)[:80]}...)")
-                fn = TOOL_MAP.get(fn_name)
-                result = fn(**fn_args) if fn else {"error": f"Unknown tool: {fn_name}"}
-                yield ("tool_result", f"✅ {fn_name} → {len(str(result))} chars")
-                fn_response_parts.append(
-                    genai_types.Part(
-                        function_response=genai_types.FunctionResponse(
-                            name=fn_name,
-                            response={"result": json.dumps(result)},
-                        )
-                    )
-                )
-
-            # Append tool results as a user turn
-            contents.append(genai_types.Content(role="user", parts=fn_response_parts))
-
-    except Exception as e:
-        err_str = str(e)
-        # Roll back the user message on failure
-        if st.session_state.messages and st.session_state.messages[-1]["role"] == "user":
-            st.session_state.messages.pop()
-        if "API_KEY_INVALID" in err_str or ("invalid" in err_str.lower() and "key" in err_str.lower()):
-            yield ("error", "🔑 **Invalid API key.** Check the key in the sidebar. Get yours at https://aistudio.google.com/apikey")
-        elif "PERMISSION_DENIED" in err_str or "403" in err_str:
-            yield ("error", "🚫 **Permission denied.** Your key may not have access to this model.")
-        elif "RESOURCE_EXHAUSTED" in err_str or "429" in err_str:
-            yield ("error", "⏳ **Rate limit reached.** Please wait a moment and try again.")
-        elif "Connection" in err_str or "network" in err_str.lower():
-            yield ("error", "🌐 **Network error.** Check your internet connection and try again.")
-        else:
-            yield ("error", f"❌ **API error:** {err_str[:300]}")
 
+# Writes by other sessions, tabs, job workers or the CLI/API since the last rerun: a
+# PRAGMA data_version check, reloading library snapshots only if the books actually changed.
+check_library_changes()
+
+if not st.session_state.chat_restored:
+    recent = db_list_conversations(1)
+    open_conversation(st.session_state, recent[0]["id"] if recent else None)
+    st.session_state.chat_restored = True
+
+# ─── Reading Progress ────────────────────────────────────────────────────────
+# Progress saves are buffered (db_record_progress) and written in batches; paging through a
+# book auto-saves the position as it goes.
+READER_CHARS_PER_PAGE = 2000
+
+def autosave_position(book, offset):
+    page = offset // READER_CHARS_PER_PAGE
+    if page > (book.get("current_page") or 0):
+        db_record_progress(book["id"], current_page=min(page, book.get("total_pages") or page))
+
+# ─── Background Jobs ─────────────────────────────────────────────────────────
+# Downloads, indexing and metadata lookups run in a worker pool (library_core.jobs) started
+# next to the app; the sidebar polls this session's jobs while any are pending.
+JOBS_TRACKED = 10
+JOBS_POLL_S = 2
+
+ensure_worker_pool()
+
+def track_jobs(job_ids):
+    ids = [j for j in job_ids if j not in st.session_state.job_ids]
+    st.session_state.job_ids = (ids + st.session_state.job_ids)[:JOBS_TRACKED]
+
+def add_book(*args):
+    book_id, created = db_upsert_book(*args)
+    if created:
+        track_jobs(enqueue_book_followups(book_id))
+    return book_id, created
+
+def render_jobs_panel():
+    jobs = get_jobs(st.session_state.job_ids)
+    finished = [j["id"] for j in jobs if j["status"] in ("done", "failed")
+                and j["id"] not in st.session_state.jobs_done]
+    if finished:
+        st.session_state.jobs_done = (finished + st.session_state.jobs_done)[:JOBS_TRACKED]
+    counts = job_counts()
+    st.markdown(f"**Background jobs:** {counts.get('queued', 0)} queued • {counts.get('running', 0)} running"
+                f" • {counts['workers']} workers")
+    icons = {"queued": "⏳", "running": "⚙️", "done": "✅", "failed": "⚠️"}
+    for j in jobs[:5]:
+        label = j["payload"].get("gutenberg_id") or j["payload"].get("book_id")
+        err = f" — {j['error'][:60]}" if j["status"] == "failed" or (j["error"] and j["status"] == "queued") else ""
+        st.markdown(f"<div class='book-meta'>{icons[j['status']]} {j['kind']} #{label}{err}</div>",
+                    unsafe_allow_html=True)
+    if finished and not any(j["status"] in ("queued", "running") for j in jobs):
+        st.rerun()  # stop polling; the full rerun picks up the workers' writes
+
+# ─── Search Sessions ─────────────────────────────────────────────────────────
+# Quick Search keeps each query's accumulated results in the session, backed by the shared
+# remote cache page by page, so paging, adding and re-opening a search never re-hit the network.
+SEARCH_PAGE_SIZE = 10
+SEARCH_API_LIMIT = {"open_library": 20, "gutenberg": 32}  # Gutendex pages are fixed at 32
+SEARCH_SESSIONS_KEPT = 20
+
+def get_search_session(source, query):
+    key = f"{source}:{' '.join(query.lower().split())}"
+    sessions = st.session_state.search_sessions
+    if key not in sessions:
+        if len(sessions) >= SEARCH_SESSIONS_KEPT:
+            sessions.pop(next(iter(sessions)))
+        sessions[key] = {"source": source, "query": query.strip(), "books": [], "total": 0,
+                         "api_page": 0, "exhausted": False, "page": 0, "error": None}
+    return sessions[key]
+
+def _search_call(sess, api_page):
+    fn = search_open_library if sess["source"] == "open_library" else search_gutenberg
+    return fn, {"query": sess["query"], "limit": SEARCH_API_LIMIT[sess["source"]], "page": api_page}
+
+def ensure_search_results(sess, count):
+    while len(sess["books"]) < count and not sess["exhausted"]:
+        fn, kwargs = _search_call(sess, sess["api_page"] + 1)
+        res = cached_remote(fn, **kwargs)
+        sess["error"] = None if res["success"] else res.get("error")
+        if not res["success"]:
+            break
+        sess["api_page"] += 1
+        sess["books"] += res["books"]
+        sess["total"] = res["total"]
+        sess["exhausted"] = not res["books"] or len(sess["books"]) >= res["total"]
+
+def prefetch_next_search_page(sess):
+    if not sess["exhausted"] and len(sess["books"]) < (sess["page"] + 2) * SEARCH_PAGE_SIZE:
+        fn, kwargs = _search_call(sess, sess["api_page"] + 1)
+        get_prefetcher().submit(fn, **kwargs)
 
 # ─── UI Helpers ──────────────────────────────────────────────────────────────
 def render_stars(rating, max_stars=5):
@@ -741,6 +369,125 @@ def status_badge(status):
     cls, label = m.get(status, ("", status))
     return f"<span class='book-badge {cls}'>{label}</span>"
 
+def render_ol_result(book):
+    authors = ", ".join(book["authors"][:2]) if book["authors"] else "Unknown"
+    yr = f" ({book['year']})" if book.get("year") else ""
+    pgs = f" • {book['pages']} pages" if book.get("pages") else ""
+    subj = ", ".join(book["subjects"][:3]) if book.get("subjects") else ""
+    cov = (f"<img src='https://covers.openlibrary.org/b/id/{book['cover_id']}-M.jpg' "
+           f"style='width:55px;height:75px;object-fit:cover;border-radius:4px;float:left;margin-right:14px'/>"
+           if book.get("cover_id") else "")
+    c1, c2 = st.columns([5, 1])
+    with c1:
+        st.markdown(f"""
+<div class='book-card'>{cov}
+    <div><div class='book-title'>{book['title']}</div>
+    <div class='book-author'>by {authors}{yr}</div>
+    <div class='book-meta'><span class='book-badge'>Open Library</span>{pgs}</div>
+    {"<div class='book-meta'>🏷️ "+subj+"</div>" if subj else ""}
+    </div></div>""", unsafe_allow_html=True)
+    with c2:
+        st.markdown("<br><br>", unsafe_allow_html=True)
+        if st.button("+ Add", key=f"oladd_{book.get('open_library_key') or book['title']}"):
+            cover = f"https://covers.openlibrary.org/b/id/{book['cover_id']}-M.jpg" if book.get("cover_id") else ""
+            _, created = add_book(book["title"], ", ".join(book["authors"][:2]),
+                                        subj.split(",")[0].strip() if subj else "",
+                                        "", book.get("year"), book.get("isbn") or "", cover,
+                                        book.get("open_library_key") or "", None, book.get("pages") or 0)
+            st.success("Added!") if created else st.info("Already in your library.")
+
+def render_gutenberg_result(book):
+    authors = ", ".join(book["authors"]) if book["authors"] else "Unknown"
+    subj = ", ".join(book["subjects"][:3]) if book.get("subjects") else ""
+    cov = (f"<img src='{book['cover_url']}' style='width:55px;height:75px;object-fit:cover;border-radius:4px;float:left;margin-right:14px'/>"
+           if book.get("cover_url") else "")
+    c1, c2, c3 = st.columns([4, 1, 1])
+    with c1:
+        st.markdown(f"""
+<div class='book-card'>{cov}
+    <div><div class='book-title'>{book['title']}</div>
+    <div class='book-author'>by {authors}</div>
+    <div class='book-meta'>
+        <span class='book-badge badge-ebook'>📖 Free eBook</span>
+        <span class='book-badge'>ID #{book['gutenberg_id']}</span>
+        ⬇️ {book['download_count']:,}
+    </div>
+    {"<div class='book-meta'>🏷️ "+subj+"</div>" if subj else ""}
+    </div></div>""", unsafe_allow_html=True)
+    with c2:
+        st.markdown("<br><br>", unsafe_allow_html=True)
+        if st.button("+ Add", key=f"gadd_{book['gutenberg_id']}"):
+            _, created = add_book(book["title"], authors,
+                                        subj.split(",")[0].strip() if subj else "",
+                                        "", None, "", book.get("cover_url",""), "", book["gutenberg_id"])
+            st.success("Added!") if created else st.info("Already in your library.")
+    with c3:
+        st.markdown("<br><br>", unsafe_allow_html=True)
+        if st.button("📖 Read", key=f"gread_{book['gutenberg_id']}"):
+            existing = db_get_book_by_gutenberg_id(book["gutenberg_id"])
+            st.session_state.reading_book_id = existing["id"] if existing else add_book(
+                book["title"], authors, "", "", None, "", book.get("cover_url",""), "", book["gutenberg_id"])[0]
+            st.session_state.reading_content = ""
+            st.session_state.reading_offset = 0
+            st.session_state.page = "Read a Book"
+            rerun()
+
+def render_search_results(sess, render_card, key):
+    start = sess["page"] * SEARCH_PAGE_SIZE
+    if len(sess["books"]) < start + SEARCH_PAGE_SIZE and not sess["exhausted"]:
+        with st.spinner("Searching..."):
+            ensure_search_results(sess, start + SEARCH_PAGE_SIZE)
+    if sess["error"] and not sess["books"]:
+        st.error(sess["error"])
+        return
+    books = sess["books"][start:start + SEARCH_PAGE_SIZE]
+    st.markdown(f"**{sess['total']:,} results** for *{sess['query']}* — "
+                f"showing {start + 1 if books else 0}–{start + len(books)}")
+    for book in books:
+        render_card(book)
+    has_next = start + SEARCH_PAGE_SIZE < len(sess["books"]) or not sess["exhausted"]
+    p1, p2, p3 = st.columns([1, 4, 1])
+    with p1:
+        if st.button("⬅️ Prev", key=f"{key}_prev", disabled=sess["page"] == 0, use_container_width=True):
+            sess["page"] -= 1; rerun()
+    with p2:
+        st.markdown(f"<div class='book-meta' style='text-align:center'>Page {sess['page'] + 1}</div>",
+                    unsafe_allow_html=True)
+    with p3:
+        if st.button("Next ➡️", key=f"{key}_next", disabled=not has_next, use_container_width=True):
+            sess["page"] += 1; rerun()
+    prefetch_next_search_page(sess)
+
+
+# ─── Autocomplete ────────────────────────────────────────────────────────────
+# Text inputs only rerun on Enter or blur, so suggestions for what was typed so far show as
+# pills under the input; picking one fills it in (and the fields its record knows).
+def render_suggestions(typed, key, on_pick, field=None):
+    suggestions = suggest(typed, field) if typed else []
+    if not suggestions or any(s["text"].lower() == typed.strip().lower() for s in suggestions):
+        return
+    def picked():
+        i, st.session_state[key] = st.session_state[key], None
+        if i is not None:
+            on_pick(suggestions[i])
+    st.pills("Suggestions", range(len(suggestions)), key=key, on_change=picked, label_visibility="collapsed",
+             format_func=lambda i: ("📚 " if suggestions[i]["source"] == "library" else "") + suggestions[i]["text"])
+
+def pick_search(source, input_key):
+    def pick(s):
+        st.session_state[input_key] = s["text"]
+        st.session_state.search_active[source] = s["text"]
+    return pick
+
+def pick_manual_book(s):
+    if s["field"] == "author":
+        st.session_state.add_author = s["text"]
+        return
+    st.session_state.add_title = s["text"]
+    for field, key in (("author", "add_author"), ("year", "add_year"), ("isbn", "add_isbn"),
+                       ("gutenberg_id", "add_gid"), ("pages", "add_pages")):
+        if s.get(field):
+            st.session_state[key] = s[field]
 
 # ─── Sidebar ─────────────────────────────────────────────────────────────────
 with st.sidebar:
@@ -761,20 +508,38 @@ with st.sidebar:
         st.markdown("<div style=\'color:#e0b870;font-size:0.85rem\'>🔑 Enter key to use AI Chat</div>", unsafe_allow_html=True)
 
     st.markdown("---")
-    page = st.radio("Navigate", ["💬 Chat", "📖 My Library", "🔍 Quick Search", "📑 Read a Book", "📊 Stats"], key="nav")
+    page = st.radio("Navigate", ["💬 Chat", "📖 My Library", "🔍 Quick Search", "📑 Read a Book", "📊 Stats", "📈 Metrics"], key="nav")
+    if page.split(" ", 1)[1] != st.session_state.page:
+        flush_progress()  # write buffered progress before leaving a page
     st.session_state.page = page.split(" ", 1)[1]
 
     st.markdown("---")
-    lib = st.session_state.personal_library
-    st.markdown(f"**Collection:** {len(lib)} books")
-    rc = sum(1 for b in lib if b.get("status") == "reading")
-    fc = sum(1 for b in lib if b.get("status") == "finished")
+    counts = get_library_counts()
+    st.markdown(f"**Collection:** {counts['total']} books")
+    rc, fc = counts.get("reading", 0), counts.get("finished", 0)
     if rc: st.markdown(f"📖 {rc} currently reading")
     if fc: st.markdown(f"✅ {fc} finished")
 
-    if st.button("🗑️ Clear Chat"):
-        st.session_state.messages = []
-        st.rerun()
+    if st.session_state.job_ids:
+        pending = any(j["status"] in ("queued", "running") for j in get_jobs(st.session_state.job_ids))
+        st.fragment(render_jobs_panel, run_every=JOBS_POLL_S if pending else None)()
+
+    convs = {c["id"]: c["title"] for c in db_list_conversations()}
+    cur = st.session_state.conversation_id
+    if cur is not None and cur not in convs:
+        convs[cur] = "Current conversation"
+    options = [0] + list(convs)  # 0 = start a new conversation
+    chosen = st.selectbox("Conversation", options, index=options.index(cur or 0),
+                          format_func=lambda c: "✨ New conversation" if not c else (convs[c] or f"#{c}")[:40])
+    if (chosen or None) != cur:
+        open_conversation(st.session_state, chosen or None)
+        rerun()
+
+    if st.button("🗑️ Delete Chat"):
+        if cur is not None:
+            db_delete_conversation(cur)
+        open_conversation(st.session_state, None)
+        rerun()
 
     st.markdown("---")
     st.markdown("""
@@ -788,6 +553,10 @@ with st.sidebar:
 • "Recommend something adventurous"
 </div>""", unsafe_allow_html=True)
 
+    dev_panel = st.expander("🛠️ Developer")
+    dev_panel.toggle("Profile each rerun", key="dev_profile",
+                     help=f"cProfile + tracemalloc around every script run; dumps go to {PROFILE_DIR}/")
+
 # ─── Header ──────────────────────────────────────────────────────────────────
 st.markdown("""
 <div class='app-header'>
@@ -801,11 +570,14 @@ current_page = st.session_state.page
 # CHAT
 # ══════════════════════════════════════════════════════════════════════════════
 if current_page == "Chat":
-    for msg in st.session_state.messages:
-        if msg["role"] == "user":
-            st.markdown(f"<div class='user-msg'>🧑 {msg['content']}</div>", unsafe_allow_html=True)
-        elif msg["role"] == "assistant":
-            st.markdown(f"<div class='assistant-msg'>📚 {msg['content']}</div>", unsafe_allow_html=True)
+    if st.session_state.has_earlier:
+        if st.button("⬆️ Load earlier messages"):
+            load_earlier_messages(st.session_state); rerun()
+    # One element for the whole visible window instead of one per message.
+    st.markdown("".join(
+        f"<div class='user-msg'>🧑 {msg['content']}</div>" if msg["role"] == "user" else
+        f"<div class='assistant-msg'>📚 {msg['content']}</div>"
+        for msg in st.session_state.messages), unsafe_allow_html=True)
 
     st.markdown("<br>", unsafe_allow_html=True)
     col1, col2 = st.columns([6, 1])
@@ -829,7 +601,8 @@ if current_page == "Chat":
         tc = st.container()
         full = ""
         with st.spinner("The librarian is thinking..."):
-            for etype, content in run_agent(user_input):
+            for etype, content in run_agent(user_input, st.session_state,
+                                             st.session_state.anthropic_api_key):
                 if etype == "text":
                     full += content
                     rp.markdown(f"<div class='assistant-msg'>📚 {full}</div>", unsafe_allow_html=True)
@@ -838,14 +611,14 @@ if current_page == "Chat":
                         st.markdown(f"<div class='tool-call'>{content}</div>", unsafe_allow_html=True)
                 elif etype == "error":
                     st.error(content)
-        st.rerun()
+        rerun()
 
 # ══════════════════════════════════════════════════════════════════════════════
 # MY LIBRARY
 # ══════════════════════════════════════════════════════════════════════════════
 elif current_page == "My Library":
     st.markdown("### 📖 Your Personal Collection")
-    library = st.session_state.personal_library
+    library = get_library()
 
     if not library:
         st.markdown("""<div class='status-box'>
@@ -861,16 +634,15 @@ elif current_page == "My Library":
         with f3:
             sf = st.selectbox("Status", ["All","unread","reading","finished"], label_visibility="collapsed")
 
-        books = library
-        if search:
-            sq = search.lower()
-            books = [b for b in books if sq in b["title"].lower() or sq in b["author"].lower()]
+        books = search_library(search) if search else library  # best matches first, typos allowed
         if gf != "All":
             books = [b for b in books if b.get("genre","") == gf]
         if sf != "All":
             books = [b for b in books if b.get("status") == sf]
 
         st.markdown(f"**{len(books)} book{'s' if len(books)!=1 else ''}**")
+        if search and books and books[0]["match_score"] < 1:
+            st.caption(f"No exact match for “{search}” — showing the closest titles and authors.")
 
         for book in books:
             c1, c2, c3 = st.columns([5, 1, 1])
@@ -904,11 +676,11 @@ elif current_page == "My Library":
                         st.session_state.reading_content = ""
                         st.session_state.reading_offset = 0
                         st.session_state.page = "Read a Book"
-                        st.rerun()
+                        rerun()
             with c3:
                 st.markdown("<br>", unsafe_allow_html=True)
                 if st.button("🗑️", key=f"del_{book['id']}", help="Remove"):
-                    db_remove_book(book["id"]); sync_library(); st.rerun()
+                    db_remove_book(book["id"]); rerun()
 
             with st.expander(f"✏️ Edit progress & rating — {book['title'][:40]}"):
                 ec1, ec2, ec3 = st.columns(3)
@@ -923,24 +695,50 @@ elif current_page == "My Library":
                     nrat = st.slider("Rating ★", 0, 5, value=book.get("rating",0) or 0, key=f"r_{book['id']}")
                 nrev = st.text_area("Review", value=book.get("review","") or "", key=f"rv_{book['id']}", height=60)
                 if st.button("💾 Save", key=f"sv_{book['id']}"):
-                    db_update_progress(book["id"], cpg or None, tpg or None, new_status, nrat or None, nrev or None)
-                    sync_library(); st.success("Saved!"); st.rerun()
+                    db_record_progress(book["id"], cpg or None, tpg or None, new_status, nrat or None, nrev or None)
+                    st.success("Saved!"); rerun()
+
+        with st.expander("🔁 Possible duplicates"):
+            # Computed on request: the report compares every book (cached until the library changes).
+            if st.button("Check for duplicates", key="dup_check"):
+                st.session_state.show_duplicates = True
+            if st.session_state.get("show_duplicates"):
+                pairs = find_duplicate_books()
+                if not pairs:
+                    st.markdown("No likely duplicates found.")
+                for i, pair in enumerate(pairs):
+                    d1, d2, d3 = st.columns([4, 1, 1])
+                    with d1:
+                        st.markdown(f"**{pair['titles'][0]}** ({pair['authors'][0]}) · "
+                                    f"**{pair['titles'][1]}** ({pair['authors'][1]})  \n"
+                                    f"<span class='book-meta'>title match {pair['title_similarity']:.0%}</span>",
+                                    unsafe_allow_html=True)
+                    for col, book_id in zip((d2, d3), pair["book_ids"]):
+                        with col:
+                            if st.button(f"🗑️ #{book_id}", key=f"dup_del_{i}_{book_id}", help="Remove this copy"):
+                                db_remove_book(book_id); rerun()
 
     st.markdown("---")
     with st.expander("➕ Add a Book Manually"):
         c1, c2 = st.columns(2)
         with c1:
-            mt = st.text_input("Title *"); ma = st.text_input("Author *")
-            mg = st.text_input("Genre"); mgid = st.number_input("Gutenberg ID (optional)", min_value=0, value=0)
+            mt = st.text_input("Title *", key="add_title")
+            render_suggestions(mt, "add_title_sugg", pick_manual_book, "title")
+            ma = st.text_input("Author *", key="add_author")
+            render_suggestions(ma, "add_author_sugg", pick_manual_book, "author")
+            mg = st.text_input("Genre"); mgid = st.number_input("Gutenberg ID (optional)", min_value=0, key="add_gid")
         with c2:
-            myr = st.number_input("Year", min_value=0, max_value=2100, value=0)
-            misbn = st.text_input("ISBN"); mpg = st.number_input("Total pages", min_value=0, value=0)
+            myr = st.number_input("Year", min_value=0, max_value=2100, key="add_year")
+            misbn = st.text_input("ISBN", key="add_isbn"); mpg = st.number_input("Total pages", min_value=0, key="add_pages")
             mn = st.text_area("Notes", height=68)
         if st.button("Add Book"):
             if mt and ma:
-                db_add_book(mt, ma, mg, mn, int(myr) if myr else None, misbn, "",
-                            "", int(mgid) if mgid else None, int(mpg) if mpg else 0)
-                sync_library(); st.success(f"✅ '{mt}' added!"); st.rerun()
+                _, created = add_book(mt, ma, mg, mn, int(myr) if myr else None, misbn, "",
+                                            "", int(mgid) if mgid else None, int(mpg) if mpg else 0)
+                if created:
+                    st.success(f"✅ '{mt}' added!"); rerun()
+                else:
+                    st.warning("A book with that ISBN or Gutenberg ID is already in your library.")
             else:
                 st.error("Title and author are required.")
 
@@ -958,36 +756,12 @@ elif current_page == "Quick Search":
         with bc:
             do_ol = st.button("Search", key="ol_go", use_container_width=True)
         if do_ol and q:
-            with st.spinner("Searching..."):
-                res = search_open_library(q, 12)
-            if res["success"]:
-                st.markdown(f"**{res['total']:,} results** — top {len(res['books'])}")
-                for book in res["books"]:
-                    authors = ", ".join(book["authors"][:2]) if book["authors"] else "Unknown"
-                    yr = f" ({book['year']})" if book.get("year") else ""
-                    pgs = f" • {book['pages']} pages" if book.get("pages") else ""
-                    subj = ", ".join(book["subjects"][:3]) if book.get("subjects") else ""
-                    cov = (f"<img src='https://covers.openlibrary.org/b/id/{book['cover_id']}-M.jpg' "
-                           f"style='width:55px;height:75px;object-fit:cover;border-radius:4px;float:left;margin-right:14px'/>"
-                           if book.get("cover_id") else "")
-                    c1, c2 = st.columns([5, 1])
-                    with c1:
-                        st.markdown(f"""
-<div class='book-card'>{cov}
-    <div><div class='book-title'>{book['title']}</div>
-    <div class='book-author'>by {authors}{yr}</div>
-    <div class='book-meta'><span class='book-badge'>Open Library</span>{pgs}</div>
-    {"<div class='book-meta'>🏷️ "+subj+"</div>" if subj else ""}
-    </div></div>""", unsafe_allow_html=True)
-                    with c2:
-                        st.markdown("<br><br>", unsafe_allow_html=True)
-                        if st.button("+ Add", key=f"oladd_{book.get('isbn','')}{book['title'][:8]}"):
-                            db_add_book(book["title"], ", ".join(book["authors"][:2]),
-                                        subj.split(",")[0].strip() if subj else "",
-                                        "", book.get("year"), book.get("isbn") or "")
-                            sync_library(); st.success("Added!")
-            else:
-                st.error(res.get("error"))
+            st.session_state.search_active["open_library"] = q
+        if q != st.session_state.search_active.get("open_library"):
+            render_suggestions(q, "ol_sugg", pick_search("open_library", "ol_q"))
+        if st.session_state.search_active.get("open_library"):
+            render_search_results(get_search_session("open_library", st.session_state.search_active["open_library"]),
+                                  render_ol_result, "ol")
 
     with tab2:
         st.markdown("Search thousands of **free** books from Project Gutenberg — readable right inside the app!")
@@ -997,59 +771,19 @@ elif current_page == "Quick Search":
         with bc2:
             do_gut = st.button("Search", key="gut_go", use_container_width=True)
         if do_gut and gq:
-            with st.spinner("Searching Gutenberg..."):
-                gres = search_gutenberg(gq, 10)
-            if gres["success"]:
-                st.markdown(f"**{gres['total']:,} free books** — top {len(gres['books'])}")
-                for book in gres["books"]:
-                    authors = ", ".join(book["authors"]) if book["authors"] else "Unknown"
-                    subj = ", ".join(book["subjects"][:3]) if book.get("subjects") else ""
-                    cov = (f"<img src='{book['cover_url']}' style='width:55px;height:75px;object-fit:cover;border-radius:4px;float:left;margin-right:14px'/>"
-                           if book.get("cover_url") else "")
-                    c1, c2, c3 = st.columns([4, 1, 1])
-                    with c1:
-                        st.markdown(f"""
-<div class='book-card'>{cov}
-    <div><div class='book-title'>{book['title']}</div>
-    <div class='book-author'>by {authors}</div>
-    <div class='book-meta'>
-        <span class='book-badge badge-ebook'>📖 Free eBook</span>
-        <span class='book-badge'>ID #{book['gutenberg_id']}</span>
-        ⬇️ {book['download_count']:,}
-    </div>
-    {"<div class='book-meta'>🏷️ "+subj+"</div>" if subj else ""}
-    </div></div>""", unsafe_allow_html=True)
-                    with c2:
-                        st.markdown("<br><br>", unsafe_allow_html=True)
-                        if st.button("+ Add", key=f"gadd_{book['gutenberg_id']}"):
-                            db_add_book(book["title"], authors,
-                                        subj.split(",")[0].strip() if subj else "",
-                                        "", None, "", book.get("cover_url",""), "", book["gutenberg_id"])
-                            sync_library(); st.success("Added!")
-                    with c3:
-                        st.markdown("<br><br>", unsafe_allow_html=True)
-                        if st.button("📖 Read", key=f"gread_{book['gutenberg_id']}"):
-                            existing = [b for b in db_load_library() if b.get("gutenberg_id") == book["gutenberg_id"]]
-                            if not existing:
-                                nid = db_add_book(book["title"], authors, "", "", None, "",
-                                                  book.get("cover_url",""), "", book["gutenberg_id"])
-                                sync_library()
-                                st.session_state.reading_book_id = nid
-                            else:
-                                st.session_state.reading_book_id = existing[0]["id"]
-                            st.session_state.reading_content = ""
-                            st.session_state.reading_offset = 0
-                            st.session_state.page = "Read a Book"
-                            st.rerun()
-            else:
-                st.error(gres.get("error"))
+            st.session_state.search_active["gutenberg"] = gq
+        if gq != st.session_state.search_active.get("gutenberg"):
+            render_suggestions(gq, "gut_sugg", pick_search("gutenberg", "gut_q"))
+        if st.session_state.search_active.get("gutenberg"):
+            render_search_results(get_search_session("gutenberg", st.session_state.search_active["gutenberg"]),
+                                  render_gutenberg_result, "gut")
 
 # ══════════════════════════════════════════════════════════════════════════════
 # READ A BOOK
 # ══════════════════════════════════════════════════════════════════════════════
 elif current_page == "Read a Book":
     st.markdown("### 📑 Read a Book")
-    gutenberg_books = [b for b in st.session_state.personal_library if b.get("gutenberg_id")]
+    gutenberg_books = [b for b in get_library() if b.get("gutenberg_id")]
 
     if not gutenberg_books:
         st.markdown("""<div class='status-box'>
@@ -1083,13 +817,12 @@ or ask the AI in Chat to find and add one for you!
 
             if not st.session_state.reading_content:
                 with st.spinner("Loading content from Project Gutenberg..."):
-                    result = fetch_gutenberg_content(book["gutenberg_id"], 0)
+                    result = cached_remote(fetch_gutenberg_content, gutenberg_id=book["gutenberg_id"], offset=0)
                     if result["success"]:
                         st.session_state.reading_content = result["content"]
                         st.session_state.reading_offset = result["next_offset"]
                         if book.get("status") == "unread":
-                            db_update_progress(book["id"], status="reading")
-                            sync_library()
+                            db_record_progress(book["id"], status="reading")
                     else:
                         st.error(f"Could not load: {result.get('error')}")
 
@@ -1102,26 +835,53 @@ or ask the AI in Chat to find and add one for you!
                     if st.button("⬅️ Previous section"):
                         new_off = max(0, st.session_state.reading_offset - 24000)
                         with st.spinner("Loading..."):
-                            r = fetch_gutenberg_content(book["gutenberg_id"], new_off)
+                            r = cached_remote(fetch_gutenberg_content, gutenberg_id=book["gutenberg_id"], offset=new_off)
                             if r["success"]:
                                 st.session_state.reading_content = r["content"]
                                 st.session_state.reading_offset = new_off + 12000
-                        st.rerun()
+                        rerun()
                 with nav2:
                     if st.button("➡️ Next section"):
                         with st.spinner("Loading..."):
-                            r = fetch_gutenberg_content(book["gutenberg_id"], st.session_state.reading_offset)
+                            r = cached_remote(fetch_gutenberg_content, gutenberg_id=book["gutenberg_id"],
+                                               offset=st.session_state.reading_offset)
                             if r["success"]:
                                 st.session_state.reading_content = r["content"]
                                 st.session_state.reading_offset = r["next_offset"]
+                                autosave_position(book, r["next_offset"])
                             else:
                                 st.info("You may have reached the end of the book!")
-                        st.rerun()
+                        rerun()
                 with nav3:
                     if st.button("🔄 Back to beginning"):
                         st.session_state.reading_content = ""
                         st.session_state.reading_offset = 0
-                        st.rerun()
+                        rerun()
+
+            with st.expander("🔎 Ask about this book"):
+                aq = st.text_input("Question", placeholder="e.g. Who does Elizabeth marry?", key="ask_q")
+                indexed = db_has_book_text(book["gutenberg_id"])
+                if not indexed and any(j["kind"] == "index_book" and j["status"] in ("queued", "running")
+                                       and j["payload"]["gutenberg_id"] == book["gutenberg_id"]
+                                       for j in get_jobs(st.session_state.job_ids)):
+                    st.info("Downloading and indexing the full text in the background — "
+                            "ask once the sidebar shows it done.")
+                elif st.button("Find passages", key="ask_go") and aq:
+                    if not indexed and workers_available():
+                        track_jobs([enqueue("index_book", {"gutenberg_id": book["gutenberg_id"]},
+                                            PRIORITY_INTERACTIVE_JOB)])
+                        rerun()
+                    with st.spinner("Searching the full text..." if indexed else
+                                    "Indexing and searching the full text..."):
+                        ares = search_book_passages(book["gutenberg_id"], aq)
+                    if ares["success"]:
+                        if not ares["passages"]:
+                            st.info("No matching passages found.")
+                        for p in ares["passages"]:
+                            st.markdown(f"<div class='book-meta'>Passage {p['passage']} • score {p['score']}</div>"
+                                        f"<div class='status-box'>{p['text']}</div>", unsafe_allow_html=True)
+                    else:
+                        st.error(ares.get("error"))
 
             st.markdown("---")
             st.markdown("**Update your progress:**")
@@ -1138,15 +898,15 @@ or ask the AI in Chat to find and add one for you!
                 nrat = st.slider("Rating ★", 0, 5, value=book.get("rating",0) or 0, key="rrat")
             nrev = st.text_area("Review", value=book.get("review","") or "", key="rrev", height=60)
             if st.button("💾 Save Progress"):
-                db_update_progress(book["id"], npg or None, ntpg or None, nst, nrat or None, nrev or None)
-                sync_library(); st.success("Progress saved! ✅"); st.rerun()
+                db_record_progress(book["id"], npg or None, ntpg or None, nst, nrat or None, nrev or None)
+                st.success("Progress saved! ✅"); rerun()
 
 # ══════════════════════════════════════════════════════════════════════════════
 # STATS
 # ══════════════════════════════════════════════════════════════════════════════
 elif current_page == "Stats":
     st.markdown("### 📊 Your Reading Stats")
-    library = st.session_state.personal_library
+    library = get_library()
 
     if not library:
         st.markdown("<div class='status-box'>Add some books to see your stats!</div>", unsafe_allow_html=True)
@@ -1175,6 +935,26 @@ elif current_page == "Stats":
             st.markdown(f"**Average Rating:** {render_stars(round(avg_rating))} "
                         f"({avg_rating}/5 across {len(rated)} rated books)", unsafe_allow_html=True)
 
+        activity = reading_analytics()
+        if activity["monthly"]:
+            st.markdown("**Reading Activity:**")
+            a1, a2, a3, a4 = st.columns(4)
+            a1.metric("Pages, last 7 days", f"{activity['pages_7d']:,}")
+            a2.metric("Pages, last 30 days", f"{activity['pages_30d']:,}")
+            a3.metric("Current streak", f"{activity['streaks']['current']} days")
+            a4.metric("Longest streak", f"{activity['streaks']['longest']} days")
+            if activity["pages_30d"]:
+                st.bar_chart(activity["pages_per_day"], x="day", y="pages", height=200)
+            for v in activity["velocity"]:
+                finish = f" • finish ≈ {v['projected_finish']}" if v["projected_finish"] else ""
+                st.markdown(f"<div class='book-meta'>📖 <b>{v['title']}</b> — {v['pages_per_day']} pages/day"
+                            f" • {v['pages_left']} pages left{finish}</div>", unsafe_allow_html=True)
+            tm, ty = st.tabs(["By month", "By year"])
+            with tm:
+                st.dataframe(activity["monthly"], hide_index=True, use_container_width=True)
+            with ty:
+                st.dataframe(activity["yearly"], hide_index=True, use_container_width=True)
+
         genres = {}
         for b in library:
             g = b.get("genre","Unknown") or "Unknown"
@@ -1216,3 +996,77 @@ elif current_page == "Stats":
     {ph}
     {"<div class='book-meta'>Started "+b['started_at']+"</div>" if b.get('started_at') else ""}
 </div>""", unsafe_allow_html=True)
+
+# ══════════════════════════════════════════════════════════════════════════════
+# METRICS
+# ══════════════════════════════════════════════════════════════════════════════
+elif current_page == "Metrics":
+    st.markdown("### 📈 Performance Metrics")
+    metrics = get_metrics()
+    rows = metrics.snapshot()
+
+    if not rows:
+        st.markdown("<div class='status-box'>No calls recorded yet — use Chat, Quick Search or the reader first.</div>",
+                    unsafe_allow_html=True)
+    else:
+        kinds = sorted(set(r["kind"] for r in rows))
+        kf = st.selectbox("Kind", ["All"] + kinds, label_visibility="collapsed")
+        st.dataframe([r for r in rows if kf == "All" or r["kind"] == kf],
+                     use_container_width=True, hide_index=True)
+        st.caption("Payload: JSON chars for tools, rows for db, body bytes for http, tokens for gemini, "
+                   "queue depth on arrival for gemini_queue (latency there is time spent waiting for a slot). "
+                   "Percentiles are over the last 1000 calls of each series.")
+        for r in rows:
+            budget = COLD_START_BUDGET_MS if r["name"] == "cold_start" else RERUN_BUDGET_MS
+            if r["kind"] == "rerun" and r["p95_ms"] > budget:
+                st.warning(f"⏱️ {r['name']} reruns: p95 {r['p95_ms']} ms is over the {budget:.0f} ms budget.")
+
+    if st.session_state.anthropic_api_key:
+        queued = get_scheduler(st.session_state.anthropic_api_key).depth()
+        st.caption(f"Gemini queue: {queued} waiting · limit {GEMINI_RPM:g} requests/min, "
+                   f"burst {GEMINI_BURST}.")
+
+    breakers = breaker_states()
+    if breakers:
+        st.caption("Upstreams: " + " · ".join(
+            f"{'🟢' if state == 'closed' else '🟡' if state == 'half_open' else '🔴'} {host} {state.replace('_', '-')}"
+            for host, state in sorted(breakers.items())))
+
+    caches = metrics.cache_snapshot()
+    if caches:
+        st.markdown("**Cache hit rates:**")
+        st.dataframe(caches, use_container_width=True, hide_index=True)
+
+    ec1, ec2, ec3 = st.columns(3)
+    with ec1:
+        st.download_button("⬇️ Prometheus text", metrics.to_prometheus(), "library_metrics.prom",
+                           use_container_width=True)
+    with ec2:
+        st.download_button("⬇️ JSONL snapshot", metrics.to_jsonl(), "library_metrics.jsonl",
+                           use_container_width=True)
+    with ec3:
+        if st.button("♻️ Reset metrics", use_container_width=True):
+            metrics.reset(); rerun()
+        if st.button("🧹 Clear shared caches", use_container_width=True):
+            clear_shared_caches(); clear_catalog_suggestions(); reset_breakers(); rerun()
+    if METRICS_EXPORT_PATH:
+        st.caption(f"Exporting every {METRICS_EXPORT_INTERVAL_S}s to `{METRICS_EXPORT_PATH}`.")
+
+record_rerun_time(current_page)
+if _profile:
+    st.session_state._run_profile = None
+    report = _profile.stop(current_page)
+    if report is None:  # ran past PROFILE_STALE_S and another session's rerun took the profiler
+        _profile_skipped = "another rerun took over the profiler while this one ran."
+if _profile_skipped:
+    dev_panel.caption(f"This rerun wasn't profiled: {_profile_skipped}")
+elif _profile:
+    with dev_panel:
+        st.caption(f"{report['name']} rerun at {report['at']}: {report['wall_ms']:.0f} ms profiled, "
+                   f"peak {report['peak_kb'] / 1024:.1f} MB traced. Saved `{report['prof_path']}` "
+                   f"and `{report['json_path']}`.")
+        st.markdown("**Top functions (cumulative)**")
+        st.dataframe(report["functions"], use_container_width=True, hide_index=True)
+        st.markdown("**Top allocation sites (still held)**")
+        st.dataframe(report["allocations"], use_container_width=True, hide_index=True)
+get_metrics().maybe_export(METRICS_EXPORT_PATH)
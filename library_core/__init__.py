@@ -0,0 +1,29 @@
+"""
+Headless core of the AI-Powered Library: SQLite persistence, agent tools, the Gemini agent loop
+and shared caches/metrics. No Streamlit dependency — library.py is the UI over this package,
+and `python -m library_core` exposes the same tools and agent as a CLI and JSON HTTP API.
+"""
+
+from .agent import (CHAT_CONTEXT_MESSAGES, CHAT_PAGE_SIZE, ChatSession, load_earlier_messages,
+                    open_conversation, persist_new_messages, run_agent)
+from .analytics import (book_velocity, pages_per_day, reading_analytics, reading_rollup,
+                        reading_streaks)
+from .autocomplete import clear_catalog_suggestions, suggest
+from .caches import (cached_remote, clear_shared_caches, get_library, get_library_counts,
+                     get_prefetcher)
+from .db import (check_library_changes, db_add_book, db_delete_conversation, db_fill_book_blanks,
+                 db_get_book, db_get_book_by_gutenberg_id, db_has_book_text, db_list_conversations,
+                 db_load_messages, db_path, db_record_progress, db_remove_book, db_update_progress,
+                 db_upsert_book, flush_progress, get_db, invalidate_library)
+from .fuzzy import find_duplicate_books, search_library
+from .gemini import (GEMINI_BURST, GEMINI_MODEL, GEMINI_RPM, PRIORITY_BACKGROUND,
+                     PRIORITY_INTERACTIVE, get_client, get_scheduler)
+from .jobs import (JOB_WORKERS, PRIORITY_INTERACTIVE_JOB, PRIORITY_PREFETCH_JOB, enqueue,
+                   enqueue_book_followups, ensure_worker_pool, get_job, get_jobs, job_counts,
+                   list_jobs, prune_jobs, workers_available)
+from .metrics import METRICS_EXPORT_INTERVAL_S, METRICS_EXPORT_PATH, get_metrics, timed
+from .profiling import PROFILE_DIR, ProfilerBusyError, RunProfile
+from .remote import (BudgetExhaustedError, CircuitOpenError, breaker_states, http_get, latency_budget,
+                     reset_breakers)
+from .tools import (TOOL_MAP, TOOLS, fetch_gutenberg_content, find_duplicates, get_book_details,
+                    get_reading_stats, search_book_passages, search_books, search_gutenberg, search_open_library)
@@ -0,0 +1,268 @@
+"""The chat agent: conversation state, persisted history and the Gemini tool-calling loop."""
+
+import json
+import os
+import time
+
+from .db import db_add_messages, db_create_conversation, db_load_messages
+from .gemini import (GEMINI_MODEL, PRIORITY_INTERACTIVE, GeminiDeadlineExceeded, _build_gemini_tools,
+                     _is_cache_gone, get_client, get_prompt_cache, get_scheduler)
+from .metrics import get_metrics, timed
+from .remote import latency_budget
+from .tools import TOOL_MAP, prefetch_book_details
+
+# ─── Chat History ────────────────────────────────────────────────────────────
+# Only the newest CHAT_PAGE_SIZE messages of a conversation are loaded and rendered; older
+# ones are fetched page by page on request. The model sees the last CHAT_CONTEXT_MESSAGES.
+CHAT_PAGE_SIZE = 30
+CHAT_CONTEXT_MESSAGES = 20
+
+
+class ChatSession:
+    """Chat state for one conversation.
+
+    The functions below only use the `messages`, `conversation_id` and `has_earlier`
+    attributes, so the Streamlit UI passes st.session_state in place of a ChatSession.
+    """
+
+    def __init__(self, conversation_id=None):
+        self.messages = []
+        self.conversation_id = None
+        self.has_earlier = False
+        if conversation_id is not None:
+            open_conversation(self, conversation_id)
+
+
+def open_conversation(session, conversation_id):
+    msgs = db_load_messages(conversation_id, limit=CHAT_PAGE_SIZE + 1) if conversation_id else []
+    session.conversation_id = conversation_id
+    session.has_earlier = len(msgs) > CHAT_PAGE_SIZE
+    session.messages = msgs[-CHAT_PAGE_SIZE:]
+
+def load_earlier_messages(session):
+    older = db_load_messages(session.conversation_id,
+                             before_id=session.messages[0]["id"], limit=CHAT_PAGE_SIZE + 1)
+    session.has_earlier = len(older) > CHAT_PAGE_SIZE
+    session.messages = older[-CHAT_PAGE_SIZE:] + session.messages
+
+def persist_new_messages(session):
+    """Write messages added this turn (those without an id), creating the conversation if needed."""
+    new = [m for m in session.messages if "id" not in m]
+    if not new:
+        return
+    if session.conversation_id is None:
+        session.conversation_id = db_create_conversation(new[0]["content"][:60])
+    ids = db_add_messages(session.conversation_id, [(m["role"], m["content"]) for m in new])
+    for m, mid in zip(new, ids):
+        m["id"] = mid
+    if len(session.messages) > CHAT_PAGE_SIZE:
+        session.messages = session.messages[-CHAT_PAGE_SIZE:]
+        session.has_earlier = True
+
+# ─── Agentic Loop ────────────────────────────────────────────────────────────
+# Guardrails for one chat turn: at most AGENT_MAX_ITERATIONS model calls and AGENT_TURN_BUDGET_S
+# of wall clock, queueing for Gemini included. The last allowed call has function calling
+# disabled so the model must answer; once the budget is spent it gets AGENT_ANSWER_GRACE_S more
+# for that answer. Read-only tools are memoized for the turn; any write tool clears the memo.
+# All tool network calls in a turn share AGENT_TOOL_BUDGET_S, leaving time for the model to answer.
+AGENT_MAX_ITERATIONS = int(os.environ.get("LIBRARY_AGENT_MAX_ITERATIONS", 6))
+AGENT_TURN_BUDGET_S = float(os.environ.get("LIBRARY_AGENT_TURN_BUDGET_S", 60))
+AGENT_TOOL_BUDGET_S = float(os.environ.get("LIBRARY_AGENT_TOOL_BUDGET_S", 30))
+AGENT_ANSWER_GRACE_S = float(os.environ.get("LIBRARY_AGENT_ANSWER_GRACE_S", 15))
+# Opt-in: after a search, fetch details of its top results in the background (the model often
+# asks for them next), at most AGENT_PREFETCH_MAX_PER_TURN per turn.
+AGENT_PREFETCH_DETAILS = int(os.environ.get("LIBRARY_AGENT_PREFETCH_DETAILS", 0))
+AGENT_PREFETCH_MAX_PER_TURN = 6
+SEARCH_TOOLS = {"search_books", "search_open_library"}
+READ_ONLY_TOOLS = {"search_books", "search_open_library", "get_book_details", "search_gutenberg",
+                   "fetch_gutenberg_content", "search_book_passages", "list_personal_library",
+                   "get_recommendations", "get_reading_stats", "find_duplicates"}
+
+
+class _CacheGone(Exception):
+    """The prompt's cached content is gone server-side; resend the request uncached."""
+
+
+def run_agent(user_message: str, session, api_key: str, priority=PRIORITY_INTERACTIVE,
+              prefetch_details=AGENT_PREFETCH_DETAILS):
+    """Run one chat turn, yielding ("text" | "tool_call" | "tool_result" | "error", str) events.
+
+    The user message and the reply are appended to `session.messages` and persisted.
+    """
+    client = get_client(api_key)
+    if not client:
+        yield ("error", "⚠️ A Gemini API key is required — get one at https://aistudio.google.com/apikey")
+        return
+    from google.genai import types as genai_types
+
+    system_prompt = """You are a knowledgeable and passionate library assistant AI. You help users discover, manage, and READ books.
+
+You have access to:
+1. Open Library API — search millions of real books from the internet
+2. Project Gutenberg — search and fetch full text of thousands of FREE classic books
+3. Personal Library — the user's own collection with persistent reading progress and ratings
+
+Guidelines:
+- Use search_books to search Open Library and Gutenberg in one call when asked about books; use the single-source searches only for paging or source-specific questions
+- If a Gutenberg book is found, always mention they can read it for free
+- When adding books found on Gutenberg, always include the gutenberg_id
+- Use update_reading_progress to log status, pages, ratings and reviews
+- Use get_reading_stats for questions about reading pace, streaks, totals or when a book will be finished
+- Use find_duplicates when asked to tidy the library or whether a book was added twice; confirm before removing anything
+- When someone wants to read, use fetch_gutenberg_content
+- For questions about what happens in a Gutenberg book, use search_book_passages and answer from the returned passages
+- Be warm, literary, and enthusiastic. Recommend related books proactively.
+"""
+
+    # Build message history for the new SDK format (recent window only)
+    history = []
+    for m in session.messages[-CHAT_CONTEXT_MESSAGES:]:
+        role = "user" if m["role"] == "user" else "model"
+        history.append(genai_types.Content(role=role, parts=[genai_types.Part(text=m["content"])]))
+
+    session.messages.append({"role": "user", "content": user_message})
+
+    gemini_tools = _build_gemini_tools()
+    config = genai_types.GenerateContentConfig(
+        system_instruction=system_prompt,
+        tools=gemini_tools,
+    )
+    # Cached content cannot be combined with a request-level tool_config, so the final
+    # tools-disabled call always sends the full prefix.
+    final_config = config.model_copy(update={"tool_config": genai_types.ToolConfig(
+        function_calling_config=genai_types.FunctionCallingConfig(mode="NONE"))})
+    prompt_cache = get_prompt_cache(api_key)
+    scheduler = get_scheduler(api_key)
+    turn_t0 = time.monotonic()
+    turn_deadline = turn_t0 + AGENT_TURN_BUDGET_S
+    cache_name = prompt_cache.get(client, GEMINI_MODEL, system_prompt, gemini_tools, scheduler, priority,
+                                  turn_deadline)
+
+    try:
+        # Start with full history + new user message
+        contents = history + [genai_types.Content(role="user", parts=[genai_types.Part(text=user_message)])]
+
+        memo = {}
+        prefetched = 0
+
+        def generate(final):
+            nonlocal cache_name
+            cfg = (final_config if final else
+                   genai_types.GenerateContentConfig(cached_content=cache_name) if cache_name else config)
+            try:
+                with timed("gemini", GEMINI_MODEL) as m:
+                    response = client.models.generate_content(
+                        model=GEMINI_MODEL,
+                        contents=contents,
+                        config=cfg,
+                    )
+                    usage = getattr(response, "usage_metadata", None)
+                    m["payload"] = getattr(usage, "total_token_count", 0) or 0
+            except Exception as e:
+                if not cfg.cached_content or not _is_cache_gone(e):
+                    raise
+                # Expired or evicted server-side: drop it; call_model resends the full prefix.
+                prompt_cache.invalidate(cache_name)
+                cache_name = None
+                raise _CacheGone() from e
+            return response
+
+        def call_model(final, deadline):
+            try:
+                return scheduler.call(lambda: generate(final), priority, deadline)
+            except _CacheGone:  # the uncached resend is a request of its own
+                return scheduler.call(lambda: generate(final), priority, deadline)
+
+        for iteration in range(AGENT_MAX_ITERATIONS):
+            final = (iteration == AGENT_MAX_ITERATIONS - 1 or time.monotonic() > turn_deadline)
+            try:
+                response = call_model(final, turn_deadline + AGENT_ANSWER_GRACE_S if final else turn_deadline)
+            except GeminiDeadlineExceeded:
+                if final:
+                    raise
+                final = True  # out of time mid-turn: ask for the answer with what we have
+                response = call_model(final, turn_deadline + AGENT_ANSWER_GRACE_S)
+
+            candidate = response.candidates[0]
+            fn_calls = []
+            text_parts = []
+
+            for part in candidate.content.parts:
+                if part.function_call:
+                    fn_calls.append(part.function_call)
+                elif part.text:
+                    text_parts.append(part.text)
+
+            if text_parts:
+                yield ("text", "\n".join(text_parts))
+
+            # No tool calls (or no budget left for them) — done
+            if not fn_calls or final:
+                if fn_calls:
+                    yield ("tool_result", "🛑 Stopped: this turn reached its tool-call limit.")
+                if text_parts:
+                    session.messages.append({"role": "assistant", "content": "\n".join(text_parts)})
+                persist_new_messages(session)
+                break
+
+            # Append model response to contents
+            contents.append(candidate.content)
+
+            # Execute tools and build function response parts
+            fn_response_parts = []
+            for fc in fn_calls:
+                fn_name = fc.name
+                fn_args = dict(fc.args) if fc.args else {}
+                key = (fn_name, json.dumps(fn_args, sort_keys=True))
+                if fn_name in READ_ONLY_TOOLS and key in memo:
+                    get_metrics().record_cache("turn_memo", True)
+                    result = memo[key]
+                    yield ("tool_result", f"♻️ {fn_name} → reused this turn's result")
+                elif time.monotonic() > turn_deadline:
+                    result = {"success": False, "error": "Turn time budget exhausted; answer with what you have."}
+                    yield ("tool_result", f"⏱️ {fn_name} skipped: turn time budget exhausted")
+                else:
+                    yield ("tool_call", f"🔧 {fn_name}({str(fn_args)[:80]}...)")
+                    fn = TOOL_MAP.get(fn_name)
+                    t0 = time.perf_counter()
+                    with latency_budget(deadline=turn_t0 + AGENT_TOOL_BUDGET_S):
+                        result = fn(**fn_args) if fn else {"error": f"Unknown tool: {fn_name}"}
+                        ms = (time.perf_counter() - t0) * 1000
+                        if fn_name in SEARCH_TOOLS and prefetched < AGENT_PREFETCH_MAX_PER_TURN:
+                            prefetched += prefetch_book_details(
+                                result, min(prefetch_details, AGENT_PREFETCH_MAX_PER_TURN - prefetched))
+                    yield ("tool_result", f"✅ {fn_name} → {len(str(result))} chars in {ms:.0f} ms")
+                    if fn_name in READ_ONLY_TOOLS:
+                        get_metrics().record_cache("turn_memo", False)
+                        memo[key] = result
+                    elif fn:
+                        memo.clear()  # a write may change what the read-only tools return
+                fn_response_parts.append(
+                    genai_types.Part(
+                        function_response=genai_types.FunctionResponse(
+                            name=fn_name,
+                            response={"result": json.dumps(result)},
+                        )
+                    )
+                )
+
+            # Append tool results as a user turn
+            contents.append(genai_types.Content(role="user", parts=fn_response_parts))
+
+    except Exception as e:
+        err_str = str(e)
+        # Roll back the user message on failure
+        if session.messages and session.messages[-1]["role"] == "user":
+            session.messages.pop()
+        if isinstance(e, GeminiDeadlineExceeded):
+            yield ("error", "⏱️ **Turn time budget exhausted** before the model could answer. Please try again.")
+        elif "API_KEY_INVALID" in err_str or ("invalid" in err_str.lower() and "key" in err_str.lower()):
+            yield ("error", "🔑 **Invalid API key.** Check the key. Get yours at https://aistudio.google.com/apikey")
+        elif "PERMISSION_DENIED" in err_str or "403" in err_str:
+            yield ("error", "🚫 **Permission denied.** Your key may not have access to this model.")
+        elif "RESOURCE_EXHAUSTED" in err_str or "429" in err_str:
+            yield ("error", "⏳ **Rate limit reached.** Please wait a moment and try again.")
+        elif "Connection" in err_str or "network" in err_str.lower():
+            yield ("error", "🌐 **Network error.** Check your internet connection and try again.")
+        else:
+            yield ("error", f"❌ **API error:** {err_str[:300]}")
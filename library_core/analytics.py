@@ -0,0 +1,134 @@
+"""
+Reading analytics over the reading_daily rollup (pages read per book per day).
+
+reading_daily is bucketed as progress is written (db._write_progress), so these queries scan
+one row per book per reading day rather than the raw event log; streaks, velocity and rollups
+are SQL window/group aggregations, memoized per library revision.
+"""
+
+import functools
+from datetime import date, timedelta
+
+from .caches import _cache_state, cache_lookup
+from .db import db_path, get_db, get_library_revision
+from .metrics import instrumented
+
+VELOCITY_WINDOW_DAYS = 14
+ACTIVITY_DAYS = 30
+
+
+def _today(today=None):
+    return today or date.today().isoformat()
+
+
+@instrumented("db")
+def pages_per_day(days=ACTIVITY_DAYS, today=None):
+    """Pages read on each of the last `days` days, oldest first, zero-filled."""
+    conn = get_db()
+    rows = conn.execute("""
+        WITH RECURSIVE cal(day) AS (
+            SELECT date(?, ?) UNION ALL SELECT date(day, '+1 day') FROM cal WHERE day < ?)
+        SELECT cal.day, COALESCE(SUM(d.pages), 0) AS pages
+        FROM cal LEFT JOIN reading_daily d ON d.day = cal.day
+        GROUP BY cal.day ORDER BY cal.day
+    """, (_today(today), f"-{days - 1} days", _today(today))).fetchall()
+    conn.close()
+    return [dict(r) for r in rows]
+
+
+@instrumented("db")
+def reading_streaks(today=None):
+    """Current and longest runs of consecutive days with pages read (gaps-and-islands).
+
+    The current streak survives until a full day is missed, so it still counts on a day you
+    haven't read yet.
+    """
+    conn = get_db()
+    runs = conn.execute("""
+        WITH days AS (SELECT day FROM reading_daily GROUP BY day HAVING SUM(pages) > 0),
+        islands AS (SELECT day, julianday(day) - ROW_NUMBER() OVER (ORDER BY day) AS grp FROM days)
+        SELECT MIN(day) AS start, MAX(day) AS end, COUNT(*) AS days FROM islands GROUP BY grp
+    """).fetchall()
+    conn.close()
+    yesterday = (date.fromisoformat(_today(today)) - timedelta(days=1)).isoformat()
+    longest = max(runs, key=lambda r: (r["days"], r["end"]), default=None)
+    current = next((r for r in runs if r["end"] >= yesterday), None)
+    return {"current": current["days"] if current else 0,
+            "longest": longest["days"] if longest else 0,
+            "longest_start": longest["start"] if longest else None,
+            "longest_end": longest["end"] if longest else None}
+
+
+@instrumented("db")
+def book_velocity(window_days=VELOCITY_WINDOW_DAYS, today=None):
+    """Pages/day over the recent window for books being read, with a projected finish date.
+
+    A book started inside the window is averaged over the days since its first reading day,
+    not the whole window.
+    """
+    today = _today(today)
+    conn = get_db()
+    rows = conn.execute("""
+        SELECT b.id, b.title, b.current_page, b.total_pages, r.pages,
+               MIN(?, julianday(?) - julianday((SELECT MIN(day) FROM reading_daily WHERE book_id = b.id)) + 1)
+                   AS span
+        FROM (SELECT book_id, SUM(pages) AS pages FROM reading_daily
+              WHERE day > date(?, ?) GROUP BY book_id) r
+        JOIN books b ON b.id = r.book_id
+        WHERE b.status = 'reading'
+        ORDER BY r.pages DESC
+    """, (window_days, today, today, f"-{window_days} days")).fetchall()
+    conn.close()
+    out = []
+    for r in rows:
+        velocity = r["pages"] / max(1, r["span"])
+        remaining = (r["total_pages"] or 0) - (r["current_page"] or 0)
+        finish = (date.fromisoformat(today) + timedelta(days=-(-remaining // velocity))).isoformat() \
+            if remaining > 0 and velocity > 0 else None
+        out.append({"book_id": r["id"], "title": r["title"], "pages_per_day": round(velocity, 1),
+                    "pages_left": max(0, remaining), "projected_finish": finish})
+    return out
+
+
+@instrumented("db")
+def reading_rollup(period="month"):
+    """Pages, reading days and books finished per month or year, newest first, with a
+    running total of pages."""
+    width = {"month": 7, "year": 4}[period]
+    conn = get_db()
+    rows = conn.execute(f"""
+        WITH p AS (SELECT substr(day, 1, {width}) AS period, SUM(pages) AS pages,
+                          COUNT(DISTINCT day) AS reading_days
+                   FROM reading_daily GROUP BY 1),
+        f AS (SELECT substr(finished_at, 1, {width}) AS period, COUNT(*) AS finished
+              FROM books WHERE status = 'finished' AND finished_at IS NOT NULL GROUP BY 1),
+        periods AS (SELECT period FROM p UNION SELECT period FROM f)
+        SELECT periods.period, COALESCE(p.pages, 0) AS pages, COALESCE(p.reading_days, 0) AS reading_days,
+               COALESCE(f.finished, 0) AS finished,
+               SUM(COALESCE(p.pages, 0)) OVER (ORDER BY periods.period) AS pages_to_date
+        FROM periods LEFT JOIN p USING (period) LEFT JOIN f USING (period)
+        ORDER BY periods.period DESC
+    """).fetchall()
+    conn.close()
+    return [dict(r) for r in rows]
+
+
+@functools.lru_cache(maxsize=4)
+def _analytics_snapshot(path, revision, today):
+    _cache_state.miss = True
+    activity = pages_per_day(today=today)
+    return {
+        "pages_per_day": activity,
+        "pages_7d": sum(d["pages"] for d in activity[-7:]),
+        "pages_30d": sum(d["pages"] for d in activity),
+        "streaks": reading_streaks(today),
+        "velocity": book_velocity(today=today),
+        "monthly": reading_rollup("month"),
+        "yearly": reading_rollup("year"),
+    }
+
+
+def reading_analytics(today=None):
+    """All of the above for the Stats page and the get_reading_stats tool (shared, read-only)."""
+    return cache_lookup("analytics", _analytics_snapshot, db_path(), get_library_revision().value,
+                        _today(today))
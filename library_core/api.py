@@ -0,0 +1,170 @@
+"""
+Minimal JSON HTTP API over the tools and the agent (stdlib only, one thread per request).
+
+    GET  /health                      {"ok": true}
+    GET  /tools                       the tool declarations (TOOLS)
+    POST /tools/<name>                body: tool arguments → tool result
+    POST /chat                        body: {"message", "conversation_id"?, "background"?} → reply and events
+    GET  /conversations/<id>          the newest page of a conversation's messages
+    POST /jobs                        body: {"kind", "payload"?} → queued job id
+    GET  /jobs                        recent jobs and per-status counts
+    GET  /jobs/<id>                   one job's status, attempts and result
+    GET  /metrics                     Prometheus text
+
+The Gemini key comes from the X-Gemini-Key header, else GEMINI_API_KEY in the environment.
+Chat turns with "background": true (batch or scheduled callers nobody is waiting on) queue for
+Gemini behind interactive ones.
+"""
+
+import functools
+import inspect
+import json
+import os
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .agent import CHAT_PAGE_SIZE, ChatSession, run_agent
+from .caches import cached_remote
+from .db import check_library_changes, db_load_messages
+from .gemini import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
+from .jobs import JOB_HANDLERS, enqueue, get_job, job_counts, list_jobs
+from .metrics import get_metrics, timed
+from .tools import TOOL_MAP, TOOLS
+
+MAX_BODY_BYTES = 1 << 20
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def call_tool(name, args):
+    fn = TOOL_MAP.get(name)
+    if fn is None:
+        raise ApiError(404, f"Unknown tool: {name}")
+    if not isinstance(args, dict):
+        raise ApiError(400, "Tool arguments must be a JSON object.")
+    target = fn
+    while isinstance(target, functools.partial) and target.func is cached_remote:
+        target = target.args[0]  # cached_remote(fn, **kwargs) would accept anything
+    try:
+        inspect.signature(target).bind(**args)
+    except TypeError as e:  # missing or unexpected arguments
+        raise ApiError(400, str(e))
+    return fn(**args)
+
+
+def chat(message, conversation_id=None, api_key=None, background=False):
+    """One agent turn; returns the reply, the tool events and the (possibly new) conversation id."""
+    session = ChatSession(conversation_id)
+    events, reply, error = [], [], None
+    priority = PRIORITY_BACKGROUND if background else PRIORITY_INTERACTIVE
+    for etype, content in run_agent(message, session, api_key or os.environ.get("GEMINI_API_KEY", ""),
+                                    priority):
+        if etype == "text":
+            reply.append(content)
+        elif etype == "error":
+            error = content
+        else:
+            events.append({"type": etype, "content": content})
+    return {"success": error is None, "conversation_id": session.conversation_id,
+            "reply": "\n".join(reply), "events": events, **({"error": error} if error else {})}
+
+
+def submit_job(kind, payload=None):
+    if kind not in JOB_HANDLERS:
+        raise ApiError(404, f"Unknown job kind: {kind}")
+    if not isinstance(payload or {}, dict):
+        raise ApiError(400, "Job payload must be a JSON object.")
+    return {"success": True, "job_id": enqueue(kind, payload)}
+
+
+class Handler(BaseHTTPRequestHandler):
+    server_version = "LibraryAPI/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+        pass  # request timings go to the metrics registry instead
+
+    def _send(self, status, body, content_type="application/json"):
+        data = body.encode() if isinstance(body, str) else json.dumps(body, default=str).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            raise ApiError(413, "Request body too large.")
+        try:
+            return json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError as e:
+            raise ApiError(400, f"Invalid JSON: {e}")
+
+    def _handle(self, method):
+        path = self.path.split("?", 1)[0].rstrip("/") or "/"
+        with timed("api", f"{method} {path.split('/')[1] if path != '/' else '/'}") as m:
+            try:
+                check_library_changes()  # the UI and workers write from other processes
+                status, body = 200, self._route(method, path)
+            except ApiError as e:
+                status, body = e.status, {"success": False, "error": str(e)}
+            except Exception as e:
+                status, body = 500, {"success": False, "error": f"{type(e).__name__}: {e}"}
+            m["error"] = status >= 400
+            if isinstance(body, str):
+                self._send(status, body, "text/plain; version=0.0.4")
+            else:
+                self._send(status, body)
+
+    def _route(self, method, path):
+        parts = path.strip("/").split("/")
+        if method == "GET" and path == "/health":
+            return {"ok": True}
+        if method == "GET" and path == "/tools":
+            return TOOLS
+        if method == "GET" and path == "/metrics":
+            return get_metrics().to_prometheus()
+        if method == "GET" and len(parts) == 2 and parts[0] == "conversations" and parts[1].isdigit():
+            return {"conversation_id": int(parts[1]),
+                    "messages": db_load_messages(int(parts[1]), limit=CHAT_PAGE_SIZE)}
+        if method == "GET" and path == "/jobs":
+            return {"counts": job_counts(), "jobs": list_jobs()}
+        if method == "GET" and len(parts) == 2 and parts[0] == "jobs" and parts[1].isdigit():
+            job = get_job(int(parts[1]))
+            if job is None:
+                raise ApiError(404, f"No job {parts[1]}")
+            return job
+        if method == "POST" and path == "/jobs":
+            body = self._body()
+            return submit_job(body.get("kind"), body.get("payload"))
+        if method == "POST" and len(parts) == 2 and parts[0] == "tools":
+            return call_tool(parts[1], self._body())
+        if method == "POST" and path == "/chat":
+            body = self._body()
+            if not body.get("message"):
+                raise ApiError(400, "'message' is required.")
+            return chat(body["message"], body.get("conversation_id"), self.headers.get("X-Gemini-Key"),
+                        bool(body.get("background")))
+        raise ApiError(404, f"No route for {method} {path}")
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+
+def serve(host="127.0.0.1", port=8765):
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    print(f"Library API listening on http://{host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
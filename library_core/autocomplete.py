@@ -0,0 +1,192 @@
+"""
+Prefix autocomplete over library titles and authors and the catalog records searches have seen.
+
+Each title or author is indexed under every word it contains (normalized as in fuzzy.py), so
+"prej" suggests "Pride and Prejudice". Keys live in one sorted list: a lookup bisects to the
+prefix and reads the matches that follow, at most MAX_SCAN of them, so it costs the same at 100
+books or 100k. The library index is kept in step by diffing (id, title, author) like the trigram
+index; catalog records are added as searches return them, the least recently seen dropped first.
+"""
+
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from itertools import chain
+
+from .caches import _library_snapshot
+from .db import db_path, get_library_revision
+from .fuzzy import normalize
+from .metrics import get_metrics, instrumented
+
+SUGGESTION_LIMIT = 8
+MAX_SCAN = 200             # keys read past the prefix before ranking what was found
+CATALOG_MAX_ENTRIES = 20_000
+_SKIP_WORDS = {"the", "a", "an", "of", "and", "in", "on", "to", "for", "with", "at", "by"}
+
+
+class PrefixIndex:
+    """Sorted (key, entry) lists for prefix lookups. An entry is one distinct title or author
+    with a reference count; entries nobody refers to stay in the keys until the next compaction."""
+
+    def __init__(self):
+        self.keys = []         # sorted normalized suffixes, each starting at a word
+        self.key_entries = []  # key → entry id
+        self.entries = []      # entry id → [text, field, record, weight, refs, normalized text]
+        self.ids = {}          # (field, normalized text) → entry id
+        self.dead = 0
+
+    @staticmethod
+    def _keys(norm):
+        words = norm.split()
+        return [" ".join(words[i:]) for i, w in enumerate(words) if i == 0 or w not in _SKIP_WORDS]
+
+    def add(self, text, field, record=None, weight=0, ref=True):
+        """Index `text` (or refresh its record and weight); `ref` counts one more referrer."""
+        self.add_many([(text, field, record, weight)], ref)
+
+    def add_many(self, items, ref=True):
+        """add() for (text, field, record, weight) items; a large batch re-sorts the keys once
+        instead of inserting each."""
+        new_keys = []
+        for text, field, record, weight in items:
+            norm = normalize(text)
+            if not norm:
+                continue
+            entry_id = self.ids.get((field, norm))
+            if entry_id is None:
+                entry_id = self.ids[(field, norm)] = len(self.entries)
+                self.entries.append([text, field, {}, 0, 0, norm])
+                new_keys += [(key, entry_id) for key in self._keys(norm)]
+            elif ref and not self.entries[entry_id][4]:
+                self.dead -= 1  # back before it was compacted away
+            entry = self.entries[entry_id]
+            entry[2] = {**entry[2], **record} if record else entry[2]
+            entry[3] = max(entry[3], weight)
+            entry[4] += ref
+        if len(new_keys) > len(self.keys) // 16 + 16:
+            pairs = sorted(chain(zip(self.keys, self.key_entries), new_keys))
+            self.keys = [k for k, _ in pairs]
+            self.key_entries = [e for _, e in pairs]
+            return
+        for key, entry_id in new_keys:
+            i = bisect_left(self.keys, key)
+            self.keys.insert(i, key)
+            self.key_entries.insert(i, entry_id)
+
+    def discard(self, text, field):
+        entry_id = self.ids.get((field, normalize(text)))
+        if entry_id is None or not self.entries[entry_id][4]:
+            return
+        self.entries[entry_id][4] -= 1
+        if not self.entries[entry_id][4]:
+            self.dead += 1
+            if self.dead > (len(self.entries) - self.dead) // 4 + 64:
+                self.compact()
+
+    def compact(self):
+        live = [e for e in self.entries if e[4]]
+        self.__init__()
+        pairs = []
+        for entry in live:
+            entry_id = self.ids[(entry[1], entry[5])] = len(self.entries)
+            self.entries.append(entry)
+            pairs += [(key, entry_id) for key in self._keys(entry[5])]
+        pairs.sort()
+        self.keys = [k for k, _ in pairs]
+        self.key_entries = [e for _, e in pairs]
+
+    def complete(self, prefix, field=None, limit=SUGGESTION_LIMIT):
+        """Live entries with a word starting with the normalized `prefix`: those whose text
+        starts with it first, then the heaviest, then the shortest."""
+        keys, key_entries, entries = self.keys, self.key_entries, self.entries
+        start = bisect_left(keys, prefix)
+        found = {}
+        for i in range(start, min(start + MAX_SCAN, len(keys))):
+            if not keys[i].startswith(prefix):
+                break
+            entry = entries[key_entries[i]]
+            if entry[4] and (field is None or entry[1] == field):
+                mid_text = len(keys[i]) < len(entry[5])
+                found[key_entries[i]] = found.get(key_entries[i], True) and mid_text
+        ranked = sorted(found, key=lambda e: (found[e], -entries[e][3], len(entries[e][0])))
+        return [entries[e] for e in ranked[:limit]]
+
+
+# ─── Shared Indexes ──────────────────────────────────────────────────────────
+# The library index follows the library revision; the catalog index only grows (bounded).
+_library_index = PrefixIndex()
+_library_books = {}       # book id → (title, author) as indexed
+_library_at = (None, None)
+_catalog_index = PrefixIndex()
+_catalog_seen = OrderedDict()  # (text, field) → None, least recently seen first
+_lock = threading.Lock()
+
+
+def _sync_library():
+    global _library_index, _library_at
+    path, revision = db_path(), get_library_revision().value
+    hit = _library_at == (path, revision)
+    if not hit:
+        if _library_at[0] != path:
+            _library_index = PrefixIndex()
+            _library_books.clear()
+        current = {b["id"]: b for b in _library_snapshot(path, revision)}
+        for book_id, (title, author) in list(_library_books.items()):
+            book = current.get(book_id)
+            if book is None or (book["title"] or "", book["author"] or "") != (title, author):
+                _library_index.discard(title, "title")
+                _library_index.discard(author, "author")
+                del _library_books[book_id]
+        items = []
+        for book_id, book in current.items():
+            if book_id not in _library_books:
+                title, author = _library_books[book_id] = (book["title"] or "", book["author"] or "")
+                items += [(title, "title", {"author": author, "book_id": book_id}, 0), (author, "author", None, 0)]
+        _library_index.add_many(items)
+        _library_at = (path, revision)
+    get_metrics().record_cache("autocomplete_index", hit)
+
+
+def remember_catalog_books(books):
+    """Index titles and authors from a search result (Open Library or Gutenberg books)."""
+    with _lock:
+        for book in books:
+            authors = [a for a in book.get("authors") or [] if a and a != "Unknown"]
+            record = {k: book[k] for k in ("year", "isbn", "gutenberg_id", "open_library_key", "pages")
+                      if book.get(k)}
+            record["author"] = authors[0] if authors else ""
+            weight = book.get("download_count") or 0
+            for text, field, rec in [(book.get("title"), "title", record)] + [(a, "author", None) for a in authors]:
+                if not text or text == "Unknown":
+                    continue
+                seen = (text, field) in _catalog_seen
+                _catalog_seen[(text, field)] = None
+                _catalog_seen.move_to_end((text, field))
+                _catalog_index.add(text, field, rec, weight, ref=not seen)
+            while len(_catalog_seen) > CATALOG_MAX_ENTRIES:
+                _catalog_index.discard(*_catalog_seen.popitem(last=False)[0])
+
+
+@instrumented("db")
+def suggest(prefix, field=None, limit=SUGGESTION_LIMIT):
+    """Up to `limit` completions of `prefix` — library books first, then catalog records — as
+    {"text", "field", "source", ...record}. `field` restricts them to "title" or "author"."""
+    prefix = normalize(prefix)
+    if not prefix:
+        return []
+    with _lock:
+        _sync_library()
+        out, seen = [], set()
+        for source, index in (("library", _library_index), ("catalog", _catalog_index)):
+            for text, entry_field, record, _, _, norm in index.complete(prefix, field, limit):
+                if (entry_field, norm) not in seen and len(out) < limit:
+                    seen.add((entry_field, norm))
+                    out.append({**record, "text": text, "field": entry_field, "source": source})
+    return out
+
+
+def clear_catalog_suggestions():
+    global _catalog_index
+    with _lock:
+        _catalog_index = PrefixIndex()
+        _catalog_seen.clear()
@@ -0,0 +1,241 @@
+"""Process-wide caches shared by every session, UI or headless."""
+
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from .db import (db_library_counts, db_load_library, db_path, get_library_revision,
+                 get_progress_buffer)
+from .metrics import get_metrics
+
+# ─── Shared Caches ───────────────────────────────────────────────────────────
+# Library snapshots are keyed by a revision that every books write bumps; remote lookups are
+# keyed by call arguments, fresh for REMOTE_CACHE_TTL_S and then served stale (while being
+# refreshed in the background) for up to REMOTE_STALE_TTL_S.
+REMOTE_CACHE_TTL_S = float(os.environ.get("LIBRARY_REMOTE_CACHE_TTL_S", 600))
+REMOTE_STALE_TTL_S = float(os.environ.get("LIBRARY_REMOTE_STALE_TTL_S", 24 * 3600))
+REMOTE_CACHE_MAX_ENTRIES = 512
+_cache_state = threading.local()
+
+
+def cache_lookup(cache, fn, *args):
+    """Call a memoized function, recording a hit unless its body ran (and flagged a miss)."""
+    _cache_state.miss = False
+    result = fn(*args)
+    get_metrics().record_cache(cache, not _cache_state.miss)
+    return result
+
+
+@functools.lru_cache(maxsize=4)
+def _library_snapshot(path, revision):
+    # Shared read-only rows: callers filter into new lists but never mutate the dicts.
+    _cache_state.miss = True
+    return db_load_library()
+
+
+@functools.lru_cache(maxsize=4)
+def _library_counts_snapshot(path, revision):
+    _cache_state.miss = True
+    return db_library_counts()
+
+
+def get_library():
+    books = cache_lookup("library", _library_snapshot, db_path(), get_library_revision().value)
+    return get_progress_buffer().overlay_library(books)  # plus progress not yet written
+
+def get_library_counts():
+    counts = cache_lookup("library_counts", _library_counts_snapshot, db_path(), get_library_revision().value)
+    buffer = get_progress_buffer()
+    return buffer.overlay_counts(counts, get_library()) if buffer.pending else counts
+
+
+class TTLCache:
+    """Thread-safe LRU whose entries go stale `ttl` seconds after they were stored and are
+    dropped after `stale_ttl` (if longer)."""
+
+    def __init__(self, ttl, max_entries, stale_ttl=0):
+        self.ttl = ttl
+        self.stale_ttl = max(ttl, stale_ttl)
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        """(hit, value); stale entries count as misses."""
+        with self.lock:
+            entry = self.entries.get(key)
+            age = time.time() - entry[0] if entry else None
+            if entry is None or age >= self.stale_ttl:
+                self.entries.pop(key, None)
+                return False, None
+            if age >= self.ttl:
+                return False, None
+            self.entries.move_to_end(key)
+            return True, entry[1]
+
+    def get_stale(self, key):
+        """The stored value however old (within stale_ttl), or None."""
+        with self.lock:
+            entry = self.entries.get(key)
+            return entry[1] if entry and time.time() - entry[0] < self.stale_ttl else None
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.time(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+PREFETCH_WORKERS = 4
+PREFETCH_MAX_PENDING = 64
+INTERACTIVE_WORKERS = 4
+
+
+class Prefetcher:
+    """Runs remote lookups ahead of need; cached_remote() collects the result on its next miss.
+
+    Lookups a user is waiting for (start()) run on their own pool, so they never queue behind
+    prefetches and background refreshes (submit(), speculate()). Work submitted with speculate()
+    is a guess; whether it was collected before it expired or was evicted is recorded as the
+    "speculative_prefetch" cache hit rate.
+    """
+
+    def __init__(self):
+        self.pool = ThreadPoolExecutor(PREFETCH_WORKERS, thread_name_prefix="prefetch")
+        self.interactive_pool = ThreadPoolExecutor(INTERACTIVE_WORKERS, thread_name_prefix="interactive")
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.urgent = set()  # pending keys running on the interactive pool
+        self.taken = {}
+        self.refreshing = set()
+        self.speculative = {}
+
+    def submit(self, fn, **kwargs):
+        return self._submit(fn, kwargs, urgent=False)
+
+    def start(self, fn, **kwargs):
+        """Like submit() for a lookup someone is about to wait for."""
+        return self._submit(fn, kwargs, urgent=True)
+
+    def _submit(self, fn, kwargs, urgent):
+        key = (fn.__name__, json.dumps(kwargs, sort_keys=True))
+        with self.lock:
+            queued = self.pending.get(key)
+            # A background lookup that hasn't started yet is moved to the interactive pool.
+            if urgent and queued is not None and key not in self.urgent and queued.cancel():
+                del self.pending[key]
+            # Skip work in flight, or already handed to the shared cache within its TTL.
+            if key in self.pending or time.time() - self.taken.get(key, 0) < REMOTE_CACHE_TTL_S:
+                return False
+            if len(self.pending) >= PREFETCH_MAX_PENDING:
+                evicted = next((k for k in self.pending if k not in self.urgent), next(iter(self.pending)))
+                self.pending.pop(evicted).cancel()
+                self.urgent.discard(evicted)
+                if self.speculative.pop(evicted, None):
+                    get_metrics().record_cache("speculative_prefetch", False)
+            # Run in a copy of the caller's context so its latency budget applies (see remote.py).
+            pool = self.interactive_pool if urgent else self.pool
+            self.pending[key] = pool.submit(contextvars.copy_context().run, fn, **kwargs)
+            if urgent:
+                self.urgent.add(key)
+        return True
+
+    def speculate(self, fn, **kwargs):
+        key = (fn.__name__, json.dumps(kwargs, sort_keys=True))
+        if not self.submit(fn, **kwargs):
+            return False
+        now = time.time()
+        with self.lock:
+            unused = [k for k, t in self.speculative.items() if now - t >= REMOTE_CACHE_TTL_S]
+            for k in unused:
+                del self.speculative[k]
+            self.speculative[key] = now
+        for _ in unused:
+            get_metrics().record_cache("speculative_prefetch", False)
+        return True
+
+    def take(self, fn_name, kwargs_json):
+        # Called on every shared-cache miss, so `taken` also remembers keys the cache now holds.
+        now = time.time()
+        with self.lock:
+            future = self.pending.pop((fn_name, kwargs_json), None)
+            self.urgent.discard((fn_name, kwargs_json))
+            if self.speculative.pop((fn_name, kwargs_json), None) and future is not None:
+                get_metrics().record_cache("speculative_prefetch", True)
+            self.taken[(fn_name, kwargs_json)] = now
+            if len(self.taken) > 4 * PREFETCH_MAX_PENDING:
+                self.taken = {k: t for k, t in self.taken.items() if now - t < REMOTE_CACHE_TTL_S}
+        if future is None or future.cancelled():
+            return None
+        return future.result()
+
+    def forget(self):
+        """Drop the record of what was handed to the shared cache (after it is cleared)."""
+        with self.lock:
+            self.taken.clear()
+
+    def revalidate(self, fn, key, kwargs, cache):
+        """Refresh a stale cache entry in the background (once per key at a time)."""
+        with self.lock:
+            if key in self.refreshing:
+                return False
+            self.refreshing.add(key)
+
+        def refresh():
+            try:
+                result = fn(**kwargs)
+                if result.get("success") and not result.get("degraded"):
+                    cache.put(key, result)
+            finally:
+                with self.lock:
+                    self.refreshing.discard(key)
+        self.pool.submit(refresh)
+        return True
+
+
+_prefetcher = Prefetcher()
+_remote_cache = TTLCache(REMOTE_CACHE_TTL_S, REMOTE_CACHE_MAX_ENTRIES, REMOTE_STALE_TTL_S)
+
+
+def get_prefetcher():
+    return _prefetcher
+
+
+def cached_remote(fn, **kwargs):
+    """Serve a read-only network tool from the shared cache, keyed by its name and arguments.
+
+    A stale entry is returned at once (marked "stale") while a background refresh runs, so a
+    slow or failing upstream never blocks a result we already had. Results are shared between
+    sessions and must be treated as read-only. Failures and degraded results are never cached.
+    """
+    key = (fn.__name__, json.dumps(kwargs, sort_keys=True))
+    hit, result = _remote_cache.get(key)
+    get_metrics().record_cache(fn.__name__, hit)
+    if hit:
+        return result
+    stale = _remote_cache.get_stale(key)
+    if stale is not None:
+        get_metrics().record_cache("stale_while_revalidate", True)
+        _prefetcher.revalidate(fn, key, kwargs, _remote_cache)
+        return {**stale, "stale": True}
+    result = _prefetcher.take(*key) or fn(**kwargs)
+    if result.get("success") and not result.get("degraded"):
+        _remote_cache.put(key, result)
+    return result
+
+
+def clear_shared_caches():
+    _remote_cache.clear()
+    _prefetcher.forget()
+    _library_snapshot.cache_clear()
+    _library_counts_snapshot.cache_clear()
@@ -0,0 +1,106 @@
+"""
+Command line over the headless core.
+
+    python -m library_core tools                                  # list tool names
+    python -m library_core call search_books query="moby dick"    # key=value (JSON values allowed)
+    python -m library_core call add_to_personal_library --json '{"title": "Emma", "author": "Jane Austen"}'
+    python -m library_core chat "Find free classics by Dickens" [--conversation 3] [--background]
+    python -m library_core serve --port 8765                       # JSON HTTP API (see api.py)
+    python -m library_core worker --processes 4                    # background job pool (see jobs.py)
+    python -m library_core enqueue index_book gutenberg_id=1342
+    python -m library_core jobs [--status failed]
+"""
+
+import argparse
+import json
+import os
+import sys
+
+from .api import ApiError, call_tool, chat, serve, submit_job
+from .jobs import list_jobs, run_pool, worker_loop
+from .tools import TOOLS
+
+
+def _parse_args(pairs, schema=None):
+    """key=value pairs as a dict; values are JSON-decoded unless `schema` declares them strings
+    (so isbn=9780441013593 stays a string)."""
+    props = (schema or {}).get("properties", {})
+    args = {}
+    for pair in pairs:
+        key, sep, value = pair.partition("=")
+        if not sep:
+            raise SystemExit(f"expected key=value, got {pair!r}")
+        if props.get(key, {}).get("type") == "string":
+            args[key] = value
+            continue
+        try:
+            args[key] = json.loads(value)
+        except json.JSONDecodeError:
+            args[key] = value
+    return args
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m library_core", description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="command", required=True)
+    sub.add_parser("tools", help="list the agent tools")
+    p = sub.add_parser("call", help="call one tool and print its JSON result")
+    p.add_argument("name")
+    p.add_argument("args", nargs="*", help="key=value arguments")
+    p.add_argument("--json", help="arguments as a JSON object")
+    p = sub.add_parser("chat", help="run one agent turn (GEMINI_API_KEY must be set)")
+    p.add_argument("message")
+    p.add_argument("--conversation", type=int, help="continue this conversation id")
+    p.add_argument("--background", action="store_true",
+                   help="queue behind interactive turns for Gemini (scripts, cron jobs)")
+    p = sub.add_parser("serve", help="run the JSON HTTP API")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8765)
+    p = sub.add_parser("worker", help="run background job workers")
+    p.add_argument("--processes", type=int, default=2)
+    p.add_argument("--once", action="store_true", help="drain the queue in this process, then exit")
+    p.add_argument("--exit-with", type=int, metavar="PID", help="stop when this parent process exits")
+    p = sub.add_parser("enqueue", help="queue a background job")
+    p.add_argument("kind")
+    p.add_argument("args", nargs="*", help="key=value payload")
+    p = sub.add_parser("jobs", help="list recent jobs")
+    p.add_argument("--status", choices=["queued", "running", "done", "failed"])
+    p.add_argument("--limit", type=int, default=20)
+    args = ap.parse_args(argv)
+
+    if args.command == "tools":
+        for t in TOOLS:
+            print(f"{t['name']:<26} {t['description']}")
+        return 0
+    if args.command == "serve":
+        serve(args.host, args.port)
+        return 0
+    if args.command == "worker":
+        if args.once:
+            worker_loop(f"cli:{os.getpid()}", once=True)
+        else:
+            run_pool(args.processes, args.exit_with)
+        return 0
+    if args.command == "jobs":
+        for job in list_jobs(args.limit, args.status):
+            print(f"{job['id']:>6} {job['status']:<8} {job['kind']:<12} attempts={job['attempts']} "
+                  f"{json.dumps(job['payload'])} {job['error'] or ''}")
+        return 0
+    try:
+        if args.command == "call":
+            schema = next((t["input_schema"] for t in TOOLS if t["name"] == args.name), None)
+            result = call_tool(args.name, json.loads(args.json) if args.json else _parse_args(args.args, schema))
+        elif args.command == "enqueue":
+            result = submit_job(args.kind, _parse_args(args.args))
+        else:
+            result = chat(args.message, args.conversation, background=args.background)
+    except ApiError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    print(json.dumps(result, indent=2, ensure_ascii=False, default=str))
+    return 0 if result.get("success") else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
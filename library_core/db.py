@@ -0,0 +1,645 @@
+"""SQLite persistence: books, chat history and the Gutenberg full-text index."""
+
+import atexit
+import functools
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+from .metrics import get_metrics, instrumented
+
+# ─── SQLite Database ─────────────────────────────────────────────────────────
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "library.db")
+
+def db_path():
+    """LIBRARY_DB is read per call so tests and benchmarks can point each run at a fresh file."""
+    return os.environ.get("LIBRARY_DB") or DEFAULT_DB_PATH
+
+def get_db():
+    path = db_path()
+    init_db(path)
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+@functools.lru_cache(maxsize=None)
+def init_db(db_path):
+    """Create/migrate the schema once per process and database file, not on every rerun."""
+    conn = sqlite3.connect(db_path)
+    # WAL lets the UI keep reading while job workers in other processes write.
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS books (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            author TEXT NOT NULL,
+            genre TEXT DEFAULT '',
+            notes TEXT DEFAULT '',
+            year INTEGER,
+            isbn TEXT DEFAULT '',
+            cover_url TEXT DEFAULT '',
+            open_library_key TEXT DEFAULT '',
+            gutenberg_id INTEGER,
+            source TEXT DEFAULT 'Personal',
+            added_at TEXT NOT NULL,
+            status TEXT DEFAULT 'unread',
+            rating INTEGER DEFAULT 0,
+            review TEXT DEFAULT '',
+            current_page INTEGER DEFAULT 0,
+            total_pages INTEGER DEFAULT 0,
+            started_at TEXT,
+            finished_at TEXT
+        );
+        CREATE TABLE IF NOT EXISTS conversations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT DEFAULT '',
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_conversations_updated ON conversations(updated_at);
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            conversation_id INTEGER NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_messages_conversation ON messages(conversation_id, id);
+        CREATE TABLE IF NOT EXISTS book_texts (
+            gutenberg_id INTEGER PRIMARY KEY,
+            title TEXT DEFAULT '',
+            content TEXT NOT NULL,
+            passages INTEGER DEFAULT 0,
+            fetched_at TEXT NOT NULL,
+            body_offset INTEGER
+        );
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL DEFAULT '{}',
+            dedupe_key TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            priority INTEGER NOT NULL DEFAULT 0,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL DEFAULT 3,
+            run_after REAL NOT NULL DEFAULT 0,
+            lease_until REAL,
+            worker TEXT DEFAULT '',
+            result TEXT,
+            error TEXT DEFAULT '',
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs(status, priority, run_after);
+        CREATE UNIQUE INDEX IF NOT EXISTS ux_jobs_active ON jobs(dedupe_key)
+            WHERE status IN ('queued', 'running');
+        CREATE TABLE IF NOT EXISTS reading_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            book_id INTEGER NOT NULL,
+            at TEXT NOT NULL,
+            current_page INTEGER,
+            total_pages INTEGER,
+            status TEXT,
+            rating INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS idx_reading_events_book ON reading_events(book_id, at);
+        -- Pages read per book per day, kept in step with reading_events (see analytics.py).
+        CREATE TABLE IF NOT EXISTS reading_daily (
+            day TEXT NOT NULL,
+            book_id INTEGER NOT NULL,
+            pages INTEGER NOT NULL,
+            PRIMARY KEY (day, book_id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_reading_daily_book ON reading_daily(book_id, day);
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO meta (key, value) VALUES ('library_rev', 0);
+        CREATE TRIGGER IF NOT EXISTS books_rev_insert AFTER INSERT ON books
+            BEGIN UPDATE meta SET value = value + 1 WHERE key = 'library_rev'; END;
+        CREATE TRIGGER IF NOT EXISTS books_rev_update AFTER UPDATE ON books
+            BEGIN UPDATE meta SET value = value + 1 WHERE key = 'library_rev'; END;
+        CREATE TRIGGER IF NOT EXISTS books_rev_delete AFTER DELETE ON books
+            BEGIN UPDATE meta SET value = value + 1 WHERE key = 'library_rev'; END;
+        CREATE TABLE IF NOT EXISTS job_workers (
+            worker TEXT PRIMARY KEY,
+            pid INTEGER,
+            started_at REAL NOT NULL,
+            heartbeat_at REAL NOT NULL
+        );
+    """)
+    # BM25 passage index for "ask about this book" retrieval (FTS5 ships with CPython's SQLite).
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS book_passages
+        USING fts5(text, gutenberg_id UNINDEXED, idx UNINDEXED, tokenize='porter unicode61')
+    """)
+    # Byte offset of `content` in the raw file; NULL for texts stored before it was recorded.
+    if "body_offset" not in {r[1] for r in conn.execute("PRAGMA table_info(book_texts)")}:
+        conn.execute("ALTER TABLE book_texts ADD COLUMN body_offset INTEGER")
+    # Bucket any reading history logged before reading_daily existed.
+    if not conn.execute("SELECT 1 FROM reading_daily LIMIT 1").fetchone():
+        conn.execute(f"INSERT INTO reading_daily (day, book_id, pages) {READING_DAILY_FROM_EVENTS}")
+    # One row per identity. Older databases may hold duplicates: the oldest row keeps the
+    # identifier, later copies have it blanked (rows are never deleted) before indexing.
+    existing = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+    for name, col, present in BOOK_IDENTITY_INDEXES:
+        if name not in existing:
+            blank = "NULL" if col == "gutenberg_id" else "''"
+            conn.execute(f"""
+                UPDATE books SET {col}={blank} WHERE {present} AND id NOT IN
+                (SELECT MIN(id) FROM books WHERE {present} GROUP BY {col})
+            """)
+            conn.execute(f"CREATE UNIQUE INDEX {name} ON books({col}) WHERE {present}")
+    conn.commit()
+    conn.close()
+
+# Positive page deltas between consecutive events of a book, summed per day.
+READING_DAILY_FROM_EVENTS = """
+    SELECT day, book_id, SUM(delta) FROM (
+        SELECT date(at) AS day, book_id,
+               MAX(0, current_page - LAG(current_page, 1, 0) OVER (PARTITION BY book_id ORDER BY at, id)) AS delta
+        FROM reading_events WHERE current_page IS NOT NULL)
+    GROUP BY day, book_id HAVING SUM(delta) > 0
+"""
+
+# (index name, column, partial-index predicate). Lookups repeat the predicate so the planner
+# can prove the partial index applies.
+BOOK_IDENTITY_INDEXES = (
+    ("ux_books_gutenberg_id", "gutenberg_id", "gutenberg_id IS NOT NULL"),
+    ("ux_books_isbn", "isbn", "isbn <> ''"),
+    ("ux_books_open_library_key", "open_library_key", "open_library_key <> ''"),
+)
+
+
+# ─── Library Revision ────────────────────────────────────────────────────────
+# Triggers bump meta.library_rev on every books write, whichever process or session makes it;
+# library snapshots (see caches.py) are keyed by the last value seen here.
+class LibraryRevision:
+    """The database's library_rev as of the last refresh().
+
+    refresh() is cheap enough to call on every rerun/request: PRAGMA data_version on a
+    long-lived connection only changes when some other connection has committed (it costs no
+    I/O), and library_rev is read only then.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.value = 0
+        self.path = None
+        self.conn = None
+        self.data_version = None
+
+    def refresh(self):
+        """Returns True if the library changed since the last refresh."""
+        path = db_path()
+        with self.lock:
+            if self.path != path:
+                if self.conn is not None:
+                    self.conn.close()
+                init_db(path)
+                self.path, self.data_version = path, None
+                self.conn = sqlite3.connect(path, check_same_thread=False)
+            data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+            if data_version == self.data_version:
+                get_metrics().record_cache("data_version", True)
+                return False
+            self.data_version = data_version
+            rev = self.conn.execute("SELECT value FROM meta WHERE key='library_rev'").fetchone()[0]
+            get_metrics().record_cache("data_version", False)
+            changed, self.value = rev != self.value, rev
+            return changed
+
+
+_revision = LibraryRevision()
+
+
+def get_library_revision():
+    return _revision
+
+
+def check_library_changes():
+    """Call at the top of each rerun or request to pick up writes from other processes."""
+    return _revision.refresh()
+
+
+def invalidate_library():
+    """Write hook: this process's next get_library() sees its own write at once."""
+    _revision.refresh()
+
+
+@instrumented("db")
+def db_load_library():
+    conn = get_db()
+    rows = conn.execute("SELECT * FROM books ORDER BY added_at DESC").fetchall()
+    conn.close()
+    return [dict(r) for r in rows]
+
+def _find_book(conn, column, value):
+    present = next(p for _, col, p in BOOK_IDENTITY_INDEXES if col == column)
+    row = conn.execute(f"SELECT * FROM books WHERE {column}=? AND {present}", (value,)).fetchone()
+    return dict(row) if row else None
+
+@instrumented("db")
+def db_get_book_by_gutenberg_id(gutenberg_id):
+    conn = get_db()
+    book = _find_book(conn, "gutenberg_id", gutenberg_id)
+    conn.close()
+    return book
+
+@instrumented("db")
+def db_get_book_by_isbn(isbn):
+    conn = get_db()
+    book = _find_book(conn, "isbn", isbn)
+    conn.close()
+    return book
+
+@instrumented("db")
+def db_get_book_by_open_library_key(open_library_key):
+    conn = get_db()
+    book = _find_book(conn, "open_library_key", open_library_key)
+    conn.close()
+    return book
+
+@instrumented("db")
+def db_upsert_book(title, author, genre="", notes="", year=None, isbn="", cover_url="",
+                   open_library_key="", gutenberg_id=None, total_pages=0):
+    """Insert a book unless its gutenberg_id, ISBN or Open Library key is already in the library.
+
+    Returns (book_id, created). An existing match only gets its blank cover/year/genre/pages filled.
+    """
+    isbn, open_library_key = str(isbn or "").strip(), str(open_library_key or "").strip()
+    conn = get_db()
+    with conn:
+        c = conn.execute("""
+            INSERT INTO books (title, author, genre, notes, year, isbn, cover_url,
+            open_library_key, gutenberg_id, source, added_at, total_pages)
+            VALUES (?,?,?,?,?,?,?,?,?,'Personal',?,?)
+            ON CONFLICT DO NOTHING
+        """, (title, author, genre, notes, year, isbn, cover_url,
+              open_library_key, gutenberg_id,
+              datetime.now().strftime("%Y-%m-%d"), total_pages or 0))
+        created = c.rowcount > 0
+        if created:
+            book_id = c.lastrowid
+        else:
+            match = ((gutenberg_id is not None and _find_book(conn, "gutenberg_id", gutenberg_id)) or
+                     (isbn and _find_book(conn, "isbn", isbn)) or
+                     _find_book(conn, "open_library_key", open_library_key))
+            book_id = match["id"]
+            changed = _fill_blanks(conn, book_id, cover_url, year, genre, total_pages)
+    conn.close()
+    if created or changed:
+        invalidate_library()
+    return book_id, created
+
+def _fill_blanks(conn, book_id, cover_url="", year=None, genre="", total_pages=0):
+    return conn.execute("""
+        UPDATE books SET cover_url=COALESCE(NULLIF(cover_url,''), ?), year=COALESCE(year, ?),
+        genre=COALESCE(NULLIF(genre,''), ?), total_pages=COALESCE(NULLIF(total_pages,0), ?)
+        WHERE id=? AND (cover_url='' AND ?<>'' OR year IS NULL AND ? IS NOT NULL
+                        OR genre='' AND ?<>'' OR total_pages=0 AND ?<>0)
+    """, (cover_url or "", year, genre or "", total_pages or 0, book_id,
+          cover_url or "", year, genre or "", total_pages or 0)).rowcount > 0
+
+def db_add_book(*args, **kwargs):
+    return db_upsert_book(*args, **kwargs)[0]
+
+@instrumented("db")
+def db_fill_book_blanks(book_id, cover_url="", year=None, genre="", total_pages=0):
+    """Set only the fields that are still blank (used by background enrichment)."""
+    conn = get_db()
+    with conn:
+        changed = _fill_blanks(conn, book_id, cover_url, year, genre, total_pages)
+    conn.close()
+    if changed:
+        invalidate_library()
+    return changed
+
+def _progress_fields(current_page=None, total_pages=None, status=None, rating=None, review=None):
+    fields = {}
+    if current_page is not None:
+        fields["current_page"] = current_page
+    if total_pages is not None:
+        fields["total_pages"] = total_pages
+    if status is not None:
+        fields["status"] = status
+        if status == "reading":
+            fields["started_at"] = datetime.now().strftime("%Y-%m-%d")
+        elif status == "finished":
+            fields["finished_at"] = datetime.now().strftime("%Y-%m-%d")
+    if rating is not None:
+        fields["rating"] = max(0, min(5, int(rating)))
+    if review is not None:
+        fields["review"] = review
+    return fields
+
+def _write_progress(updates, events):
+    """Apply {book_id: fields} and append the events in one transaction; returns rows updated."""
+    conn = get_db()
+    with conn:
+        daily = _daily_pages(conn, events)  # before the UPDATE overwrites current_page
+        changed = sum(conn.execute(f"UPDATE books SET {', '.join(f'{k}=?' for k in fields)} WHERE id=?",
+                                   [*fields.values(), book_id]).rowcount
+                      for book_id, fields in updates.items())
+        conn.executemany("""
+            INSERT INTO reading_events (book_id, at, current_page, total_pages, status, rating)
+            SELECT ?,?,?,?,?,? WHERE EXISTS (SELECT 1 FROM books WHERE id=?)
+        """, [(e["book_id"], e["at"], e.get("current_page"), e.get("total_pages"), e.get("status"),
+               e.get("rating"), e["book_id"]) for e in events])
+        conn.executemany("""
+            INSERT INTO reading_daily (day, book_id, pages) VALUES (?,?,?)
+            ON CONFLICT(day, book_id) DO UPDATE SET pages=pages+excluded.pages
+        """, daily)
+    conn.close()
+    if changed:
+        invalidate_library()
+    return changed
+
+def _daily_pages(conn, events):
+    """(day, book_id, pages) buckets for the forward page moves in `events`."""
+    paged = [e for e in events if e.get("current_page") is not None]
+    if not paged:
+        return []
+    ids = list({e["book_id"] for e in paged})
+    last = dict(conn.execute(f"SELECT id, current_page FROM books WHERE id IN ({','.join('?' * len(ids))})",
+                             ids).fetchall())
+    daily = {}
+    for e in paged:
+        if e["book_id"] in last:
+            key = (e["at"][:10], e["book_id"])
+            daily[key] = daily.get(key, 0) + max(0, e["current_page"] - (last[e["book_id"]] or 0))
+            last[e["book_id"]] = e["current_page"]
+    return [(day, book_id, pages) for (day, book_id), pages in daily.items() if pages > 0]
+
+def _progress_event(book_id, fields):
+    return {"book_id": book_id, "at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            **{k: fields[k] for k in ("current_page", "total_pages", "status", "rating") if k in fields}}
+
+@instrumented("db")
+def db_update_progress(book_id, current_page=None, total_pages=None,
+                        status=None, rating=None, review=None):
+    """Write progress immediately (see db_record_progress for the buffered path)."""
+    fields = _progress_fields(current_page, total_pages, status, rating, review)
+    if not fields:
+        return False
+    return get_progress_buffer().write_through(book_id, fields) > 0
+
+
+# ─── Write-behind Progress ───────────────────────────────────────────────────
+# Progress updates are coalesced per book and written in one transaction every
+# PROGRESS_FLUSH_S (or on navigation / at exit), each update also becoming a reading_events
+# row. Until then readers see pending fields through overlay()/overlay_counts().
+PROGRESS_FLUSH_S = float(os.environ.get("LIBRARY_PROGRESS_FLUSH_S", 2.0))
+PROGRESS_MAX_PENDING = 256
+
+class ProgressBuffer:
+    def __init__(self, interval):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.writing = threading.Lock()  # one flush or direct write at a time, so none lands stale
+        self.pending = {}
+        self.events = []
+        self.timer = None
+
+    def record(self, book_id, fields):
+        with self.lock:
+            merged = {**self.pending.get(book_id, {}), **fields}
+            if merged == self.pending.get(book_id):
+                return
+            self.pending[book_id] = merged
+            self.events.append(_progress_event(book_id, fields))
+            full = len(self.events) >= PROGRESS_MAX_PENDING
+            if not full:
+                self._arm()
+        if full:
+            self.flush()
+
+    def _arm(self):
+        if self.timer is None:
+            self.timer = threading.Timer(self.interval, self.flush)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def discard(self, book_id):
+        with self.lock:
+            self.pending.pop(book_id, None)
+            self.events = [e for e in self.events if e["book_id"] != book_id]
+
+    def flush(self):
+        """Write everything pending; returns the number of books updated.
+
+        If the write fails (e.g. "database is locked"), everything stays buffered and the flush
+        is retried after the interval; SQLite errors return 0, anything else is re-raised."""
+        with self.writing:
+            with self.lock:
+                updates, events, self.events = dict(self.pending), self.events, []
+                if self.timer is not None:
+                    self.timer.cancel()
+                    self.timer = None
+            if not updates:
+                return 0
+            try:
+                changed = _write_progress(updates, events)
+            except Exception as e:
+                with self.lock:  # put the events back ahead of newer ones, minus discarded books
+                    self.events = [ev for ev in events if ev["book_id"] in self.pending] + self.events
+                    self._arm()
+                if isinstance(e, sqlite3.Error):
+                    return 0
+                raise
+            with self.lock:  # stay visible until written; keep anything recorded meanwhile
+                for book_id, fields in updates.items():
+                    if self.pending.get(book_id) is fields:
+                        del self.pending[book_id]
+            return changed
+
+    def write_through(self, book_id, fields):
+        """Write `fields` for one book now, in one transaction with whatever is still buffered
+        for it (the new fields win); returns rows updated."""
+        with self.writing:
+            with self.lock:
+                pending = self.pending.pop(book_id, {})
+                events = [e for e in self.events if e["book_id"] == book_id]
+                self.events = [e for e in self.events if e["book_id"] != book_id]
+            try:
+                return _write_progress({book_id: {**pending, **fields}},
+                                       events + [_progress_event(book_id, fields)])
+            except Exception:
+                with self.lock:  # nothing was written: buffer it all again
+                    self.pending[book_id] = {**pending, **self.pending.get(book_id, {})}
+                    self.events = events + self.events
+                    self._arm()
+                raise
+
+    def overlay(self, book):
+        fields = self.pending.get(book["id"]) if book else None
+        return {**book, **fields} if fields else book
+
+    def overlay_library(self, books):
+        if not self.pending:
+            return books
+        return [self.overlay(b) for b in books]
+
+    def overlay_counts(self, counts, books):
+        """Status counts recomputed from already-overlaid `books` when a status is pending."""
+        if not any("status" in f for f in self.pending.values()):
+            return counts
+        counts = {}
+        for b in books:
+            counts[b["status"]] = counts.get(b["status"], 0) + 1
+        counts["total"] = len(books)
+        return counts
+
+
+_progress_buffer = ProgressBuffer(PROGRESS_FLUSH_S)
+atexit.register(_progress_buffer.flush)
+
+
+def get_progress_buffer():
+    return _progress_buffer
+
+
+def flush_progress():
+    return _progress_buffer.flush()
+
+
+@instrumented("db")
+def db_record_progress(book_id, current_page=None, total_pages=None,
+                       status=None, rating=None, review=None):
+    """Buffer a progress update; False if the book doesn't exist."""
+    fields = _progress_fields(current_page, total_pages, status, rating, review)
+    if not fields:
+        return False
+    if book_id not in _progress_buffer.pending and db_get_book(book_id) is None:
+        return False
+    _progress_buffer.record(book_id, fields)
+    return True
+
+
+@instrumented("db")
+def db_remove_book(book_id):
+    _progress_buffer.discard(book_id)
+    conn = get_db()
+    c = conn.execute("DELETE FROM books WHERE id=?", (book_id,))
+    conn.commit()
+    conn.close()
+    invalidate_library()
+    return c.rowcount > 0
+
+@instrumented("db")
+def db_get_book(book_id):
+    conn = get_db()
+    row = conn.execute("SELECT * FROM books WHERE id=?", (book_id,)).fetchone()
+    conn.close()
+    return _progress_buffer.overlay(dict(row)) if row else None
+
+@instrumented("db")
+def db_get_book_text(gutenberg_id):
+    conn = get_db()
+    row = conn.execute("SELECT * FROM book_texts WHERE gutenberg_id=?", (gutenberg_id,)).fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+@instrumented("db")
+def db_get_book_index(gutenberg_id):
+    """Title and passage count of a stored text, without reading the text itself."""
+    conn = get_db()
+    row = conn.execute("SELECT gutenberg_id, title, passages FROM book_texts WHERE gutenberg_id=?",
+                       (gutenberg_id,)).fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+@instrumented("db")
+def db_has_book_text(gutenberg_id):
+    conn = get_db()
+    row = conn.execute("SELECT 1 FROM book_texts WHERE gutenberg_id=?", (gutenberg_id,)).fetchone()
+    conn.close()
+    return row is not None
+
+def db_store_book_text(gutenberg_id, title, content, passages, body_offset=None):
+    """Store a book's text (without boilerplate) and its passages; `body_offset` is the byte offset
+    of `content` in the raw file, so reader offsets map onto it."""
+    conn = get_db()
+    with conn:
+        conn.execute("DELETE FROM book_passages WHERE gutenberg_id=?", (gutenberg_id,))
+        conn.executemany("INSERT INTO book_passages (text, gutenberg_id, idx) VALUES (?,?,?)",
+                         [(p, gutenberg_id, i) for i, p in enumerate(passages)])
+        conn.execute("""
+            INSERT OR REPLACE INTO book_texts (gutenberg_id, title, content, passages, fetched_at, body_offset)
+            VALUES (?,?,?,?,?,?)
+        """, (gutenberg_id, title or "", content, len(passages),
+              datetime.now().strftime("%Y-%m-%d"), body_offset))
+    conn.close()
+
+@instrumented("db")
+def db_search_passages(gutenberg_id, match_expr, top_k=5):
+    conn = get_db()
+    rows = conn.execute("""
+        SELECT idx, text, bm25(book_passages) AS score FROM book_passages
+        WHERE book_passages MATCH ? AND gutenberg_id=?
+        ORDER BY score LIMIT ?
+    """, (match_expr, gutenberg_id, top_k)).fetchall()
+    conn.close()
+    return [dict(r) for r in rows]
+
+@instrumented("db")
+def db_create_conversation(title):
+    now = datetime.now().isoformat(timespec="seconds")
+    conn = get_db()
+    c = conn.execute("INSERT INTO conversations (title, created_at, updated_at) VALUES (?,?,?)",
+                     (title, now, now))
+    conn.commit()
+    conn.close()
+    return c.lastrowid
+
+@instrumented("db")
+def db_list_conversations(limit=20):
+    conn = get_db()
+    rows = conn.execute("SELECT * FROM conversations ORDER BY updated_at DESC, id DESC LIMIT ?",
+                        (limit,)).fetchall()
+    conn.close()
+    return [dict(r) for r in rows]
+
+@instrumented("db")
+def db_add_messages(conversation_id, messages):
+    """Append (role, content) pairs to a conversation in one transaction; returns the new ids."""
+    now = datetime.now().isoformat(timespec="seconds")
+    conn = get_db()
+    with conn:
+        ids = [conn.execute("INSERT INTO messages (conversation_id, role, content, created_at) VALUES (?,?,?,?)",
+                            (conversation_id, role, content, now)).lastrowid
+               for role, content in messages]
+        conn.execute("UPDATE conversations SET updated_at=? WHERE id=?", (now, conversation_id))
+    conn.close()
+    return ids
+
+@instrumented("db")
+def db_load_messages(conversation_id, before_id=None, limit=30):
+    """Keyset page of a conversation: the `limit` newest messages older than `before_id`, oldest first."""
+    conn = get_db()
+    rows = conn.execute("""
+        SELECT id, role, content FROM messages
+        WHERE conversation_id=? AND id < ? ORDER BY id DESC LIMIT ?
+    """, (conversation_id, before_id if before_id is not None else 2**63 - 1, limit)).fetchall()
+    conn.close()
+    return [dict(r) for r in reversed(rows)]
+
+@instrumented("db")
+def db_delete_conversation(conversation_id):
+    conn = get_db()
+    with conn:
+        conn.execute("DELETE FROM messages WHERE conversation_id=?", (conversation_id,))
+        c = conn.execute("DELETE FROM conversations WHERE id=?", (conversation_id,))
+    conn.close()
+    return c.rowcount > 0
+
+@instrumented("db")
+def db_library_counts():
+    conn = get_db()
+    rows = conn.execute("SELECT status, COUNT(*) FROM books GROUP BY status").fetchall()
+    conn.close()
+    counts = {status: n for status, n in rows}
+    counts["total"] = sum(counts.values())
+    return counts
@@ -0,0 +1,293 @@
+"""
+Typo-tolerant library search and near-duplicate detection over a trigram index.
+
+Titles and authors are normalized (accents folded, case and punctuation dropped) and split into
+padded word trigrams as in PostgreSQL's pg_trgm, so "Dostoyevsky" still shares 9 of its 12
+trigrams with "Dostoevsky". A search only visits the postings of the query's rarest trigrams —
+enough of them that every book over the threshold must appear there — and then scores those
+candidates exactly. The index is kept in step with the library by diffing (id, title, author),
+so progress writes cost nothing and an added book is indexed on its own.
+"""
+
+import functools
+import heapq
+import math
+import re
+import threading
+import unicodedata
+from array import array
+from collections import Counter, defaultdict
+from itertools import chain
+
+from .caches import _cache_state, _library_snapshot, cache_lookup, get_library
+from .db import db_path, get_library_revision
+from .metrics import get_metrics, instrumented
+
+SEARCH_THRESHOLD = 0.5            # share of the query's trigrams a match must contain
+DUPLICATE_TITLE_THRESHOLD = 0.6   # trigram Jaccard of the main titles
+DUPLICATE_SURNAME_THRESHOLD = 0.5  # trigram Jaccard of the authors' surnames
+UNKNOWN_AUTHORS = {"", "unknown", "anonymous", "various"}
+COMMON_GRAM_SHARE = 0.05  # a search checks trigrams in more books than this per candidate instead
+
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def normalize(text):
+    text = text or ""
+    if not text.isascii():
+        text = "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+    return " ".join(_NON_WORD.sub(" ", text.lower()).split())
+
+
+def trigrams(text):
+    """Padded word trigrams of a normalized string."""
+    grams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        grams.update([padded[i:i + 3] for i in range(len(padded) - 2)])
+    return grams
+
+
+def similarity(a, b):
+    """Trigram Jaccard similarity (0–1) of two strings."""
+    ga, gb = trigrams(normalize(a)), trigrams(normalize(b))
+    return len(ga & gb) / len(ga | gb) if ga and gb else 0.0
+
+
+def _surname(author):
+    """Normalized surname of "First Last" or "Last, First"."""
+    words = normalize(author.split(",")[0] if "," in author else author).split()
+    return words[-1] if words and "," not in author else " ".join(words)
+
+
+def _main_title(title):
+    """The title without its subtitle ("Frankenstein; Or, The Modern Prometheus" → "Frankenstein")."""
+    return re.split(r"[:;(\[]| or,", title, maxsplit=1)[0] or title
+
+
+class TrigramIndex:
+    """Inverted index from trigram ids to slots; removed books leave a tombstone until the next
+    compaction."""
+
+    def __init__(self):
+        self.gram_ids = {}
+        self.postings = []       # gram id → array of slots
+        self.books = []          # slot → (book_id, title, author), None once removed
+        self.text = []           # slot → normalized "title\nauthor"
+        self.grams = []          # slot → array of gram ids in title or author
+        self.title_grams = []    # slot → array of gram ids of the main title (duplicates)
+        self.slots = {}          # book_id → slot
+        self.removed = 0
+        self.word_grams = {}     # word → its gram ids (titles and names repeat words a lot)
+
+    def _ids(self, grams):
+        gram_ids = self.gram_ids
+        return array("I", [gram_ids[g] for g in grams if g in gram_ids])
+
+    def _word_ids(self, word):
+        ids = self.word_grams.get(word)
+        if ids is None:
+            ids = []
+            for g in trigrams(word):
+                gram_id = self.gram_ids.setdefault(g, len(self.postings))
+                if gram_id == len(self.postings):
+                    self.postings.append(array("I"))
+                ids.append(gram_id)
+            self.word_grams[word] = ids
+        return ids
+
+    def _text_ids(self, text):
+        return set().union(*map(self._word_ids, text.split()))
+
+    def add(self, book_id, title, author):
+        slot = len(self.books)
+        title_n, author_n = normalize(title), normalize(author)
+        title_ids = self._text_ids(title_n)
+        grams = title_ids | self._text_ids(author_n)
+        postings = self.postings
+        for g in grams:
+            postings[g].append(slot)
+        main = _main_title(title)
+        self.books.append((book_id, title, author))
+        self.text.append(f"{title_n}\n{author_n}")
+        self.grams.append(array("I", grams))
+        self.title_grams.append(array("I", title_ids if main == title else self._text_ids(normalize(main))))
+        self.slots[book_id] = slot
+
+    def remove(self, book_id):
+        slot = self.slots.pop(book_id)
+        self.books[slot] = None
+        self.grams[slot] = self.title_grams[slot] = array("I")
+        self.removed += 1
+
+    def sync(self, books):
+        """Index added or renamed books and drop removed ones; returns how many were (re)indexed."""
+        current = {b["id"]: (b["title"] or "", b["author"] or "") for b in books}
+        for book_id, slot in list(self.slots.items()):
+            if current.get(book_id) != self.books[slot][1:]:
+                self.remove(book_id)
+        added = [(book_id, ta) for book_id, ta in current.items() if book_id not in self.slots]
+        if self.removed > len(self.slots) // 4 + 64:
+            live = [self.books[s] for s in self.slots.values()]
+            self.__init__()
+            for book in live:
+                self.add(*book)
+        for book_id, (title, author) in added:
+            self.add(book_id, title, author)
+        return len(added)
+
+    def _candidates(self, gram_ids, need):
+        """Slots sharing at least one of the rarest len(gram_ids) - need + 1 trigrams: any slot
+        with `need` of them in common must hold one of those."""
+        rarest = sorted(gram_ids, key=lambda g: len(self.postings[g]))[:len(gram_ids) - need + 1]
+        return set().union(*(self.postings[g] for g in rarest))
+
+    def search(self, query, limit=None, threshold=SEARCH_THRESHOLD):
+        """[(score, book_id)] best first. Exact substrings of a title or author score 1.0, others
+        the share of the query's trigrams they contain (ties: the closer overall match first)."""
+        q = normalize(query)
+        if not q:
+            return []
+        q_grams = trigrams(q)
+        q_ids = sorted(set(self._ids(q_grams)), key=lambda g: len(self.postings[g]))
+        scores = {}
+        need = max(1, math.ceil(threshold * len(q_grams) - 1e-9))
+        if len(q_ids) >= need:
+            # Count hits in the postings of all but the few most common trigrams; a book short
+            # of need - common there cannot qualify, the rest are checked against those.
+            common = 0
+            while common < need - 1 and \
+                    len(self.postings[q_ids[-1 - common]]) > COMMON_GRAM_SHARE * len(self.slots):
+                common += 1
+            counts = Counter(chain.from_iterable(self.postings[g] for g in q_ids[:len(q_ids) - common]))
+            q_set = set(q_ids)
+            for slot, shared in counts.items():
+                if shared < need - common or not self.books[slot]:
+                    continue
+                if common:
+                    shared = len(q_set.intersection(self.grams[slot]))
+                if shared >= need:
+                    scores[slot] = (shared / len(q_grams),
+                                    shared / (len(q_grams) + len(self.grams[slot]) - shared))
+        # Exact substrings, including mid-word ones whose padded trigrams don't match.
+        inner = {w[i:i + 3] for w in q.split() for i in range(len(w) - 2)}
+        inner_ids = [self.gram_ids[g] for g in inner if g in self.gram_ids]
+        if len(inner_ids) == len(inner):
+            slots = (self._candidates(inner_ids, len(inner_ids)) if inner_ids else
+                     (s for s in self.slots.values()))
+            for slot in slots:
+                if slot not in scores or scores[slot][0] < 1.0:
+                    if self.books[slot] and q in self.text[slot]:
+                        scores[slot] = (1.0, scores.get(slot, (0, 0))[1])
+        best = heapq.nlargest(limit, scores.items(), key=lambda kv: kv[1]) if limit else \
+            sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
+        return [(round(score[0], 3), self.books[slot][0]) for slot, score in best]
+
+    def duplicates(self, title_threshold=DUPLICATE_TITLE_THRESHOLD,
+                   surname_threshold=DUPLICATE_SURNAME_THRESHOLD):
+        """Pairs of books whose main titles and authors are near-identical, most similar first.
+
+        All-pairs with prefix filtering: books are visited smallest title first and each is
+        indexed under the rarest trigrams of its main title, enough that two titles over the
+        threshold always share one; titles too short to reach the threshold are skipped. Only
+        books whose authors' surnames start alike are compared (a book without a known author
+        is compared with every book), and titles must carry the same numbers ("Vol. 1" and
+        "Vol. 2" are different books).
+        """
+        df = [len(p) for p in self.postings]
+        surnames = {s: None if self.text[s].split("\n")[1] in UNKNOWN_AUTHORS else _surname(self.books[s][2])
+                    for s in self.slots.values()}
+        any_unknown = None in surnames.values()
+        local, start = defaultdict(list), defaultdict(int)
+        pairs = []
+        for slot in sorted(self.slots.values(), key=lambda s: len(self.title_grams[s])):
+            grams = self.title_grams[slot]
+            if not grams:
+                continue
+            size = len(grams)
+            digits = tuple(re.findall(r"\d+", self.text[slot].split("\n")[0]))
+            prefix = sorted(grams, key=df.__getitem__)[:size - math.ceil(title_threshold * size) + 1]
+            surname = surnames[slot]
+            if surname is not None:
+                probe, index = [surname[:4], "?"], [surname[:4]]
+            else:
+                probe, index = ["*"], ["?"]
+            if any_unknown:
+                index.append("*")
+            gram_set, seen = set(grams), set()
+            for block in probe:
+                for g in prefix:
+                    key = (block, digits, g)
+                    entries = local.get(key)
+                    if not entries:
+                        continue
+                    while start[key] < len(entries) and len(self.title_grams[entries[start[key]]]) < title_threshold * size:
+                        start[key] += 1  # too short for this or any later (longer) title
+                    for other in entries[start[key]:]:
+                        if other in seen:
+                            continue
+                        seen.add(other)
+                        other_grams = self.title_grams[other]
+                        shared = len(gram_set.intersection(other_grams))
+                        title_sim = shared / (size + len(other_grams) - shared)
+                        if title_sim < title_threshold:
+                            continue
+                        author_sim = None
+                        if surname is not None and surnames[other] is not None:
+                            author_sim = similarity(surname, surnames[other])
+                            if author_sim < surname_threshold:
+                                continue
+                        pairs.append((title_sim, author_sim, other, slot))
+            for block in index:
+                for g in prefix:
+                    local[(block, digits, g)].append(slot)
+        pairs.sort(key=lambda p: (p[0], p[1] or 0), reverse=True)
+        return [{"book_ids": [self.books[a][0], self.books[b][0]],
+                 "titles": [self.books[a][1], self.books[b][1]],
+                 "authors": [self.books[a][2], self.books[b][2]],
+                 "title_similarity": round(t, 3),
+                 "author_similarity": None if s is None else round(s, 3)} for t, s, a, b in pairs]
+
+
+# ─── Shared Index ────────────────────────────────────────────────────────────
+# One index per process, synced to the library revision on first use after a change.
+_index = TrigramIndex()
+_index_at = (None, None)  # (db path, library revision) last synced
+_index_lock = threading.Lock()
+
+
+def get_fuzzy_index():
+    global _index, _index_at
+    path, revision = db_path(), get_library_revision().value
+    with _index_lock:
+        hit = _index_at == (path, revision)
+        if not hit:
+            if _index_at[0] != path:
+                _index = TrigramIndex()
+            _index.sync(_library_snapshot(path, revision))
+            _index_at = (path, revision)
+    get_metrics().record_cache("fuzzy_index", hit)
+    return _index
+
+
+@instrumented("db")
+def search_library(query, limit=None, threshold=SEARCH_THRESHOLD):
+    """Library books matching `query` by title or author, typos allowed, best first; each is a
+    copy with its "match_score"."""
+    hits = get_fuzzy_index().search(query, limit, threshold)
+    if not hits:
+        return []
+    by_id = {b["id"]: b for b in get_library()}
+    return [{**by_id[book_id], "match_score": score} for score, book_id in hits if book_id in by_id]
+
+
+@functools.lru_cache(maxsize=4)
+def _duplicates_snapshot(path, revision):
+    _cache_state.miss = True
+    return get_fuzzy_index().duplicates()
+
+
+def find_duplicate_books(limit=50):
+    """Candidate duplicate pairs (similar main title and author) for review, most similar first."""
+    return cache_lookup("duplicates", _duplicates_snapshot, db_path(), get_library_revision().value)[:limit]
@@ -0,0 +1,265 @@
+"""Gemini access shared by every session: clients, the per-key request scheduler and the
+explicit context cache for the static prompt prefix."""
+
+import functools
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import random
+import re
+import threading
+import time
+
+from .caches import _cache_state, cache_lookup
+from .metrics import get_metrics, timed
+from .tools import TOOLS
+
+# ─── Gemini Client ───────────────────────────────────────────────────────────
+GEMINI_MODEL = "gemini-2.0-flash"
+
+
+def _api_key_hash(api_key):
+    return hashlib.sha256((api_key or "").strip().encode()).hexdigest()
+
+
+@functools.lru_cache(maxsize=32)
+def _genai_client(key_hash, api_key):
+    _cache_state.miss = True
+    from google import genai
+    return genai.Client(api_key=api_key)
+
+# Cached per API-key hash: the key can change at runtime, and then maps to its own client.
+def get_client(api_key):
+    api_key = (api_key or "").strip()
+    if api_key:
+        return cache_lookup("genai_client", _genai_client, _api_key_hash(api_key), api_key)
+    return None
+
+
+# ─── Gemini Scheduler ────────────────────────────────────────────────────────
+# All sessions sharing an API key draw from one token bucket sized to the key's quota.
+# Waiting callers are served in priority order (interactive chat before background work),
+# and a 429 pauses the whole bucket with jittered exponential backoff before retrying.
+GEMINI_RPM = float(os.environ.get("LIBRARY_GEMINI_RPM", 15))
+GEMINI_BURST = int(os.environ.get("LIBRARY_GEMINI_BURST", 3))
+GEMINI_MAX_RETRIES = 4
+GEMINI_BACKOFF_S = 2.0
+GEMINI_QUEUE_TIMEOUT_S = 90.0
+PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND = 0, 1
+_PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BACKGROUND: "background"}
+
+
+class GeminiDeadlineExceeded(TimeoutError):
+    """No Gemini slot (or retry) fits before the caller's deadline."""
+
+
+def _is_rate_limited(exc):
+    err = str(exc)
+    return "RESOURCE_EXHAUSTED" in err or "429" in err
+
+
+def _is_cache_gone(exc):
+    """The cached content a request named expired, was evicted or can't be used by this key."""
+    err = str(exc)
+    return "NOT_FOUND" in err or (("INVALID_ARGUMENT" in err or "PERMISSION_DENIED" in err)
+                                  and "cachedcontent" in err.lower().replace(" ", ""))
+
+
+class GeminiScheduler:
+    """Token bucket for one API key; acquire() blocks until it is the caller's turn."""
+
+    def __init__(self, rpm=GEMINI_RPM, burst=GEMINI_BURST):
+        self.rate = rpm / 60.0
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.cond = threading.Condition()
+        self.waiting = []  # heap of (priority, seq)
+        self.seq = itertools.count()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def depth(self):
+        with self.cond:
+            return len(self.waiting)
+
+    def acquire(self, priority=PRIORITY_INTERACTIVE, timeout=GEMINI_QUEUE_TIMEOUT_S):
+        ticket = (priority, next(self.seq))
+        t0 = time.monotonic()
+        with self.cond:
+            heapq.heappush(self.waiting, ticket)
+            depth = len(self.waiting)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if self.waiting[0] == ticket and self.tokens >= 1 and now >= self.paused_until:
+                        heapq.heappop(self.waiting)
+                        self.tokens -= 1
+                        break
+                    if now - t0 > timeout:
+                        raise TimeoutError(f"RESOURCE_EXHAUSTED: no Gemini slot within {timeout:.0f}s")
+                    wait = max(self.paused_until - now, (1 - self.tokens) / self.rate, 0.0)
+                    self.cond.wait(min(wait or 1.0, 1.0, timeout - (now - t0) + 0.01))
+            except BaseException:
+                self.waiting.remove(ticket)
+                heapq.heapify(self.waiting)
+                raise
+            finally:
+                self.cond.notify_all()
+        get_metrics().observe("gemini_queue", _PRIORITY_NAMES.get(priority, str(priority)),
+                              (time.monotonic() - t0) * 1000, depth)
+
+    def backoff(self, attempt, exc):
+        """Pause the bucket after a 429, honouring the server's retry delay when it sends one."""
+        hint = re.search(r"retry(?:Delay|[ _-]after)\D{0,5}(\d+(?:\.\d+)?)", str(exc), re.I)
+        delay = float(hint.group(1)) if hint else GEMINI_BACKOFF_S * 2 ** attempt
+        delay *= random.uniform(0.8, 1.2)
+        with self.cond:
+            self.paused_until = max(self.paused_until, time.monotonic() + delay)
+            self.tokens = 0.0
+            self.cond.notify_all()
+
+    def call(self, fn, priority=PRIORITY_INTERACTIVE, deadline=None):
+        """fn() in turn, retried after 429s. With a time.monotonic() `deadline`, queueing is cut
+        short and retries stop there, raising GeminiDeadlineExceeded."""
+        for attempt in range(GEMINI_MAX_RETRIES + 1):
+            try:
+                timeout = GEMINI_QUEUE_TIMEOUT_S
+                if deadline is not None:
+                    timeout = min(timeout, deadline - time.monotonic())
+                    if timeout <= 0:
+                        raise GeminiDeadlineExceeded("Turn time budget exhausted before a Gemini slot was free.")
+                self.acquire(priority, timeout)
+                return fn()
+            except GeminiDeadlineExceeded:
+                raise
+            except Exception as e:
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise GeminiDeadlineExceeded("Turn time budget exhausted while waiting for Gemini.") from e
+                if attempt == GEMINI_MAX_RETRIES or not _is_rate_limited(e) or isinstance(e, TimeoutError):
+                    raise
+                self.backoff(attempt, e)
+
+
+@functools.lru_cache(maxsize=32)
+def _gemini_scheduler(key_hash):
+    return GeminiScheduler()
+
+
+def get_scheduler(api_key):
+    return _gemini_scheduler(_api_key_hash(api_key))
+
+
+# ─── Gemini Context Cache ────────────────────────────────────────────────────
+# The system prompt and tool declarations are identical on every call, so they are stored once
+# per key/model as Gemini cached content and referenced by name. If the model or key does not
+# support caching (or the prefix is below the minimum size), calls go uncached and creation is
+# retried after GEMINI_CACHE_RETRY_S. Creation is a request like any other, so it goes through
+# the key's scheduler; one caller creates while the others go uncached rather than wait.
+GEMINI_CACHE_TTL_S = int(os.environ.get("LIBRARY_GEMINI_CACHE_TTL_S", 3600))
+GEMINI_CACHE_RETRY_S = 600
+
+
+class PromptCache:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.name = None
+        self.digest = None
+        self.expires = 0.0
+        self.unavailable_until = 0.0
+        self.creating = False
+
+    def get(self, client, model, system_prompt, tools, scheduler, priority=PRIORITY_INTERACTIVE,
+            deadline=None):
+        """Name of a live cached content for this prompt, creating it if needed; None to go uncached."""
+        from google.genai import types as genai_types
+        digest = hashlib.sha256((system_prompt + json.dumps(TOOLS, sort_keys=True)).encode()).hexdigest()
+        with self.lock:
+            now = time.time()
+            # Refresh a minute early so a request never races the server-side expiry.
+            if self.name and self.digest == digest and now < self.expires - 60:
+                get_metrics().record_cache("gemini_context", True)
+                return self.name
+            get_metrics().record_cache("gemini_context", False)
+            if now < self.unavailable_until or self.creating:
+                return None
+            self.creating = True
+        name = None
+        try:
+            with timed("gemini", "caches.create"):
+                cached = scheduler.call(lambda: client.caches.create(
+                    model=model, config=genai_types.CreateCachedContentConfig(
+                        system_instruction=system_prompt, tools=tools,
+                        ttl=f"{GEMINI_CACHE_TTL_S}s", display_name="library-assistant")), priority, deadline)
+            name = cached.name
+        except Exception as e:
+            if not (_is_rate_limited(e) or isinstance(e, TimeoutError)):  # unsupported: stop trying
+                with self.lock:
+                    self.unavailable_until = time.time() + GEMINI_CACHE_RETRY_S
+        finally:
+            with self.lock:
+                self.creating = False
+                if name:
+                    self.name, self.digest, self.expires = name, digest, time.time() + GEMINI_CACHE_TTL_S
+        return name
+
+    def invalidate(self, name):
+        with self.lock:
+            if self.name == name:
+                self.name = None
+
+
+@functools.lru_cache(maxsize=32)
+def _prompt_cache(key_hash, model):
+    return PromptCache()
+
+
+def get_prompt_cache(api_key, model=GEMINI_MODEL):
+    return _prompt_cache(_api_key_hash(api_key), model)
+
+
+def _build_gemini_tools():
+    """Convert tool definitions into new google-genai SDK FunctionDeclaration format."""
+    from google.genai import types as genai_types
+    TYPE_MAP = {
+        "string": genai_types.Type.STRING,
+        "integer": genai_types.Type.INTEGER,
+        "number": genai_types.Type.NUMBER,
+        "boolean": genai_types.Type.BOOLEAN,
+        "array": genai_types.Type.ARRAY,
+        "object": genai_types.Type.OBJECT,
+    }
+
+    def build_schema(pval):
+        ptype = TYPE_MAP.get(str(pval.get("type", "string")).lower(), genai_types.Type.STRING)
+        kwargs = {"type": ptype}
+        if "description" in pval:
+            kwargs["description"] = pval["description"]
+        if "enum" in pval:
+            kwargs["enum"] = [str(e) for e in pval["enum"] if e]
+        return genai_types.Schema(**kwargs)
+
+    declarations = []
+    for t in TOOLS:
+        schema = t["input_schema"]
+        props = {}
+        for pname, pval in schema.get("properties", {}).items():
+            props[pname] = build_schema(pval)
+        required = schema.get("required", [])
+        param_schema = genai_types.Schema(
+            type=genai_types.Type.OBJECT,
+            properties=props,
+            required=required,
+        )
+        declarations.append(genai_types.FunctionDeclaration(
+            name=t["name"],
+            description=t["description"],
+            parameters=param_schema if props else None,  # the API rejects empty OBJECT schemas
+        ))
+    return [genai_types.Tool(function_declarations=declarations)]
@@ -0,0 +1,337 @@
+"""
+Durable background jobs in SQLite, run by a pool of worker processes.
+
+A job is claimed by atomically moving it to `running` with a lease; a worker that dies simply
+lets the lease expire and the job is claimed again. Failures are retried with jittered
+exponential backoff until `max_attempts`. Only one queued/running job exists per dedupe key,
+so enqueueing the same work twice returns the existing job. Finished and failed jobs are
+deleted by the workers JOB_RETENTION_S after they last changed.
+
+    python -m library_core worker --processes 4
+"""
+
+import json
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from .db import db_fill_book_blanks, db_get_book, db_path, get_db
+from .metrics import timed
+
+JOB_LEASE_S = 300
+JOB_POLL_S = 1.0
+JOB_BACKOFF_S = 5.0
+JOB_MAX_BACKOFF_S = 600.0
+WORKER_HEARTBEAT_S = 5.0
+WORKER_STALE_S = 3 * WORKER_HEARTBEAT_S
+JOB_RETENTION_S = float(os.environ.get("LIBRARY_JOB_RETENTION_S", 7 * 24 * 3600))
+JOB_PRUNE_INTERVAL_S = 3600.0
+# Lower runs first, as with the Gemini scheduler's PRIORITY_INTERACTIVE/PRIORITY_BACKGROUND.
+PRIORITY_INTERACTIVE_JOB, PRIORITY_PREFETCH_JOB = 0, 1
+JOB_WORKERS = int(os.environ.get("LIBRARY_JOB_WORKERS", "2"))  # 0: don't start a pool from the app
+
+
+def _job_dict(row):
+    job = dict(row)
+    job["payload"] = json.loads(job["payload"])
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+
+def enqueue(kind, payload=None, priority=PRIORITY_PREFETCH_JOB, max_attempts=3):
+    """Queue a job, or return the id of the identical job already queued or running."""
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    payload_json = json.dumps(payload or {}, sort_keys=True)
+    dedupe_key = f"{kind}:{payload_json}"
+    now = time.time()
+    conn = get_db()
+    with conn:
+        c = conn.execute("""
+            INSERT INTO jobs (kind, payload, dedupe_key, priority, max_attempts, created_at, updated_at)
+            VALUES (?,?,?,?,?,?,?) ON CONFLICT DO NOTHING
+        """, (kind, payload_json, dedupe_key, priority, max_attempts, now, now))
+        if c.rowcount:
+            job_id = c.lastrowid
+        else:
+            job_id, old_priority = conn.execute("""
+                SELECT id, priority FROM jobs WHERE dedupe_key=? AND status IN ('queued', 'running')
+            """, (dedupe_key,)).fetchone()
+            if priority < old_priority:  # someone is now waiting on it
+                conn.execute("UPDATE jobs SET priority=? WHERE id=?", (priority, job_id))
+    conn.close()
+    return job_id
+
+
+def claim(worker):
+    """Lease the next runnable job (most urgent priority, then oldest) to `worker`, or None."""
+    now = time.time()
+    conn = get_db()
+    with conn:
+        # A job whose worker died on its last attempt is not retried again.
+        conn.execute("""
+            UPDATE jobs SET status='failed', error='worker lost (lease expired)', updated_at=?
+            WHERE status='running' AND lease_until < ? AND attempts >= max_attempts
+        """, (now, now))
+        row = conn.execute("""
+            UPDATE jobs SET status='running', attempts=attempts+1, lease_until=?, worker=?, updated_at=?
+            WHERE id = (SELECT id FROM jobs
+                        WHERE (status='queued' AND run_after <= ?) OR (status='running' AND lease_until < ?)
+                        ORDER BY priority, id LIMIT 1)
+            RETURNING *
+        """, (now + JOB_LEASE_S, worker, now, now, now)).fetchone()
+    conn.close()
+    return _job_dict(row) if row else None
+
+
+def complete(job_id, worker, result):
+    conn = get_db()
+    with conn:
+        conn.execute("""
+            UPDATE jobs SET status='done', result=?, error='', lease_until=NULL, updated_at=?
+            WHERE id=? AND worker=? AND status='running'
+        """, (json.dumps(result, default=str), time.time(), job_id, worker))
+    conn.close()
+
+
+def fail(job, worker, error):
+    """Requeue with backoff, or mark failed once the job has used all its attempts."""
+    now = time.time()
+    final = job["attempts"] >= job["max_attempts"]
+    delay = min(JOB_MAX_BACKOFF_S, JOB_BACKOFF_S * 2 ** (job["attempts"] - 1)) * random.uniform(0.5, 1.5)
+    conn = get_db()
+    with conn:
+        conn.execute("""
+            UPDATE jobs SET status=?, error=?, run_after=?, lease_until=NULL, updated_at=?
+            WHERE id=? AND worker=? AND status='running'
+        """, ("failed" if final else "queued", error[:1000], now + delay, now, job["id"], worker))
+    conn.close()
+
+
+def prune_jobs(older_than_s=JOB_RETENTION_S):
+    """Delete done and failed jobs not updated for `older_than_s`; returns how many."""
+    conn = get_db()
+    with conn:
+        deleted = conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?",
+                               (time.time() - older_than_s,)).rowcount
+    conn.close()
+    return deleted
+
+
+def get_job(job_id):
+    conn = get_db()
+    row = conn.execute("SELECT * FROM jobs WHERE id=?", (job_id,)).fetchone()
+    conn.close()
+    return _job_dict(row) if row else None
+
+
+def get_jobs(job_ids):
+    if not job_ids:
+        return []
+    conn = get_db()
+    rows = conn.execute(f"SELECT * FROM jobs WHERE id IN ({','.join('?' * len(job_ids))}) ORDER BY id DESC",
+                        list(job_ids)).fetchall()
+    conn.close()
+    return [_job_dict(r) for r in rows]
+
+
+def list_jobs(limit=20, status=None):
+    conn = get_db()
+    rows = conn.execute(f"""
+        SELECT * FROM jobs {'WHERE status=?' if status else ''} ORDER BY id DESC LIMIT ?
+    """, (status, limit) if status else (limit,)).fetchall()
+    conn.close()
+    return [_job_dict(r) for r in rows]
+
+
+def job_counts():
+    """Jobs per status, plus the number of workers that heartbeated recently."""
+    conn = get_db()
+    counts = dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+    counts["workers"] = conn.execute("SELECT COUNT(*) FROM job_workers WHERE heartbeat_at > ?",
+                                     (time.time() - WORKER_STALE_S,)).fetchone()[0]
+    conn.close()
+    return counts
+
+
+_workers_seen = {}  # db path → (checked at, any worker heartbeating)
+
+
+def workers_available():
+    """Whether a pool will run queued jobs: this process started one, or a worker heartbeated
+    recently. The heartbeat check is cached for WORKER_HEARTBEAT_S (UI reruns call this a lot)."""
+    if _pool_proc is not None and _pool_proc.poll() is None:
+        return True
+    checked_at, available = _workers_seen.get(db_path(), (0.0, False))
+    if time.time() - checked_at > WORKER_HEARTBEAT_S:
+        available = job_counts()["workers"] > 0
+        _workers_seen[db_path()] = (time.time(), available)
+    return available
+
+
+# ─── Handlers ────────────────────────────────────────────────────────────────
+# Each takes the job payload as keyword arguments and returns a JSON-able result; raising
+# (or returning success=False) fails the attempt.
+def _index_book(gutenberg_id):
+    from .tools import _ensure_book_indexed
+    book = _ensure_book_indexed(gutenberg_id)
+    return {"gutenberg_id": gutenberg_id, "title": book.get("title"), "passages": book.get("passages", 0)}
+
+
+def _enrich_book(book_id):
+    """Fill a library book's blank genre from its Open Library subjects."""
+    from .tools import get_book_details
+    book = db_get_book(book_id)
+    if not book or not book.get("open_library_key"):
+        return {"book_id": book_id, "skipped": True}
+    details = get_book_details(book["open_library_key"])
+    if not details["success"]:
+        return details
+    subjects = [s for s in details.get("subjects", []) if len(s) < 40]
+    changed = db_fill_book_blanks(book_id, genre=subjects[0] if subjects else "")
+    return {"book_id": book_id, "updated": changed}
+
+
+def enqueue_book_followups(book_id, priority=PRIORITY_PREFETCH_JOB):
+    """Queue the background work a newly added book needs; returns the job ids. Nothing is
+    queued while no pool is running (it would pile up unclaimed): passage search indexes a book
+    on demand, and enrichment only fills in blanks."""
+    if not workers_available():
+        return []
+    book = db_get_book(book_id) or {}
+    job_ids = []
+    if book.get("gutenberg_id"):
+        job_ids.append(enqueue("index_book", {"gutenberg_id": book["gutenberg_id"]}, priority))
+    if book.get("open_library_key"):
+        job_ids.append(enqueue("enrich_book", {"book_id": book_id}, priority))
+    return job_ids
+
+
+JOB_HANDLERS = {
+    "index_book": _index_book,
+    "enrich_book": _enrich_book,
+}
+
+
+def run_job(job, worker):
+    try:
+        with timed("job", job["kind"]) as m:
+            result = JOB_HANDLERS[job["kind"]](**job["payload"])
+            m["error"] = isinstance(result, dict) and result.get("success") is False
+    except Exception as e:
+        fail(job, worker, f"{type(e).__name__}: {e}")
+        return False
+    if isinstance(result, dict) and result.get("success") is False:
+        fail(job, worker, str(result.get("error", "failed")))
+        return False
+    complete(job["id"], worker, result)
+    return True
+
+
+# ─── Workers ─────────────────────────────────────────────────────────────────
+def _heartbeat(worker, started_at):
+    conn = get_db()
+    with conn:
+        conn.execute("""
+            INSERT INTO job_workers (worker, pid, started_at, heartbeat_at) VALUES (?,?,?,?)
+            ON CONFLICT(worker) DO UPDATE SET heartbeat_at=excluded.heartbeat_at
+        """, (worker, os.getpid(), started_at, time.time()))
+    conn.close()
+
+
+def _retire(worker):
+    conn = get_db()
+    with conn:
+        conn.execute("DELETE FROM job_workers WHERE worker=?", (worker,))
+    conn.close()
+
+
+def worker_loop(worker, stop=None, parent_pid=None, once=False):
+    """Claim and run jobs until `stop` is set (or the queue is empty, with once=True)."""
+    started = last_beat = time.time()
+    last_prune = 0.0
+    _heartbeat(worker, started)
+    try:
+        while not (stop and stop.is_set()):
+            if parent_pid and os.getppid() != parent_pid:
+                break  # orphaned: the pool (or the app that started it) is gone
+            if time.time() - last_beat > WORKER_HEARTBEAT_S:
+                _heartbeat(worker, started)
+                last_beat = time.time()
+            if time.time() - last_prune > JOB_PRUNE_INTERVAL_S:
+                prune_jobs()
+                last_prune = time.time()
+            job = claim(worker)
+            if job:
+                run_job(job, worker)
+            elif once:
+                break
+            else:
+                time.sleep(JOB_POLL_S)
+    finally:
+        _retire(worker)
+
+
+def _pool_worker(index, stop, parent_pid):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the pool coordinates shutdown
+    worker_loop(f"{socket.gethostname()}:{os.getpid()}:{index}", stop, parent_pid)
+
+
+def run_pool(processes=2, exit_with=None):
+    """Run `processes` worker processes until interrupted, restarting any that die.
+
+    With `exit_with` (a pid), the pool also shuts down once that process is gone.
+    """
+    ctx = multiprocessing.get_context("spawn")
+    stop = ctx.Event()
+    procs = {}
+    signal.signal(signal.SIGTERM, signal.default_int_handler)  # shut down like Ctrl-C
+    try:
+        while not stop.is_set():
+            for i in range(processes):
+                if i not in procs or not procs[i].is_alive():
+                    procs[i] = ctx.Process(target=_pool_worker, args=(i, stop, os.getpid()), daemon=True)
+                    procs[i].start()
+            if exit_with and os.getppid() != exit_with:
+                break
+            stop.wait(WORKER_HEARTBEAT_S)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        for p in procs.values():
+            p.join(JOB_POLL_S * 5)
+            if p.is_alive():
+                p.terminate()
+
+
+_pool_lock = threading.Lock()
+_pool_proc = None
+
+
+def ensure_worker_pool(processes=JOB_WORKERS):
+    """Start a worker pool next to this process unless one is already heartbeating.
+
+    The pool runs as `python -m library_core worker` in its own process group and exits with
+    this process. Returns whether workers are (or will shortly be) available; with
+    processes <= 0 it starts nothing and returns False without touching the database (use
+    workers_available() to look for a pool run elsewhere).
+    """
+    global _pool_proc
+    if processes <= 0:
+        return False
+    with _pool_lock:
+        if workers_available():
+            return True
+        _pool_proc = subprocess.Popen(
+            [sys.executable, "-m", "library_core", "worker", "--processes", str(processes),
+             "--exit-with", str(os.getpid())],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            stdin=subprocess.DEVNULL, start_new_session=True)
+        return True
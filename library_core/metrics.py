@@ -0,0 +1,172 @@
+"""Process-wide latency, payload, error and cache metrics, with Prometheus/JSONL export."""
+
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+# ─── Instrumentation ─────────────────────────────────────────────────────────
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+METRICS_EXPORT_PATH = os.environ.get("LIBRARY_METRICS_EXPORT", "")
+METRICS_EXPORT_INTERVAL_S = 15
+
+
+class MetricsRegistry:
+    """Process-wide latency, payload, error and cache counters shared by every session.
+
+    Series are keyed by (kind, name): kind is one of tool / db / http / breaker / gemini /
+    gemini_queue / api / job; breaker counts requests refused by an open circuit.
+    Payload is JSON chars for tools, rows for db helpers, body bytes for HTTP, tokens for
+    Gemini and queue depth on arrival for the Gemini scheduler.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.series = {}
+        self.caches = {}
+        self.last_export = 0.0
+        self.warm = False
+
+    def observe(self, kind, name, ms, payload=0, error=False):
+        with self.lock:
+            s = self.series.get((kind, name))
+            if s is None:
+                s = self.series[(kind, name)] = {
+                    "count": 0, "errors": 0, "total_ms": 0.0, "payload": 0,
+                    "buckets": [0] * (len(LATENCY_BUCKETS_MS) + 1), "recent": deque(maxlen=1000)}
+            s["count"] += 1
+            s["errors"] += bool(error)
+            s["total_ms"] += ms
+            s["payload"] += payload or 0
+            s["buckets"][bisect.bisect_left(LATENCY_BUCKETS_MS, ms)] += 1
+            s["recent"].append(ms)
+
+    def record_cache(self, cache, hit):
+        with self.lock:
+            hits_misses = self.caches.setdefault(cache, [0, 0])
+            hits_misses[0 if hit else 1] += 1
+
+    def mark_warm(self):
+        """True exactly once per process: for the first completed script run (the cold start)."""
+        with self.lock:
+            cold, self.warm = not self.warm, True
+        return cold
+
+    def reset(self):
+        with self.lock:
+            self.series.clear()
+            self.caches.clear()
+
+    def snapshot(self):
+        rows = []
+        with self.lock:
+            for (kind, name), s in sorted(self.series.items()):
+                recent = sorted(s["recent"])
+                pct = lambda q: round(recent[min(len(recent) - 1, int(q * len(recent)))], 1)
+                rows.append({
+                    "kind": kind, "name": name, "calls": s["count"], "errors": s["errors"],
+                    "avg_ms": round(s["total_ms"] / s["count"], 1),
+                    "p50_ms": pct(0.50), "p95_ms": pct(0.95), "p99_ms": pct(0.99),
+                    "avg_payload": int(s["payload"] / s["count"]),
+                })
+        return rows
+
+    def cache_snapshot(self):
+        with self.lock:
+            return [{"cache": c, "hits": h, "misses": m,
+                     "hit_rate": round(h / (h + m), 3) if h + m else 0.0}
+                    for c, (h, m) in sorted(self.caches.items())]
+
+    def to_prometheus(self):
+        lines = ["# TYPE library_latency_ms histogram"]
+        with self.lock:
+            series = sorted(self.series.items())
+            for (kind, name), s in series:
+                labels = f'kind="{kind}",name="{name}"'
+                cumulative = 0
+                for bound, n in zip(LATENCY_BUCKETS_MS + ("+Inf",), s["buckets"]):
+                    cumulative += n
+                    lines.append(f'library_latency_ms_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f"library_latency_ms_sum{{{labels}}} {s['total_ms']:.3f}")
+                lines.append(f"library_latency_ms_count{{{labels}}} {s['count']}")
+            lines.append("# TYPE library_errors_total counter")
+            lines += [f'library_errors_total{{kind="{k}",name="{n}"}} {s["errors"]}' for (k, n), s in series]
+            lines.append("# TYPE library_payload_total counter")
+            lines += [f'library_payload_total{{kind="{k}",name="{n}"}} {s["payload"]}' for (k, n), s in series]
+            lines.append("# TYPE library_cache_requests_total counter")
+            for cache, (h, m) in sorted(self.caches.items()):
+                lines.append(f'library_cache_requests_total{{cache="{cache}",result="hit"}} {h}')
+                lines.append(f'library_cache_requests_total{{cache="{cache}",result="miss"}} {m}')
+        return "\n".join(lines) + "\n"
+
+    def to_jsonl(self):
+        ts = datetime.now().isoformat(timespec="seconds")
+        lines = [json.dumps({"ts": ts, "type": "latency", **row}) for row in self.snapshot()]
+        lines += [json.dumps({"ts": ts, "type": "cache", **row}) for row in self.cache_snapshot()]
+        return "".join(line + "\n" for line in lines)
+
+    def export(self, path):
+        """Append a JSONL snapshot, or atomically rewrite a Prometheus textfile (any other suffix)."""
+        if path.endswith(".jsonl"):
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(self.to_jsonl())
+        else:
+            tmp = path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(self.to_prometheus())
+            os.replace(tmp, path)
+        self.last_export = time.time()
+
+    def maybe_export(self, path, interval=METRICS_EXPORT_INTERVAL_S):
+        if path and time.time() - self.last_export >= interval:
+            self.export(path)
+
+
+_metrics = MetricsRegistry()
+
+
+def get_metrics():
+    return _metrics
+
+
+def _payload_size(result):
+    if isinstance(result, (list, str, bytes)):
+        return len(result)
+    if isinstance(result, dict):
+        return len(json.dumps(result, default=str))
+    return 0
+
+
+def instrumented(kind):
+    """Decorator recording latency, payload size and errors (exceptions or success=False)."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            t0, result, error = time.perf_counter(), None, True
+            try:
+                result = fn(*args, **kwargs)
+                error = isinstance(result, dict) and result.get("success") is False
+                return result
+            finally:
+                get_metrics().observe(kind, fn.__name__, (time.perf_counter() - t0) * 1000,
+                                      _payload_size(result), error)
+        return inner
+    return wrap
+
+
+@contextmanager
+def timed(kind, name):
+    m = {"payload": 0, "error": False}
+    t0 = time.perf_counter()
+    try:
+        yield m
+    except Exception:
+        m["error"] = True
+        raise
+    finally:
+        get_metrics().observe(kind, name, (time.perf_counter() - t0) * 1000, m["payload"], m["error"])
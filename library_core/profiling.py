@@ -0,0 +1,141 @@
+"""
+cProfile + tracemalloc around one run of some code (a Streamlit rerun, a CLI call), for finding
+out why it was slow: the top functions by cumulative time, the top sites of memory still held at
+the end, and the peak traced memory. Each run can be dumped to PROFILE_DIR as a .prof file
+(snakeviz, flameprof, `python -m pstats`) plus a .json summary.
+
+cProfile sees only the thread that started it; tracemalloc is process-wide, so allocations by
+other threads or sessions running at the same time are counted too.
+"""
+
+import cProfile
+import json
+import os
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+
+PROFILE_DIR = os.environ.get("LIBRARY_PROFILE_DIR", "profiles")
+PROFILE_KEEP = 40          # newest dumps kept in PROFILE_DIR
+PROFILE_TOP_N = 15
+PROFILE_STALE_S = 600      # a run still profiling after this long was abandoned (its script died)
+_IGNORED_FILES = ("<frozen importlib._bootstrap", "<unknown>", tracemalloc.__file__, cProfile.__file__, __file__)
+
+_tracing = 0  # runs tracing memory now; the last one stops tracemalloc if a run started it
+_started_tracing = False
+_tracing_lock = threading.Lock()
+_active = None  # the run profiling now: cProfile allows one profiler per process on Python 3.12+
+_active_lock = threading.RLock()
+
+
+class ProfilerBusyError(RuntimeError):
+    pass
+
+
+def _short(path):
+    path = path.split("site-packages" + os.sep)[-1]
+    return os.path.relpath(path) if path.startswith(os.getcwd() + os.sep) else path
+
+
+class RunProfile:
+    def __init__(self):
+        self.profile = cProfile.Profile()
+        self.baseline = None
+        self.t0 = None
+
+    def start(self):
+        """Profile from here on; raises ProfilerBusyError while another run (or, on Python 3.12+, a
+        debugger or coverage tool) is profiling this process."""
+        global _active, _tracing, _started_tracing
+        with _active_lock:
+            if _active is not None:
+                if time.perf_counter() - _active.t0 < PROFILE_STALE_S:
+                    raise ProfilerBusyError("Another rerun is being profiled right now.")
+                _active.abandon()
+            _active = self
+            self.t0 = time.perf_counter()
+        with _tracing_lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                _started_tracing = True
+            else:  # already tracing: only count what this run adds
+                self.baseline = tracemalloc.take_snapshot()
+            _tracing += 1
+            tracemalloc.reset_peak()
+        self.t0 = time.perf_counter()
+        try:
+            self.profile.enable()
+        except ValueError as e:  # "Another profiling tool is already active"
+            self.abandon()
+            raise ProfilerBusyError(str(e)) from e
+        return self
+
+    def _release(self):
+        global _active, _tracing, _started_tracing
+        self.profile.disable()
+        with _active_lock:
+            if _active is self:
+                _active = None
+        with _tracing_lock:
+            _tracing -= 1
+            if _tracing == 0 and _started_tracing:
+                tracemalloc.stop()
+                _started_tracing = False
+
+    def abandon(self):
+        """Stop without a report (the run was cut short, e.g. by st.rerun())."""
+        with _active_lock:
+            if self.t0 is None:
+                return
+            self.t0 = None
+            self._release()
+
+    def stop(self, name, dump=True):
+        """Stop and return the report (None if the run was abandoned); with `dump`, also write
+        <name>-<time>.prof/.json."""
+        if self.t0 is None:
+            return None
+        self.profile.disable()
+        wall_ms = (time.perf_counter() - self.t0) * 1000
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, f"{p}*") for p in _IGNORED_FILES])
+        _, peak = tracemalloc.get_traced_memory()
+        self._release()
+        self.t0 = None
+        stats = (snapshot.compare_to(self.baseline, "lineno") if self.baseline else
+                 snapshot.statistics("lineno"))
+        rows = sorted(((key, row) for key, row in pstats.Stats(self.profile).stats.items()
+                       if key[0] != __file__ and "_lsprof" not in key[2]),
+                      key=lambda kv: kv[1][3], reverse=True)
+        report = {
+            "name": name, "at": time.strftime("%Y-%m-%d %H:%M:%S"), "wall_ms": round(wall_ms, 1),
+            "peak_kb": round(peak / 1024, 1),
+            "functions": [{"function": f"{_short(file)}:{line}({fn})", "calls": calls,
+                           "own_ms": round(tt * 1000, 2), "cumulative_ms": round(ct * 1000, 2)}
+                          for (file, line, fn), (_, calls, tt, ct, _) in rows[:PROFILE_TOP_N]],
+            "allocations": [{"site": f"{_short(s.traceback[0].filename)}:{s.traceback[0].lineno}",
+                             "kb": round(getattr(s, "size_diff", s.size) / 1024, 1),
+                             "blocks": getattr(s, "count_diff", s.count)}
+                            for s in stats[:PROFILE_TOP_N]],
+        }
+        if dump:
+            report.update(self.dump(name, report))
+        return report
+
+    def dump(self, name, report):
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        stamp = f"{time.strftime('%Y%m%d-%H%M%S')}-{int(time.time() * 1000) % 1000:03d}"
+        base = os.path.join(PROFILE_DIR, f"{re.sub(r'[^A-Za-z0-9_-]+', '_', name)}-{stamp}")
+        paths = {"prof_path": base + ".prof", "json_path": base + ".json"}
+        self.profile.dump_stats(paths["prof_path"])
+        with open(paths["json_path"], "w", encoding="utf-8") as f:
+            json.dump({**report, **paths}, f, indent=1)
+        dumps = sorted((e for e in os.scandir(PROFILE_DIR) if e.name.endswith(".prof")),
+                       key=lambda e: e.stat().st_mtime)
+        for old in dumps[:-PROFILE_KEEP]:
+            for path in (old.path, old.path[:-len(".prof")] + ".json"):
+                if os.path.exists(path):
+                    os.remove(path)
+        return paths
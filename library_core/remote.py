@@ -0,0 +1,160 @@
+"""
+HTTP for the remote tools (Open Library, Gutendex, gutenberg.org) that degrades instead of hanging.
+
+- Per-host circuit breakers: after BREAKER_FAILURES consecutive timeouts, connection errors or
+  5xx responses a host fails fast (CircuitOpenError) for BREAKER_COOLDOWN_S; then a single trial
+  request decides whether it closes again.
+- Latency budgets: inside `latency_budget(...)` every request's timeout is clamped to what is
+  left and requests fail fast (BudgetExhaustedError) once it is spent. The agent gives each
+  turn one budget for all of its tool calls. Budgets follow work onto the prefetch pool.
+
+Base URLs can point at a local stub (benchmarks/stub_server.py) through LIBRARY_OPEN_LIBRARY_URL
+and LIBRARY_GUTENDEX_URL.
+"""
+
+import contextlib
+import contextvars
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+from .metrics import get_metrics, timed
+
+OPEN_LIBRARY_URL = os.environ.get("LIBRARY_OPEN_LIBRARY_URL", "https://openlibrary.org").rstrip("/")
+GUTENDEX_URL = os.environ.get("LIBRARY_GUTENDEX_URL", "https://gutendex.com").rstrip("/")
+HTTP_TIMEOUT_S = float(os.environ.get("LIBRARY_HTTP_TIMEOUT_S", 10))
+BREAKER_FAILURES = int(os.environ.get("LIBRARY_BREAKER_FAILURES", 3))
+BREAKER_COOLDOWN_S = float(os.environ.get("LIBRARY_BREAKER_COOLDOWN_S", 30))
+
+
+class CircuitOpenError(ConnectionError):
+    pass
+
+
+class BudgetExhaustedError(TimeoutError):
+    pass
+
+
+# ─── Circuit Breakers ────────────────────────────────────────────────────────
+class CircuitBreaker:
+    def __init__(self, host, failures=None, cooldown=None):
+        self.host = host
+        self.threshold = failures or BREAKER_FAILURES
+        self.cooldown = BREAKER_COOLDOWN_S if cooldown is None else cooldown
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+
+    def state(self):
+        with self.lock:
+            if self.opened_at is None:
+                return "closed"
+            return "half_open" if time.monotonic() - self.opened_at >= self.cooldown else "open"
+
+    def before(self):
+        """Raise CircuitOpenError unless a request may go out now."""
+        with self.lock:
+            if self.opened_at is None:
+                return
+            wait = self.cooldown - (time.monotonic() - self.opened_at)
+            if wait > 0 or self.trial:
+                get_metrics().observe("breaker", self.host, 0.0, 0, True)
+                raise CircuitOpenError(f"{self.host} is unavailable; not retrying for {max(wait, 0):.0f}s")
+            self.trial = True  # half-open: exactly one request probes the host
+
+    def success(self):
+        with self.lock:
+            self.failures, self.opened_at, self.trial = 0, None, False
+
+    def release(self):
+        """The request proved nothing either way; let another one probe."""
+        with self.lock:
+            self.trial = False
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self.trial = False
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(host):
+    with _breakers_lock:
+        if host not in _breakers:
+            _breakers[host] = CircuitBreaker(host)
+        return _breakers[host]
+
+
+def breaker_states():
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {b.host: b.state() for b in breakers}
+
+
+def reset_breakers():
+    with _breakers_lock:
+        _breakers.clear()
+
+
+# ─── Latency Budgets ─────────────────────────────────────────────────────────
+_deadline = contextvars.ContextVar("http_deadline", default=None)
+
+
+@contextlib.contextmanager
+def latency_budget(seconds=None, deadline=None):
+    """Bound the network time of everything inside the block (a monotonic `deadline`, or
+    `seconds` from now). Nested budgets keep the tighter deadline."""
+    deadline = deadline if deadline is not None else time.monotonic() + seconds
+    outer = _deadline.get()
+    token = _deadline.set(deadline if outer is None else min(outer, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def _clamp_timeout(timeout):
+    deadline = _deadline.get()
+    if deadline is None:
+        return timeout
+    left = deadline - time.monotonic()
+    if left <= 0.05:
+        raise BudgetExhaustedError("Network time budget for this turn is spent.")
+    return min(timeout, left)
+
+
+# ─── Requests ────────────────────────────────────────────────────────────────
+def http_get(url, timeout=None, **kwargs):
+    import requests
+    timeout = timeout or HTTP_TIMEOUT_S
+    host = urlparse(url).netloc
+    breaker = get_breaker(host)
+    clamped = _clamp_timeout(timeout)
+    breaker.before()
+    with timed("http", host) as m:
+        try:
+            r = requests.get(url, timeout=clamped, **kwargs)
+        except requests.Timeout:  # before ConnectionError: ConnectTimeout is both
+            # A timeout cut short by the budget says nothing about the host's health.
+            if clamped >= timeout:
+                breaker.failure()
+            else:
+                breaker.release()
+            raise
+        except requests.ConnectionError:
+            breaker.failure()
+            raise
+        except Exception:
+            breaker.release()
+            raise
+        m["payload"] = len(r.content)
+        m["error"] = r.status_code >= 400
+    (breaker.failure if r.status_code >= 500 else breaker.success)()
+    return r
@@ -0,0 +1,499 @@
+"""Agent tools: Open Library / Gutenberg lookups and personal-library operations.
+
+TOOLS holds the JSON-schema declarations sent to the model; TOOL_MAP maps each name to its
+implementation, with read-only network tools served through the shared remote cache.
+"""
+
+import functools
+import re
+from urllib.parse import urlparse
+
+from .analytics import reading_analytics
+from .autocomplete import remember_catalog_books
+from .caches import cached_remote, get_library, get_prefetcher
+from .db import (db_get_book_index, db_get_book_text, db_record_progress, db_remove_book,
+                 db_search_passages, db_store_book_text, db_upsert_book)
+from .fuzzy import find_duplicate_books, search_library
+from .jobs import enqueue_book_followups
+from .metrics import get_metrics, instrumented
+from .remote import GUTENDEX_URL, HTTP_TIMEOUT_S, OPEN_LIBRARY_URL, breaker_states, http_get
+
+# ─── Tool Functions ───────────────────────────────────────────────────────────
+@instrumented("tool")
+def search_open_library(query: str, limit: int = 8, page: int = 1) -> dict:
+    try:
+        params = {"q": query, "limit": limit, "page": page,
+                  "fields": "key,title,author_name,first_publish_year,number_of_pages_median,subject,isbn,cover_i,publisher"}
+        r = http_get(f"{OPEN_LIBRARY_URL}/search.json", params=params)
+        r.raise_for_status()
+        data = r.json()
+        books = []
+        for doc in data.get("docs", []):
+            books.append({
+                "title": doc.get("title", "Unknown"),
+                "authors": doc.get("author_name", ["Unknown"]),
+                "year": doc.get("first_publish_year"),
+                "pages": doc.get("number_of_pages_median"),
+                "subjects": doc.get("subject", [])[:5],
+                "isbn": (doc.get("isbn") or [None])[0],
+                "cover_id": doc.get("cover_i"),
+                "publisher": (doc.get("publisher") or [None])[0],
+                "open_library_key": doc.get("key"),
+                "source": "Open Library",
+            })
+        remember_catalog_books(books)
+        return {"success": True, "total": data.get("numFound", 0), "page": page, "books": books}
+    except Exception as e:
+        return {"success": False, "error": str(e), "books": []}
+
+
+@instrumented("tool")
+def get_book_details(open_library_key: str) -> dict:
+    try:
+        r = http_get(f"{OPEN_LIBRARY_URL}{open_library_key}.json")
+        r.raise_for_status()
+        data = r.json()
+        description = data.get("description")
+        if isinstance(description, dict):
+            description = description.get("value", "")
+        return {
+            "success": True,
+            "title": data.get("title"),
+            "description": description or "No description available.",
+            "subjects": data.get("subjects", [])[:10],
+        }
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+
+@instrumented("tool")
+def search_gutenberg(query: str, limit: int = 8, page: int = 1) -> dict:
+    try:
+        r = http_get(f"{GUTENDEX_URL}/books/", params={"search": query, "mime_type": "text/plain", "page": page})
+        r.raise_for_status()
+        data = r.json()
+        books = []
+        for item in data.get("results", [])[:limit]:
+            fmts = item.get("formats", {})
+            txt_url = (fmts.get("text/plain; charset=utf-8") or
+                       fmts.get("text/plain; charset=us-ascii") or
+                       fmts.get("text/plain"))
+            books.append({
+                "gutenberg_id": item["id"],
+                "title": item.get("title", "Unknown"),
+                "authors": [a.get("name", "Unknown") for a in item.get("authors", [])],
+                "subjects": item.get("subjects", [])[:5],
+                "download_count": item.get("download_count", 0),
+                "txt_url": txt_url,
+                "cover_url": fmts.get("image/jpeg", ""),
+            })
+        remember_catalog_books(books)
+        return {"success": True, "total": data.get("count", 0), "page": page, "books": books}
+    except Exception as e:
+        return {"success": False, "error": str(e), "books": []}
+
+
+_TITLE_NOISE = re.compile(r"^(the|a|an)\s+|[^\w\s]")
+
+
+def _work_key(title, authors):
+    """Normalised (title, author surname) used to spot the same work across catalogues."""
+    t = re.split(r"[:;(]", (title or "").lower())[0]
+    t = " ".join(_TITLE_NOISE.sub(" ", t).split())
+    a = (authors or [""])[0] or ""
+    # Gutendex writes "Austen, Jane"; Open Library writes "Jane Austen".
+    surname = a.split(",")[0] if "," in a else (a.split() or [""])[-1]
+    return t, surname.strip().lower()
+
+
+@instrumented("tool")
+def search_books(query: str, limit: int = 8) -> dict:
+    """Federated search: Open Library and Gutenberg in parallel, merged into one ranked list of works."""
+    calls = [(search_open_library, {"query": query, "limit": limit}),
+             (search_gutenberg, {"query": query, "limit": limit})]
+    # Start both lookups on the interactive pool, then collect them through the shared cache.
+    prefetcher = get_prefetcher()
+    for fn, kw in calls:
+        prefetcher.start(fn, **kw)
+    ol, gut = (cached_remote(fn, **kw) for fn, kw in calls)
+    if not ol["success"] and not gut["success"]:
+        return {"success": False, "error": f"Open Library: {ol['error']}; Gutenberg: {gut['error']}", "works": []}
+
+    works, scores = {}, {}
+    for source, result in (("Open Library", ol), ("Gutenberg", gut)):
+        for rank, book in enumerate(result["books"]):
+            key = _work_key(book["title"], book["authors"])
+            work = works.setdefault(key, {"title": book["title"], "authors": book["authors"],
+                                          "sources": [], "free_to_read": False})
+            work["sources"].append(source)
+            # Reciprocal-rank fusion: a work both catalogues rank highly floats to the top.
+            scores[key] = scores.get(key, 0.0) + 1.0 / (10 + rank)
+            if source == "Gutenberg":
+                work.update(free_to_read=True, gutenberg_id=book["gutenberg_id"],
+                            download_count=book["download_count"])
+            else:
+                work.update({k: book[k] for k in ("year", "pages", "isbn", "cover_id", "open_library_key")},
+                            title=book["title"], authors=book["authors"],
+                            subjects=book["subjects"] or work.get("subjects", []))
+            work.setdefault("subjects", book["subjects"])
+    ranked = sorted(works, key=lambda k: (-scores[k], -works[k].get("download_count", 0)))
+    out = {"success": True, "query": query, "works": [works[k] for k in ranked[:limit]],
+           "total_open_library": ol.get("total", 0), "total_gutenberg": gut.get("total", 0)}
+    errors = {name: r["error"] for name, r in (("open_library", ol), ("gutenberg", gut)) if not r["success"]}
+    if errors:
+        out["partial_errors"] = errors
+    return out
+
+
+def prefetch_book_details(result, top_k):
+    """Speculatively fetch get_book_details for the top_k Open Library works of a search_books
+    or search_open_library result, unless Open Library is failing. Returns how many were queued."""
+    if top_k <= 0 or not result.get("success") or \
+            breaker_states().get(urlparse(OPEN_LIBRARY_URL).netloc, "closed") != "closed":
+        return 0
+    keys = [b["open_library_key"] for b in result.get("works") or result.get("books") or []
+            if b.get("open_library_key")]
+    prefetcher = get_prefetcher()
+    return sum(prefetcher.speculate(get_book_details, open_library_key=key) for key in keys[:top_k])
+
+
+@instrumented("tool")
+def fetch_gutenberg_content(gutenberg_id: int, offset: int = 0, chunk_size: int = 3000) -> dict:
+    try:
+        r = http_get(f"{GUTENDEX_URL}/books/{gutenberg_id}/")
+        r.raise_for_status()
+        data = r.json()
+        fmts = data.get("formats", {})
+        txt_url = (fmts.get("text/plain; charset=utf-8") or
+                   fmts.get("text/plain; charset=us-ascii") or
+                   fmts.get("text/plain"))
+        if not txt_url:
+            return {"success": False, "error": "No plain text version available."}
+        byte_end = offset + chunk_size * 4
+        r2 = http_get(txt_url, headers={"Range": f"bytes={offset}-{byte_end}"}, timeout=HTTP_TIMEOUT_S * 1.5)
+        content = r2.content.decode("utf-8", errors="replace")
+        if len(content) > chunk_size:
+            content = content[:chunk_size].rsplit(" ", 1)[0]
+        return {
+            "success": True,
+            "gutenberg_id": gutenberg_id,
+            "title": data.get("title"),
+            "authors": [a.get("name") for a in data.get("authors", [])],
+            "content": content,
+            "offset": offset,
+            "next_offset": offset + chunk_size * 4,
+        }
+    except Exception as e:
+        stored = db_get_book_text(gutenberg_id)
+        if stored:  # indexed earlier: read from the local copy while the network is unavailable
+            # Offsets are bytes into the raw file; the copy is its body, starting at body_offset.
+            # Texts stored before body_offset was kept are read as if the body began the file.
+            start = max(0, offset - (stored["body_offset"] or 0))
+            body = stored["content"].encode("utf-8")[start:start + chunk_size * 4]
+            content = body.decode("utf-8", errors="replace")
+            if len(content) > chunk_size:
+                content = content[:chunk_size].rsplit(" ", 1)[0]
+            return {"success": True, "gutenberg_id": gutenberg_id, "title": stored["title"],
+                    "content": content, "offset": offset, "next_offset": offset + chunk_size * 4,
+                    "degraded": f"served from the local copy ({e})"}
+        return {"success": False, "error": str(e)}
+
+
+PASSAGE_CHARS = 1200
+_STOPWORDS = set("""a an and are as at be but by did do does for from had has have he her his how i in
+is it its of on or she that the their them they this to was were what when where which who why
+with would you about book novel story chapter""".split())
+
+
+def _strip_gutenberg_boilerplate(text: str) -> tuple:
+    """The text between the START and END markers, and the character index where it begins."""
+    start = re.search(r"\*\*\* ?START OF (THE|THIS) PROJECT GUTENBERG.*?\*\*\*", text, re.I)
+    end = re.search(r"\*\*\* ?END OF (THE|THIS) PROJECT GUTENBERG", text, re.I)
+    begin = start.end() if start else 0
+    body = text[begin:end.start() if end else len(text)]
+    return body.strip(), begin + len(body) - len(body.lstrip())
+
+
+def split_passages(text: str, target: int = PASSAGE_CHARS) -> list:
+    """Pack blank-line separated paragraphs into passages of roughly `target` characters."""
+    passages, buf = [], ""
+    for para in re.split(r"\n\s*\n", text):
+        para = " ".join(para.split())
+        # Some transcriptions have no paragraph breaks at all — cut those into word windows.
+        while len(para) > target:
+            cut = para.rfind(" ", 0, target)
+            cut = cut if cut > 0 else target
+            chunk, para = para[:cut], para[cut:].strip()
+            if buf:
+                passages.append(buf)
+                buf = ""
+            passages.append(chunk)
+        if not para:
+            continue
+        if buf and len(buf) + len(para) > target:
+            passages.append(buf)
+            buf = ""
+        buf = f"{buf} {para}".strip()
+    if buf:
+        passages.append(buf)
+    return passages
+
+
+def _ensure_book_indexed(gutenberg_id: int) -> dict:
+    stored = db_get_book_index(gutenberg_id)
+    get_metrics().record_cache("book_text", bool(stored))
+    if stored:
+        return stored
+    r = http_get(f"{GUTENDEX_URL}/books/{gutenberg_id}/")
+    r.raise_for_status()
+    data = r.json()
+    fmts = data.get("formats", {})
+    txt_url = (fmts.get("text/plain; charset=utf-8") or
+               fmts.get("text/plain; charset=us-ascii") or
+               fmts.get("text/plain"))
+    if not txt_url:
+        raise ValueError("No plain text version available.")
+    r2 = http_get(txt_url, timeout=HTTP_TIMEOUT_S * 3)
+    r2.raise_for_status()
+    text = r2.content.decode("utf-8", errors="replace")
+    content, begin = _strip_gutenberg_boilerplate(text)
+    db_store_book_text(gutenberg_id, data.get("title"), content, split_passages(content),
+                       len(text[:begin].encode("utf-8")))
+    return db_get_book_index(gutenberg_id)
+
+
+@instrumented("tool")
+def search_book_passages(gutenberg_id: int, question: str, top_k: int = 5) -> dict:
+    try:
+        book = _ensure_book_indexed(gutenberg_id)
+        terms = [t for t in re.findall(r"\w+", question.lower())
+                 if t not in _STOPWORDS and len(t) > 1]
+        if not terms:
+            return {"success": False, "error": "Question has no searchable terms."}
+        match_expr = " OR ".join(f'"{t}"' for t in dict.fromkeys(terms))
+        hits = db_search_passages(gutenberg_id, match_expr, max(1, min(int(top_k), 10)))
+        return {
+            "success": True,
+            "gutenberg_id": gutenberg_id,
+            "title": book.get("title"),
+            "indexed_passages": book.get("passages", 0),
+            "passages": [{"passage": h["idx"], "score": round(-h["score"], 3), "text": h["text"]}
+                         for h in hits],
+        }
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+
+@instrumented("tool")
+def add_to_personal_library(title: str, author: str, genre: str = "", notes: str = "",
+                             year: int = None, isbn: str = "", gutenberg_id: int = None,
+                             open_library_key: str = "", total_pages: int = 0) -> dict:
+    book_id, created = db_upsert_book(title, author, genre, notes, year, isbn, "",
+                                      open_library_key, gutenberg_id, total_pages)
+    if not created:
+        return {"success": True, "book_id": book_id, "already_in_library": True,
+                "message": f"'{title}' is already in the library (ID #{book_id})."}
+    enqueue_book_followups(book_id)
+    return {
+        "success": True,
+        "message": f"'{title}' by {author} added (ID #{book_id})." +
+                   (" 📖 Free eBook available via Gutenberg!" if gutenberg_id else ""),
+        "book_id": book_id,
+    }
+
+
+@instrumented("tool")
+def list_personal_library(genre_filter: str = "", search_query: str = "",
+                           status_filter: str = "") -> dict:
+    # A search ranks books by title/author match (typos allowed) and adds their match_score.
+    books = search_library(search_query) if search_query else get_library()
+    if genre_filter:
+        books = [b for b in books if genre_filter.lower() in b.get("genre", "").lower()]
+    if status_filter:
+        books = [b for b in books if b.get("status") == status_filter]
+    return {"success": True, "count": len(books), "books": books}
+
+
+@instrumented("tool")
+def remove_from_library(book_id: int) -> dict:
+    ok = db_remove_book(book_id)
+    return {"success": ok, "message": f"Book #{book_id} {'removed' if ok else 'not found'}."}
+
+
+@instrumented("tool")
+def update_reading_progress(book_id: int, current_page: int = None, total_pages: int = None,
+                             status: str = None, rating: int = None, review: str = None) -> dict:
+    ok = db_record_progress(book_id, current_page, total_pages, status, rating, review)
+    if ok:
+        parts = []
+        if current_page is not None: parts.append(f"page→{current_page}")
+        if status: parts.append(f"status→{status}")
+        if rating is not None: parts.append(f"rating→{'★'*rating}")
+        if review: parts.append("review saved")
+        return {"success": True, "message": f"Book #{book_id} updated: {', '.join(parts) or 'saved'}."}
+    return {"success": False, "message": f"Book #{book_id} not found."}
+
+
+@instrumented("tool")
+def get_recommendations(genre: str = "", mood: str = "", based_on: str = "") -> dict:
+    personal = get_library()
+    return {
+        "success": True,
+        "personal_library_count": len(personal),
+        "personal_titles": [b["title"] for b in personal[:10]],
+        "personal_genres": list(set(b.get("genre","") for b in personal if b.get("genre"))),
+        "recently_finished": [b["title"] for b in personal if b.get("status")=="finished"][:5],
+        "currently_reading": [b["title"] for b in personal if b.get("status")=="reading"][:3],
+        "request": {"genre": genre, "mood": mood, "based_on": based_on},
+    }
+
+
+@instrumented("tool")
+def find_duplicates() -> dict:
+    pairs = find_duplicate_books()
+    return {"success": True, "count": len(pairs), "pairs": pairs}
+
+
+@instrumented("tool")
+def get_reading_stats() -> dict:
+    a = reading_analytics()
+    return {
+        "success": True,
+        "pages_last_7_days": a["pages_7d"],
+        "pages_last_30_days": a["pages_30d"],
+        "current_streak_days": a["streaks"]["current"],
+        "longest_streak_days": a["streaks"]["longest"],
+        "currently_reading": a["velocity"],
+        "this_month": a["monthly"][0] if a["monthly"] else None,
+        "by_year": a["yearly"][:5],
+    }
+
+
+TOOLS = [
+    {
+        "name": "search_books",
+        "description": "Search Open Library AND Project Gutenberg at once. Returns one merged, ranked list of works; free_to_read works carry a gutenberg_id. Prefer this for any book discovery question.",
+        "input_schema": {"type": "object",
+                         "properties": {"query": {"type": "string"}, "limit": {"type": "integer", "default": 8}},
+                         "required": ["query"]},
+    },
+    {
+        "name": "search_open_library",
+        "description": "Search millions of books from Open Library (internet). Use for any book by title, author, subject, or keyword.",
+        "input_schema": {"type": "object",
+                         "properties": {"query": {"type": "string"}, "limit": {"type": "integer", "default": 8},
+                                        "page": {"type": "integer", "default": 1}},
+                         "required": ["query"]},
+    },
+    {
+        "name": "get_book_details",
+        "description": "Get detailed description and subjects for a book via its Open Library key.",
+        "input_schema": {"type": "object",
+                         "properties": {"open_library_key": {"type": "string"}},
+                         "required": ["open_library_key"]},
+    },
+    {
+        "name": "search_gutenberg",
+        "description": "Search Project Gutenberg for FREE books that can be fully read. Best for classics.",
+        "input_schema": {"type": "object",
+                         "properties": {"query": {"type": "string"}, "limit": {"type": "integer", "default": 6},
+                                        "page": {"type": "integer", "default": 1}},
+                         "required": ["query"]},
+    },
+    {
+        "name": "fetch_gutenberg_content",
+        "description": "Fetch readable text from a Gutenberg book. Returns a chunk of the actual book content.",
+        "input_schema": {"type": "object",
+                         "properties": {"gutenberg_id": {"type": "integer"}, "offset": {"type": "integer", "default": 0}},
+                         "required": ["gutenberg_id"]},
+    },
+    {
+        "name": "search_book_passages",
+        "description": "Answer questions about a Gutenberg book's content: returns the top-k most relevant passages (BM25) from the full text in one call.",
+        "input_schema": {"type": "object",
+                         "properties": {"gutenberg_id": {"type": "integer"}, "question": {"type": "string"},
+                                        "top_k": {"type": "integer", "default": 5}},
+                         "required": ["gutenberg_id", "question"]},
+    },
+    {
+        "name": "add_to_personal_library",
+        "description": "Add a book to the user's personal library. Include gutenberg_id when available.",
+        "input_schema": {"type": "object",
+                         "properties": {
+                             "title": {"type": "string"}, "author": {"type": "string"},
+                             "genre": {"type": "string"}, "notes": {"type": "string"},
+                             "year": {"type": "integer"}, "isbn": {"type": "string"},
+                             "gutenberg_id": {"type": "integer"}, "open_library_key": {"type": "string"},
+                             "total_pages": {"type": "integer"},
+                         },
+                         "required": ["title", "author"]},
+    },
+    {
+        "name": "list_personal_library",
+        "description": "List books in the user's personal library with optional filters.",
+        "input_schema": {"type": "object",
+                         "properties": {
+                             "genre_filter": {"type": "string"},
+                             "search_query": {"type": "string", "description": "Title or author; typos are tolerated"},
+                             "status_filter": {"type": "string", "enum": ["unread","reading","finished",""]},
+                         }},
+    },
+    {
+        "name": "remove_from_library",
+        "description": "Remove a book from the personal library by ID.",
+        "input_schema": {"type": "object",
+                         "properties": {"book_id": {"type": "integer"}},
+                         "required": ["book_id"]},
+    },
+    {
+        "name": "update_reading_progress",
+        "description": "Update reading status (unread/reading/finished), current page, total pages, star rating (1-5), or review for a book.",
+        "input_schema": {"type": "object",
+                         "properties": {
+                             "book_id": {"type": "integer"},
+                             "current_page": {"type": "integer"},
+                             "total_pages": {"type": "integer"},
+                             "status": {"type": "string", "enum": ["unread","reading","finished"]},
+                             "rating": {"type": "integer", "description": "1-5 stars"},
+                             "review": {"type": "string"},
+                         },
+                         "required": ["book_id"]},
+    },
+    {
+        "name": "get_recommendations",
+        "description": "Get personalized recommendation context based on library and preferences.",
+        "input_schema": {"type": "object",
+                         "properties": {
+                             "genre": {"type": "string"},
+                             "mood": {"type": "string"},
+                             "based_on": {"type": "string"},
+                         }},
+    },
+    {
+        "name": "find_duplicates",
+        "description": "Find books in the personal library that are probably the same work added twice (similar title and author), most similar first.",
+        "input_schema": {"type": "object", "properties": {}},
+    },
+    {
+        "name": "get_reading_stats",
+        "description": "Reading history: pages read recently, reading streaks, pace and projected finish dates for books in progress, and monthly/yearly totals.",
+        "input_schema": {"type": "object", "properties": {}},
+    },
+]
+
+# Read-only network tools are served through the shared cache.
+TOOL_MAP = {
+    "search_books": search_books,
+    "search_open_library": functools.partial(cached_remote, search_open_library),
+    "get_book_details": functools.partial(cached_remote, get_book_details),
+    "search_gutenberg": functools.partial(cached_remote, search_gutenberg),
+    "fetch_gutenberg_content": functools.partial(cached_remote, fetch_gutenberg_content),
+    "search_book_passages": search_book_passages,
+    "add_to_personal_library": add_to_personal_library,
+    "list_personal_library": list_personal_library,
+    "remove_from_library": remove_from_library,
+    "update_reading_progress": update_reading_progress,
+    "get_recommendations": get_recommendations,
+    "find_duplicates": find_duplicates,
+    "get_reading_stats": get_reading_stats,
+}
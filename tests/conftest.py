@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+
+@pytest.fixture
+def fake_gemini(tmp_path, monkeypatch):
+    """Fake google-genai client and HTTP upstreams (benchmarks/fakes.py), a fresh library and an
+    unthrottled scheduler; returns a function that makes a new API key's scheduler unthrottled."""
+    import requests
+    from google import genai
+
+    from fakes import FakeGenaiClient, FakeHTTP, _FakeCaches
+    from library_core import get_scheduler
+    monkeypatch.setenv("LIBRARY_DB", str(tmp_path / "library.db"))
+    monkeypatch.setattr(requests, "get", FakeHTTP().get)
+    monkeypatch.setattr(genai, "Client", FakeGenaiClient)
+    monkeypatch.setattr(FakeGenaiClient, "supports_caching", True)
+    monkeypatch.setattr(FakeGenaiClient, "request_chars", [])
+    monkeypatch.setattr(_FakeCaches, "store", {})
+
+    def api_key(name):
+        key = f"{name}-{tmp_path.name}"  # clients, schedulers and prompt caches are per key
+        scheduler = get_scheduler(key)
+        scheduler.rate = scheduler.burst = scheduler.tokens = 1e6
+        return key
+    return api_key
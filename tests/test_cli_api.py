@@ -0,0 +1,53 @@
+import functools
+import json
+
+import pytest
+
+from library_core import cached_remote, cli
+from library_core.api import ApiError, call_tool
+from library_core.db import db_get_book
+from library_core.tools import TOOL_MAP
+
+
+@pytest.fixture(autouse=True)
+def library_db(tmp_path, monkeypatch):
+    monkeypatch.setenv("LIBRARY_DB", str(tmp_path / "library.db"))
+
+
+def test_cli_keeps_numeric_isbn_a_string(capsys):
+    code = cli.main(["call", "add_to_personal_library", "title=Dune", "author=Frank Herbert",
+                     "isbn=9780441013593", "year=1965"])
+    result = json.loads(capsys.readouterr().out)
+    assert code == 0 and result["success"]
+    book = db_get_book(result["book_id"])
+    assert book["isbn"] == "9780441013593" and book["year"] == 1965
+
+
+def test_parse_args_decodes_only_non_string_params():
+    schema = {"properties": {"isbn": {"type": "string"}, "year": {"type": "integer"}}}
+    assert cli._parse_args(["isbn=0441013597", "year=1965", "extra=[1]"], schema) == \
+        {"isbn": "0441013597", "year": 1965, "extra": [1]}
+
+
+def test_api_accepts_numeric_isbn():
+    args = {"title": "Dune", "author": "Frank Herbert", "isbn": 9780441013593}
+    first = call_tool("add_to_personal_library", args)
+    again = call_tool("add_to_personal_library", {**args, "title": "Dune (reissue)"})
+    assert first["success"] and db_get_book(first["book_id"])["isbn"] == "9780441013593"
+    assert again["already_in_library"] and again["book_id"] == first["book_id"]
+
+
+@pytest.mark.parametrize("name, args", [("search_gutenberg", {"qurey": "dune"}),
+                                        ("add_to_personal_library", {"author": "Frank Herbert"})])
+def test_api_rejects_bad_arguments_with_400(name, args):
+    with pytest.raises(ApiError) as e:
+        call_tool(name, args)
+    assert e.value.status == 400
+
+
+def test_api_lets_type_errors_inside_a_tool_through(monkeypatch):
+    def broken(query: str) -> dict:
+        return len(query) + query
+    monkeypatch.setitem(TOOL_MAP, "broken", functools.partial(cached_remote, broken))
+    with pytest.raises(TypeError):
+        call_tool("broken", {"query": "dune"})
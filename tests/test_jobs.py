@@ -0,0 +1,38 @@
+import time
+
+import pytest
+
+from library_core import enqueue_book_followups, ensure_worker_pool, job_counts, jobs, workers_available
+from library_core.db import db_upsert_book
+
+
+@pytest.fixture(autouse=True)
+def library_db(tmp_path, monkeypatch):
+    monkeypatch.setenv("LIBRARY_DB", str(tmp_path / "library.db"))
+    monkeypatch.setattr(jobs, "_workers_seen", {})
+
+
+def add_book():
+    book_id, _ = db_upsert_book("Pride and Prejudice", "Jane Austen", gutenberg_id=1342,
+                                open_library_key="/works/OL66554W")
+    return book_id
+
+
+def test_followups_are_not_queued_without_workers():
+    assert enqueue_book_followups(add_book()) == []
+    assert job_counts() == {"workers": 0}
+
+
+def test_followups_are_queued_while_a_worker_heartbeats():
+    jobs._heartbeat("test-worker", time.time())
+    assert len(enqueue_book_followups(add_book())) == 2
+    assert job_counts()["queued"] == 2
+
+
+def test_worker_check_is_cached_between_reruns(monkeypatch):
+    calls = []
+    monkeypatch.setattr(jobs, "job_counts", lambda: calls.append(1) or {"workers": 1})
+    assert all(ensure_worker_pool(processes=1) for _ in range(5))  # a pool runs elsewhere
+    assert workers_available() and len(calls) == 1
+    monkeypatch.setattr(jobs, "WORKER_HEARTBEAT_S", -1)  # the cached answer has expired
+    assert workers_available() and len(calls) == 2
@@ -0,0 +1,38 @@
+import tracemalloc
+
+import pytest
+
+from library_core import ProfilerBusyError, RunProfile, profiling
+
+
+def test_second_profiled_run_is_refused_until_the_first_stops():
+    first = RunProfile().start()
+    with pytest.raises(ProfilerBusyError):
+        RunProfile().start()
+    assert first.stop("first", dump=False)["wall_ms"] >= 0
+    RunProfile().start().abandon()
+    assert profiling._active is None and not tracemalloc.is_tracing()
+
+
+def test_stale_run_is_taken_over(monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_STALE_S", 0)
+    abandoned = RunProfile().start()
+    taker = RunProfile().start()
+    assert abandoned.stop("abandoned", dump=False) is None
+    assert taker.stop("taker", dump=False)["name"] == "taker"
+    assert profiling._active is None and not tracemalloc.is_tracing()
+
+
+def test_profiler_held_by_another_tool_is_reported_busy():
+    class HeldProfile:  # what cProfile does on Python 3.12+ when sys.monitoring's slot is taken
+        def enable(self):
+            raise ValueError("Another profiling tool is already active")
+
+        def disable(self):
+            pass
+
+    run = RunProfile()
+    run.profile = HeldProfile()
+    with pytest.raises(ProfilerBusyError, match="already active"):
+        run.start()
+    assert profiling._active is None and not tracemalloc.is_tracing()
@@ -0,0 +1,81 @@
+import sqlite3
+import threading
+
+import pytest
+
+from library_core import db
+
+
+@pytest.fixture(autouse=True)
+def library_db(tmp_path, monkeypatch):
+    monkeypatch.setenv("LIBRARY_DB", str(tmp_path / "library.db"))
+
+
+def test_failed_flush_keeps_progress_and_retries(monkeypatch):
+    book_id, _ = db.db_upsert_book("Emma", "Jane Austen", total_pages=400)
+    buffer = db.ProgressBuffer(interval=60)
+    write, calls = db._write_progress, []
+
+    def locked_once(updates, events):
+        calls.append(len(events))
+        if len(calls) == 1:
+            raise sqlite3.OperationalError("database is locked")
+        return write(updates, events)
+    monkeypatch.setattr(db, "_write_progress", locked_once)
+
+    buffer.record(book_id, {"current_page": 10})
+    buffer.record(book_id, {"current_page": 25})
+    assert buffer.flush() == 0
+    assert buffer.pending[book_id] == {"current_page": 25}
+    assert len(buffer.events) == 2 and buffer.timer is not None  # retry armed
+
+    buffer.record(book_id, {"current_page": 40})
+    assert buffer.flush() == 1
+    assert calls == [2, 3] and not buffer.pending and buffer.timer is None
+    conn = db.get_db()
+    pages = [r[0] for r in conn.execute("SELECT current_page FROM reading_events WHERE book_id=? ORDER BY id",
+                                         (book_id,))]
+    conn.close()
+    assert pages == [10, 25, 40]
+    assert db.db_get_book(book_id)["current_page"] == 40
+
+
+def test_direct_write_keeps_buffered_fields_and_events():
+    book_id, _ = db.db_upsert_book("Persuasion", "Jane Austen", total_pages=300)
+    db.db_record_progress(book_id, current_page=50)
+    assert db.db_update_progress(book_id, status="finished")
+    assert db.flush_progress() == 0  # nothing left buffered
+    book = db.db_get_book(book_id)
+    assert (book["current_page"], book["status"]) == (50, "finished")
+    conn = db.get_db()
+    events = conn.execute("SELECT current_page, status FROM reading_events WHERE book_id=? ORDER BY id",
+                          (book_id,)).fetchall()
+    pages = conn.execute("SELECT SUM(pages) FROM reading_daily WHERE book_id=?", (book_id,)).fetchone()[0]
+    conn.close()
+    assert [tuple(e) for e in events] == [(50, None), (None, "finished")] and pages == 50
+
+
+def test_direct_write_waits_for_a_flush_in_flight(monkeypatch):
+    book_id, _ = db.db_upsert_book("Sanditon", "Jane Austen", total_pages=300)
+    write, started, release = db._write_progress, threading.Event(), threading.Event()
+
+    def slow(updates, events):
+        if threading.current_thread() is not threading.main_thread():
+            started.set()
+            release.wait(5)
+        return write(updates, events)
+    monkeypatch.setattr(db, "_write_progress", slow)
+
+    buffer = db.get_progress_buffer()
+    buffer.record(book_id, {"current_page": 20})
+    flusher = threading.Thread(target=buffer.flush)
+    flusher.start()
+    assert started.wait(5)
+    direct = threading.Thread(target=lambda: buffer.write_through(book_id, {"current_page": 80}))
+    direct.start()
+    direct.join(0.2)
+    assert direct.is_alive()  # held back until the flush has written
+    release.set()
+    flusher.join(5)
+    direct.join(5)
+    assert db.db_get_book(book_id)["current_page"] == 80
@@ -0,0 +1,70 @@
+from fakes import FakeGenaiClient, _FakeCaches, _FakeModels
+
+from library_core import ChatSession, run_agent
+from library_core.gemini import get_client, get_prompt_cache
+
+
+def turn(key, message="Find me a book about whales"):
+    events = list(run_agent(message, ChatSession(), key))
+    assert events[-1][0] == "text", events
+    return get_client(key).models.client.requests
+
+
+def mean_chars():
+    chars = FakeGenaiClient.request_chars
+    return sum(chars) / len(chars)
+
+
+def test_cached_prompt_shrinks_requests(fake_gemini):
+    FakeGenaiClient.supports_caching = False
+    turn(fake_gemini("uncached"))
+    uncached = mean_chars()
+    FakeGenaiClient.request_chars.clear()
+    FakeGenaiClient.supports_caching = True
+    requests = turn(fake_gemini("cached"))
+    assert requests[0]["config"].cached_content and not requests[0]["config"].system_instruction
+    assert mean_chars() < uncached * 0.6
+
+
+def test_unsupported_model_goes_uncached(fake_gemini):
+    FakeGenaiClient.supports_caching = False
+    key = fake_gemini("unsupported")
+    requests = turn(key)
+    assert all(not r["config"].cached_content and r["config"].system_instruction for r in requests)
+    cache = get_prompt_cache(key)
+    assert cache.name is None and cache.unavailable_until > 0
+    created = len(_FakeCaches.store)
+    FakeGenaiClient.supports_caching = True
+    turn(key)  # creation is not retried until GEMINI_CACHE_RETRY_S has passed
+    assert len(_FakeCaches.store) == created == 0
+
+
+def test_cache_gone_server_side_is_resent_uncached(fake_gemini):
+    key = fake_gemini("evicted")
+    turn(key)
+    old = get_prompt_cache(key).name
+    _FakeCaches.store.clear()  # expired or evicted on the server
+    requests = turn(key)
+    resent = requests[2:]
+    assert resent[0]["config"].cached_content == old  # 404 NOT_FOUND
+    assert not resent[1]["config"].cached_content and resent[1]["config"].system_instruction
+    assert get_prompt_cache(key).name is None
+    turn(key)  # the next turn creates a new one
+    assert get_prompt_cache(key).name in _FakeCaches.store
+
+
+def test_other_errors_keep_the_cache(fake_gemini, monkeypatch):
+    key = fake_gemini("outage")
+    turn(key)
+    name = get_prompt_cache(key).name
+
+    def unavailable(self, model, contents, config=None):
+        self.client.requests.append({"config": config})
+        raise RuntimeError("503 UNAVAILABLE: The model is overloaded.")
+    monkeypatch.setattr(_FakeModels, "generate_content", unavailable)
+    requests = get_client(key).models.client.requests
+    sent = len(requests)
+    events = list(run_agent("Find me a book about whales", ChatSession(), key))
+    assert events[-1][0] == "error"
+    assert len(requests) == sent + 1  # no uncached resend
+    assert get_prompt_cache(key).name == name
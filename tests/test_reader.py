@@ -0,0 +1,30 @@
+import pytest
+import requests
+
+from library_core import fetch_gutenberg_content, reset_breakers
+from library_core.tools import _ensure_book_indexed
+
+
+@pytest.fixture
+def offline(fake_gemini, monkeypatch):
+    def go_offline():
+        def refuse(url, **kwargs):
+            raise requests.ConnectionError("network unreachable")
+        monkeypatch.setattr(requests, "get", refuse)
+    yield go_offline
+    reset_breakers()
+
+
+@pytest.mark.parametrize("offset", [0, 4000, 250_000])
+def test_degraded_read_matches_live_read_at_the_same_offset(offline, offset):
+    _ensure_book_indexed(1342)
+    live = fetch_gutenberg_content(1342, offset=offset)
+    offline()
+    degraded = fetch_gutenberg_content(1342, offset=offset)
+    assert degraded.get("degraded") and live["success"] and not live.get("degraded")
+    assert degraded["next_offset"] == live["next_offset"]
+    if offset:  # offset 0 is the Gutenberg header, which the stored copy leaves out
+        assert degraded["content"] == live["content"]
+    else:
+        assert live["content"].startswith("The Project Gutenberg eBook")
+        assert degraded["content"] and "START OF THE PROJECT" not in degraded["content"]
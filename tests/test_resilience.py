@@ -0,0 +1,131 @@
+"""Fault injection against benchmarks/stub_server.py over real sockets: breakers trip and fail
+fast, stale results are served while a refresh runs, the reader falls back to its stored copy,
+latency budgets cut requests short, and a recovered host is let back in after the cooldown."""
+
+import socket
+import time
+
+import pytest
+
+from library_core import (breaker_states, cached_remote, clear_shared_caches, fetch_gutenberg_content,
+                          latency_budget, reset_breakers, search_books, search_gutenberg,
+                          search_open_library)
+from library_core import caches, remote, tools
+from library_core.remote import http_get
+from library_core.tools import _ensure_book_indexed
+from stub_server import start_stubs
+
+TIMEOUT_S = 1.0
+COOLDOWN_S = 1.0
+FAST_S = 0.25  # a degraded answer must come back within this
+
+
+@pytest.fixture(scope="module")
+def started_stubs():
+    stubs = start_stubs()
+    yield stubs
+    for s in stubs.values():
+        s.stop()
+
+
+@pytest.fixture
+def stubs(started_stubs, tmp_path, monkeypatch):
+    """The stub upstreams, with short timeouts, cooldowns and cache TTLs and a fresh library."""
+    monkeypatch.setenv("LIBRARY_DB", str(tmp_path / "library.db"))
+    monkeypatch.setattr(tools, "OPEN_LIBRARY_URL", started_stubs["openlibrary"].url)
+    monkeypatch.setattr(tools, "GUTENDEX_URL", started_stubs["gutendex"].url)
+    monkeypatch.setattr(tools, "HTTP_TIMEOUT_S", TIMEOUT_S)
+    monkeypatch.setattr(remote, "HTTP_TIMEOUT_S", TIMEOUT_S)
+    monkeypatch.setattr(remote, "BREAKER_COOLDOWN_S", COOLDOWN_S)
+    monkeypatch.setattr(caches, "REMOTE_CACHE_TTL_S", 0.5)
+    monkeypatch.setattr(caches._remote_cache, "ttl", 0.5)
+    reset_breakers()
+    clear_shared_caches()
+    yield started_stubs
+    for s in started_stubs.values():
+        s.clear_faults()
+    reset_breakers()
+    clear_shared_caches()
+
+
+def host(stub):
+    return stub.url.split("//")[1]
+
+
+def timed_call(fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - t0
+
+
+def test_healthy_sources_both_answer(stubs):
+    r = search_books("pride and prejudice")
+    assert r["success"] and not r.get("partial_errors")
+
+
+def test_hanging_host_trips_its_breaker_and_then_fails_fast(stubs):
+    stubs["gutendex"].set_faults(hang_rate=1, hang_s=3)
+    for i in range(3):
+        r, s = timed_call(search_gutenberg, f"hang {i}")
+        assert not r["success"] and s < TIMEOUT_S + 0.5
+    assert breaker_states()[host(stubs["gutendex"])] == "open"
+    r, s = timed_call(search_gutenberg, "after trip")
+    assert not r["success"] and "unavailable" in r["error"] and s < FAST_S
+    r, s = timed_call(search_books, "federated while down")
+    assert r["success"] and "gutenberg" in r["partial_errors"] and s < FAST_S
+
+
+def test_half_open_breaker_closes_after_a_good_trial_request(stubs):
+    stubs["gutendex"].set_faults(error_rate=1)
+    for i in range(3):
+        search_gutenberg(f"trip {i}")
+    assert breaker_states()[host(stubs["gutendex"])] == "open"
+    stubs["gutendex"].clear_faults()
+    time.sleep(COOLDOWN_S + 0.1)
+    assert breaker_states()[host(stubs["gutendex"])] == "half_open"
+    assert search_gutenberg("recovered")["success"]
+    assert breaker_states()[host(stubs["gutendex"])] == "closed"
+
+
+def test_stale_result_is_served_at_once_and_refreshed_later(stubs):
+    fresh = cached_remote(search_open_library, query="swr")
+    time.sleep(0.6)  # past the fresh TTL
+    stubs["openlibrary"].set_faults(hang_rate=1, hang_s=3)
+    r, s = timed_call(cached_remote, search_open_library, query="swr")
+    assert r.get("stale") and r["books"] == fresh["books"] and s < FAST_S
+    stubs["openlibrary"].clear_faults()
+    time.sleep(TIMEOUT_S + 0.5)  # the background refresh gave up on the hanging request
+    cached_remote(search_open_library, query="swr")  # stale again: refresh against the healthy host
+    time.sleep(0.3)
+    r = cached_remote(search_open_library, query="swr")
+    assert r["success"] and not r.get("stale")
+
+
+def test_reader_falls_back_to_the_stored_text(stubs):
+    _ensure_book_indexed(1342)
+    stubs["gutendex"].set_faults(error_rate=1)
+    r, s = timed_call(fetch_gutenberg_content, 1342, offset=4000)
+    assert r["success"] and r.get("degraded") and r["content"] and s < FAST_S
+    assert not fetch_gutenberg_content(999999)["success"]
+
+
+def test_latency_budget_cuts_later_requests_short(stubs):
+    stubs["gutendex"].set_faults(latency_ms=700)
+    t0 = time.perf_counter()
+    with latency_budget(1.0):
+        results = [search_gutenberg(f"budget {i}") for i in range(3)]
+    assert results[0]["success"]
+    assert not results[1]["success"] and not results[2]["success"]
+    assert time.perf_counter() - t0 < 1.0 + FAST_S
+    assert "budget" in results[2]["error"]
+    assert breaker_states()[host(stubs["gutendex"])] == "closed"  # cut short ≠ unhealthy
+
+
+def test_refused_connections_trip_the_breaker_within_a_budget(stubs):
+    with socket.socket() as s:  # a port nothing listens on
+        s.bind(("127.0.0.1", 0))
+        url = f"http://127.0.0.1:{s.getsockname()[1]}/"
+    for _ in range(3):
+        with latency_budget(0.5), pytest.raises(Exception):
+            http_get(url)
+    assert breaker_states()[url.split("//")[1].rstrip("/")] == "open"